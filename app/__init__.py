@@ -14,8 +14,13 @@ migrate = Migrate()
 def create_app():
     app = Flask(__name__)
     app.config.from_object('app.config.Config')
-    app.config['SESSION_TYPE'] = 'filesystem'
-    
+    # Sessions only hold the user's name, email and chat id; the conversation is in app.memory
+    if app.config['SESSION_TYPE'] == 'sqlalchemy':
+        app.config['SESSION_SQLALCHEMY'] = db
+    elif app.config['SESSION_TYPE'] == 'redis':
+        import redis
+        app.config['SESSION_REDIS'] = redis.Redis.from_url(app.config['REDIS_URL'])
+
     db.init_app(app)
     bcrypt.init_app(app)
     jwt.init_app(app)
@@ -23,6 +28,18 @@ def create_app():
     Session(app)
     CORS(app)
 
+    from app.memory import memory_store
+    memory_store.init_app(app)
+    from app.activity import activity_buffer
+    activity_buffer.init_app(app)
+    from app.profile import profile_cache
+    profile_cache.init_app(app)
+
+    from app.metrics import instrument_session
+    instrument_session(app)
+    from app.assets import static_assets
+    static_assets.init_app(app)
+
     from app.routes import main as main_blueprint
     app.register_blueprint(main_blueprint)
 
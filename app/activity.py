@@ -0,0 +1,213 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from importlib import import_module
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+
+from app.config import Config
+from app.metrics import inc
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityBuffer:
+    """Collects login and chat activity in memory and writes it in batches.
+
+    A background thread flushes every ``flush_interval`` seconds, or as soon as
+    ``batch_size`` rows are waiting, with one bulk insert per table and one
+    upsert into the ``activity_daily`` totals. Rows are kept for at most
+    ``max_pending`` before new ones are dropped, and whatever is left is
+    flushed when the process exits.
+
+    When a batch fails, its rows are written one at a time so that a bad row
+    cannot hold up the rest. A row that fails ``max_attempts`` flushes is
+    logged and dropped. While the database cannot be reached at all, the rows
+    are kept for the next flush without counting against them.
+    """
+
+    def __init__(self, batch_size=500, flush_interval=2.0, max_pending=10000, max_attempts=3):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.engine = None
+        self._rows = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+
+    def init_app(self, app):
+        from app import db
+        with app.app_context():
+            self.engine = db.engine
+        atexit.register(self.close)
+
+    def record_login(self, user_id):
+        self._add('login_history', {'user_id': user_id, 'timestamp': datetime.utcnow()}, 'login', user_id)
+
+    def record_chat(self, user_id, category=None, latency_ms=None):
+        self._add('activity_event', {'user_id': user_id, 'kind': 'chat', 'category': category,
+                                     'latency_ms': latency_ms, 'created_at': datetime.utcnow()},
+                  'chat', user_id, category, latency_ms)
+
+    def _add(self, table, row, kind, user_id, category=None, latency_ms=None):
+        with self._lock:
+            if len(self._rows) >= self.max_pending or self._closed:
+                inc('activity_events_dropped_total')
+                return
+            self._rows.append((table, row, (user_id or 0, row.get('timestamp', row.get('created_at')).date(),
+                                            kind, category or ''), latency_ms or 0, 0))
+            if self._thread is None:
+                # Started on first use, after gunicorn has forked the worker
+                self._thread = threading.Thread(target=self._run, name='activity-flush', daemon=True)
+                self._thread.start()
+            if len(self._rows) >= self.batch_size:
+                self._wake.set()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing activity events failed')
+
+    def flush(self):
+        """Write the waiting rows and return how many were written."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows or self.engine is None:
+                return 0
+            try:
+                self._write(rows)
+                written, retry = len(rows), []
+            except Exception:
+                logger.warning('Writing %d activity events failed, retrying them one at a time',
+                               len(rows), exc_info=True)
+                written, retry = self._write_each(rows)
+            if retry:
+                # Kept for the next flush, as far as there is room
+                with self._lock:
+                    self._rows = (retry + self._rows)[:self.max_pending]
+            inc('activity_events_flushed_total', written)
+            return written
+
+    def _write(self, rows):
+        from app.models import ActivityDaily, ActivityEvent, LoginHistory
+        tables = {'login_history': LoginHistory.__table__, 'activity_event': ActivityEvent.__table__}
+        by_table = defaultdict(list)
+        totals = defaultdict(lambda: [0, 0])
+        for table, row, key, latency_ms, _ in rows:
+            by_table[table].append(row)
+            totals[key][0] += 1
+            totals[key][1] += latency_ms
+        with self.engine.begin() as conn:
+            for table, table_rows in by_table.items():
+                # A list of parameter sets is sent as a single executemany
+                conn.execute(tables[table].insert(), table_rows)
+            _add_daily_totals(conn, ActivityDaily.__table__, totals)
+
+    def _write_each(self, rows):
+        """Write ``rows`` one per transaction; return how many were written and the rows to retry."""
+        written, retry = 0, []
+        for i, entry in enumerate(rows):
+            try:
+                self._write([entry])
+            except Exception as exc:
+                if isinstance(exc, OperationalError) and not self._reachable():
+                    # The database is down rather than the row at fault; keep the rest as they are
+                    return written, retry + rows[i:]
+                table, row, key, latency_ms, failures = entry
+                if failures + 1 >= self.max_attempts:
+                    logger.error('Dropping activity event after %d failed attempts: %s %r: %r',
+                                 failures + 1, table, row, exc)
+                    inc('activity_events_dropped_total')
+                else:
+                    retry.append((table, row, key, latency_ms, failures + 1))
+                continue
+            written += 1
+        return written, retry
+
+    def _reachable(self):
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(select(1))
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self.flush()
+        if self._rows:
+            logger.error('%d activity events could not be written before exit', len(self._rows))
+
+
+def _add_daily_totals(conn, table, totals):
+    rows = [{'user_id': user_id, 'day': day, 'kind': kind, 'category': category,
+             'count': count, 'latency_ms_sum': latency_ms}
+            for (user_id, day, kind, category), (count, latency_ms) in totals.items()]
+    if conn.dialect.name in ('sqlite', 'postgresql'):
+        # Both dialects support INSERT ... ON CONFLICT DO UPDATE
+        insert = import_module(f'sqlalchemy.dialects.{conn.dialect.name}').insert(table)
+        conn.execute(insert.on_conflict_do_update(
+            index_elements=['user_id', 'day', 'kind', 'category'],
+            set_={'count': table.c.count + insert.excluded.count,
+                  'latency_ms_sum': table.c.latency_ms_sum + insert.excluded.latency_ms_sum}), rows)
+        return
+    for row in rows:
+        key = ((table.c.user_id == row['user_id']) & (table.c.day == row['day']) &
+               (table.c.kind == row['kind']) & (table.c.category == row['category']))
+        updated = conn.execute(table.update().where(key).values(
+            count=table.c.count + row['count'],
+            latency_ms_sum=table.c.latency_ms_sum + row['latency_ms_sum'])).rowcount
+        if not updated:
+            conn.execute(table.insert().values(**row))
+
+
+def activity_summary(user_id, days=30):
+    """Daily login and chat counts for one user from the ``activity_daily`` totals."""
+    from app.models import ActivityDaily
+    table = ActivityDaily.__table__
+    since = date.today() - timedelta(days=days - 1)
+    query = (select(table.c.day, table.c.kind, table.c.category,
+                    func.sum(table.c.count), func.sum(table.c.latency_ms_sum))
+             .where(table.c.user_id == user_id, table.c.day >= since)
+             .group_by(table.c.day, table.c.kind, table.c.category)
+             .order_by(table.c.day))
+    with activity_buffer.engine.connect() as conn:
+        rows = conn.execute(query).all()
+
+    by_day = defaultdict(lambda: {'logins': 0, 'chats': 0})
+    categories = defaultdict(int)
+    chats = chat_latency_ms = 0
+    for day, kind, category, count, latency_ms in rows:
+        if kind == 'login':
+            by_day[day.isoformat()]['logins'] += count
+        else:
+            by_day[day.isoformat()]['chats'] += count
+            categories[category or 'unknown'] += count
+            chats += count
+            chat_latency_ms += latency_ms
+    return {
+        'days': [{'day': day, **counts} for day, counts in sorted(by_day.items())],
+        'logins': sum(counts['logins'] for counts in by_day.values()),
+        'chats': chats,
+        'chat_categories': dict(categories),
+        'avg_chat_latency_ms': round(chat_latency_ms / chats) if chats else None,
+    }
+
+
+activity_buffer = ActivityBuffer(batch_size=Config.ACTIVITY_BATCH_SIZE,
+                                 flush_interval=Config.ACTIVITY_FLUSH_INTERVAL,
+                                 max_pending=Config.ACTIVITY_MAX_PENDING,
+                                 max_attempts=Config.ACTIVITY_MAX_ATTEMPTS)
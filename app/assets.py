@@ -0,0 +1,471 @@
+"""Fingerprinted, precompressed static files with far-future caching.
+
+    python -m app.assets build      # writes app/static/dist/ and its manifest.json
+    python -m app.assets report     # bytes a cold load of each page transfers, without and with the build
+
+The build reads the templates for the static files they reference through
+``url_for('static', ...)`` and processes only those, plus the fonts and images
+their stylesheets point to. Runs of local ``<link>``/``<script>`` tags wrapped
+in ``{% call bundle('name.js') %}`` are concatenated into one file, in order.
+Stylesheets and scripts are minified (with ``rcssmin``/``rjsmin`` when
+installed), JPEGs are recompressed and scaled down, and every output is
+written as ``name.<hash>.ext`` next to ``.gz`` and, with ``brotli`` installed,
+``.br`` variants. ``manifest.json`` maps the original paths and bundle names
+to those files.
+
+At runtime ``static_assets`` rewrites ``url_for('static', ...)`` to the hashed
+files, renders each bundle block as a single tag and serves ``dist/`` with the
+best precompressed variant the browser accepts and an immutable one-year
+``Cache-Control``. Without a manifest (or with ``STATIC_BUILD=0``) the
+templates render the source files as before.
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import urljoin, urlsplit
+
+from flask import current_app, request, send_from_directory, url_for
+from markupsafe import Markup
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), 'static')
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 10
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Formats that are already compressed gain nothing from gzip or brotli
+COMPRESSIBLE = {'.css', '.js', '.json', '.map', '.svg', '.ttf', '.otf', '.eot', '.ico', '.txt', '.xml'}
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+STATIC_REF_RE = re.compile(r"""url_for\(\s*['"]static['"]\s*,\s*filename\s*=\s*['"]([^'"]+)['"]\s*\)""")
+BUNDLE_RE = re.compile(r"""\{%-?\s*call\s+bundle\(\s*['"]([^'"]+)['"]\s*\)\s*-?%\}(.*?)\{%-?\s*endcall\s*-?%\}""", re.S)
+LOCAL_TAG_RE = re.compile(r"""<(?:link|script)\b[^>]*url_for\(\s*['"]static['"][^>]*>(?:\s*</script>)?""")
+HTML_COMMENT_RE = re.compile(r'<!--.*?-->', re.S)
+CSS_URL_RE = re.compile(r"""url\(\s*(['"]?)([^'")]+?)\1\s*\)""")
+CSS_TOKEN_RE = re.compile(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|/\*(!)?.*?\*/""", re.S)
+CHARSET_RE = re.compile(r"""@charset\s+["'][^"']*["']\s*;""", re.I)
+SOURCE_MAP_RE = re.compile(r'^[ \t]*(?://[#@] sourceMappingURL=[^\n]*|/\*[#@] sourceMappingURL=.*?\*/)[ \t]*$', re.M)
+FONT_FACE_RE = re.compile(r'@font-face\s*\{[^}]*\}', re.I)
+PAGE_REF_RE = re.compile(r"""(?:src|href)=["']([^"']+)["']""")
+
+
+def _local(reference):
+    return not (reference.startswith(('data:', '#', '/', 'about:')) or urlsplit(reference).scheme)
+
+
+def resolve(path, static_dir=STATIC_DIR):
+    """The static file ``path`` names, matched case-insensitively when there is no exact match.
+
+    The templates were written against a case-insensitive file system
+    (``assets/...`` for ``Assets/...``), which Linux does not serve.
+    """
+    path = posixpath.normpath(path)
+    if path.startswith('..') or not _local(path):
+        return None
+    if os.path.isfile(os.path.join(static_dir, path)):
+        return path
+    parts, current = [], static_dir
+    for part in path.split('/'):
+        try:
+            names = os.listdir(current)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        match = next((name for name in names if name.lower() == part.lower()), None)
+        if match is None:
+            return None
+        parts.append(match)
+        current = os.path.join(current, match)
+    return '/'.join(parts) if os.path.isfile(current) else None
+
+
+def scan_templates(template_dir=TEMPLATE_DIR):
+    """Static paths referenced by the templates outside bundle blocks, and the members of each block."""
+    references, bundles = set(), {}
+    for name in sorted(os.listdir(template_dir)):
+        if not name.endswith('.html'):
+            continue
+        with open(os.path.join(template_dir, name), encoding='utf-8') as f:
+            text = f.read()
+        # Files inside bundle blocks are only served as part of their bundle
+        references.update(path for path in STATIC_REF_RE.findall(BUNDLE_RE.sub('', text)) if _local(path))
+        for bundle, body in BUNDLE_RE.findall(text):
+            leftover = LOCAL_TAG_RE.sub('', HTML_COMMENT_RE.sub('', body)).strip()
+            if leftover:
+                raise ValueError(f"Bundle {bundle!r} in {name} may only wrap local <link>/<script> tags, "
+                                 f"found {leftover[:60]!r}")
+            members = STATIC_REF_RE.findall(body)
+            kind = posixpath.splitext(bundle)[1]
+            if kind not in ('.css', '.js') or any(posixpath.splitext(path)[1] != kind for path in members):
+                raise ValueError(f"Bundle {bundle!r} in {name} mixes file types")
+            if bundles.setdefault(bundle, members) != members:
+                raise ValueError(f"Bundle {bundle!r} has different members in {name} than elsewhere")
+    return sorted(references), bundles
+
+
+def _split_css(text):
+    # (is_code, piece) for the text between strings and comments; /*! license */ comments are kept
+    position = 0
+    for match in CSS_TOKEN_RE.finditer(text):
+        yield True, text[position:match.start()]
+        if match.group(1) or match.group(2):
+            yield False, match.group(0)
+        position = match.end()
+    yield True, text[position:]
+
+
+def minify_css(text):
+    try:
+        import rcssmin
+        return rcssmin.cssmin(text, keep_bang_comments=True)
+    except ImportError:
+        pass
+    pieces = []
+    for code, piece in _split_css(text):
+        if code:
+            piece = re.sub(r' ?([{};,>]) ?', r'\1', re.sub(r'\s+', ' ', piece))
+        pieces.append(piece)
+    return ''.join(pieces).strip()
+
+
+def minify_js(text, path):
+    if path.endswith('.min.js'):
+        return text
+    try:
+        import rjsmin
+    except ImportError:
+        # Without a real minifier the script is only compressed; regexes are not safe on JavaScript
+        return text
+    return rjsmin.jsmin(text, keep_bang_comments=True)
+
+
+class Builder:
+    """Writes the fingerprinted copies of static files into ``static_dir/dist``."""
+
+    def __init__(self, static_dir=STATIC_DIR, jpeg_quality=80, max_image_size=1920):
+        self.static_dir = static_dir
+        self.jpeg_quality = jpeg_quality
+        self.max_image_size = max_image_size
+        self.files = {}  # source path -> dist path
+        self.encodings = {}  # dist path -> precompressed variants
+        self.warnings = []
+        self._building = set()
+        try:
+            import brotli
+            self._brotli = brotli
+        except ImportError:
+            self._brotli = None
+            self.warnings.append("brotli is not installed, only .gz variants are written ('pip install brotli')")
+
+    def _read(self, path):
+        with open(os.path.join(self.static_dir, path), 'rb') as f:
+            return f.read()
+
+    def write(self, path, data):
+        """Store ``data`` as ``dist/<path without extension>.<hash><extension>`` and its compressed variants."""
+        root, extension = posixpath.splitext(path)
+        out = posixpath.join(DIST, f'{root}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{extension}')
+        full = os.path.join(self.static_dir, out)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        with open(full, 'wb') as f:
+            f.write(data)
+        variants = []
+        if extension.lower() in COMPRESSIBLE:
+            compressed = {'gzip': gzip.compress(data, 9, mtime=0)}
+            if self._brotli is not None:
+                compressed['br'] = self._brotli.compress(data, quality=11)
+            for encoding, suffix in ENCODINGS:
+                if encoding in compressed and len(compressed[encoding]) < len(data):
+                    with open(full + suffix, 'wb') as f:
+                        f.write(compressed[encoding])
+                    variants.append(encoding)
+        self.encodings[out] = variants
+        return out
+
+    def asset(self, path):
+        """Dist path of the source file ``path`` (already resolved), building it on first use."""
+        if path in self.files:
+            return self.files[path]
+        if path in self._building:
+            raise ValueError(f'{path} imports itself')
+        self._building.add(path)
+        extension = posixpath.splitext(path)[1].lower()
+        if extension == '.css':
+            text = self.css(path, posixpath.dirname(posixpath.join(DIST, path)))
+            data = minify_css(text).encode('utf-8')
+        elif extension == '.js':
+            data = minify_js(self._js(path), path).encode('utf-8')
+        elif extension in ('.jpg', '.jpeg'):
+            data = self.jpeg(self._read(path))
+        else:
+            data = self._read(path)
+        self.files[path] = self.write(path, data)
+        return self.files[path]
+
+    def css(self, path, out_dir):
+        """The stylesheet ``path`` with its url()s pointing at the built copies, as seen from ``out_dir``."""
+        text = SOURCE_MAP_RE.sub('', self._read(path).decode('utf-8-sig'))
+        base = posixpath.dirname(path)
+
+        def rewrite(match):
+            quote, reference = match.groups()
+            if not _local(reference):
+                return match.group(0)
+            parts = urlsplit(reference)
+            source = resolve(posixpath.join(base, parts.path), self.static_dir)
+            if source is None:
+                self.warnings.append(f'{path}: {parts.path} not found')
+                # Still points where it did before, so it fails the same way
+                target = posixpath.normpath(posixpath.join(base, parts.path))
+            else:
+                target = self.asset(source)
+            fragment = f'#{parts.fragment}' if parts.fragment else ''
+            return f'url({quote}{posixpath.relpath(target, out_dir)}{fragment}{quote})'
+
+        return CSS_URL_RE.sub(rewrite, text)
+
+    def _js(self, path):
+        return SOURCE_MAP_RE.sub('', self._read(path).decode('utf-8-sig'))
+
+    def bundle(self, name, members):
+        if name.endswith('.css'):
+            out_dir = posixpath.join(DIST, 'bundles')
+            sheets = [self.css(path, out_dir) for path in members]
+            charset = next((match.group(0) for sheet in sheets for match in [CHARSET_RE.search(sheet)] if match), '')
+            # @charset is only allowed at the very start of a stylesheet
+            text = charset + '\n'.join(minify_css(CHARSET_RE.sub('', sheet)) for sheet in sheets)
+        else:
+            # A statement separator between files that leave their last one unterminated
+            text = '\n;\n'.join(minify_js(self._js(path), path) for path in members)
+        return self.write(posixpath.join('bundles', name), text.encode('utf-8'))
+
+    def jpeg(self, data):
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:
+            self.warnings.append("Pillow is not installed, JPEGs are copied as they are ('pip install pillow')")
+            return data
+        with Image.open(io.BytesIO(data)) as image:
+            icc_profile = image.info.get('icc_profile')
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((self.max_image_size, self.max_image_size))
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            out = io.BytesIO()
+            image.save(out, 'JPEG', quality=self.jpeg_quality, optimize=True, progressive=True,
+                       icc_profile=icc_profile)
+        # Already well-compressed files are kept as they are
+        return out.getvalue() if out.tell() < len(data) else data
+
+
+def build(static_dir=STATIC_DIR, template_dir=TEMPLATE_DIR, jpeg_quality=80, max_image_size=1920):
+    """Build everything the templates reference and write the manifest; returns (manifest, warnings)."""
+    references, bundles = scan_templates(template_dir)
+    builder = Builder(static_dir, jpeg_quality, max_image_size)
+    manifest = {'files': {}, 'bundles': {}, 'encodings': {}}
+
+    def source(path):
+        resolved = resolve(path, static_dir)
+        if resolved is None:
+            builder.warnings.append(f'{path} is referenced by a template but does not exist')
+        elif resolved != posixpath.normpath(path):
+            builder.warnings.append(f'{path} only exists as {resolved}')
+        return resolved
+
+    for path in references:
+        resolved = source(path)
+        if resolved is not None:
+            manifest['files'][path] = builder.asset(resolved)
+    for name, members in sorted(bundles.items()):
+        resolved = [source(path) for path in members]
+        if None in resolved:
+            raise ValueError(f"Bundle {name!r} has a member that does not exist")
+        manifest['bundles'][name] = builder.bundle(name, resolved)
+    manifest['encodings'] = {path: variants for path, variants in sorted(builder.encodings.items()) if variants}
+
+    path = os.path.join(static_dir, DIST, MANIFEST)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written next to the manifest and renamed over it, so a reader never sees half of it
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+    return manifest, list(dict.fromkeys(builder.warnings))
+
+
+def load_manifest(static_dir=STATIC_DIR):
+    try:
+        with open(os.path.join(static_dir, DIST, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+class StaticAssets:
+    """Serves the build from ``app.assets`` when there is one; see the module docstring."""
+
+    def __init__(self):
+        self.manifest = None
+
+    def init_app(self, app):
+        self.manifest = load_manifest(app.static_folder) if app.config['STATIC_BUILD'] else None
+        if self.manifest is not None:
+            logger.info('Serving %d fingerprinted static files and %d bundles',
+                        len(self.manifest['files']), len(self.manifest['bundles']))
+        app.jinja_env.globals['bundle'] = self.bundle
+        app.url_defaults(self._hashed_filename)
+        app.view_functions['static'] = self._serve
+
+    def bundle(self, name, caller):
+        """``{% call bundle('name.js') %}<script ...>...{% endcall %}``: one tag for the built bundle, or the tags inside."""
+        built = self.manifest['bundles'].get(name) if self.manifest else None
+        if built is None:
+            return caller()
+        url = url_for('static', filename=built)
+        if name.endswith('.css'):
+            return Markup('<link href="{}" rel="stylesheet" />').format(url)
+        return Markup('<script src="{}"></script>').format(url)
+
+    def _hashed_filename(self, endpoint, values):
+        if endpoint == 'static' and self.manifest:
+            values['filename'] = self.manifest['files'].get(values.get('filename'), values.get('filename'))
+
+    def _serve(self, filename):
+        if not self.manifest or not filename.startswith(DIST + '/'):
+            return current_app.send_static_file(filename)
+        variants = self.manifest['encodings'].get(filename, ())
+        for encoding, suffix in ENCODINGS:
+            if encoding in variants and request.accept_encodings[encoding]:
+                response = send_from_directory(current_app.static_folder, filename + suffix,
+                                               mimetype=mimetypes.guess_type(filename)[0])
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(current_app.static_folder, filename)
+        if variants:
+            response.vary.add('Accept-Encoding')
+        # The name changes whenever the content does, so browsers never need to revalidate
+        response.headers['Cache-Control'] = IMMUTABLE
+        return response
+
+
+static_assets = StaticAssets()
+
+
+PAGES = ('/', '/login', '/register', '/main', '/chat', '/getting-started', '/user-profile',
+         '/user-activities', '/user-profile-settings', '/user-account-settings')
+
+
+def _css_references(text):
+    # One font file per @font-face (the first woff2, else the first listed), every other url()
+    faces = FONT_FACE_RE.findall(text)
+    references = CSS_URL_RE.findall(FONT_FACE_RE.sub('', text))
+    for face in faces:
+        urls = CSS_URL_RE.findall(face)
+        if urls:
+            references.append(next((url for url in urls if '.woff2' in url[1]), urls[0]))
+    return [reference for _, reference in references if not reference.startswith('data:')]
+
+
+def page_weight(client, page, accept_encoding='br, gzip'):
+    """Requests and bytes on the wire for a cold load of ``page``: the HTML, the static files it
+    references and the fonts and images their stylesheets mention (all of them, as if all were used).
+
+    A file that is missing only because of the case of its path is counted as
+    the file ``resolve`` finds, as a case-insensitive file system would serve it.
+    """
+    response = client.get(page)
+    requests, transferred, missing, miscased = 1, len(response.get_data()), 0, 0
+    static_url = current_app.static_url_path + '/'
+    queue = [url for url in PAGE_REF_RE.findall(response.get_data(as_text=True)) if url.startswith(static_url)]
+    seen = set()
+    while queue:
+        url = urlsplit(queue.pop(0)).path
+        if url in seen:
+            continue
+        seen.add(url)
+        response = client.get(url, headers={'Accept-Encoding': accept_encoding})
+        requests += 1
+        if response.status_code == 404:
+            resolved = resolve(url[len(static_url):], current_app.static_folder)
+            if resolved is not None:
+                miscased += 1
+                response = client.get(static_url + resolved, headers={'Accept-Encoding': accept_encoding})
+        if response.status_code != 200:
+            missing += 1
+            continue
+        body = response.get_data()
+        transferred += len(body)
+        if url.endswith('.css'):
+            if response.headers.get('Content-Encoding') == 'gzip':
+                body = gzip.decompress(body)
+            elif response.headers.get('Content-Encoding') == 'br':
+                import brotli
+                body = brotli.decompress(body)
+            queue.extend(urljoin(url, reference) for reference in _css_references(body.decode('utf-8', 'replace')))
+        response.close()
+    return {'requests': requests, 'bytes': transferred, 'missing': missing, 'miscased': miscased}
+
+
+def report(pages=PAGES):
+    """Cold-load weight of each page served from the source files and from the build."""
+    from app import create_app
+    # The instance create_app set up, not this module's copy when run with -m
+    from app.assets import static_assets
+    app = create_app()
+    manifest = static_assets.manifest
+    if manifest is None:
+        raise SystemExit('No build to compare against; run `python -m app.assets build` first')
+    results = {}
+    with app.test_request_context():
+        for label, served in (('before', None), ('after', manifest)):
+            static_assets.manifest = served
+            with app.test_client() as client:
+                for page in pages:
+                    results.setdefault(page, {})[label] = page_weight(client, page)
+    static_assets.manifest = manifest
+    return results
+
+
+def print_report(results):
+    print(f"{'page':24} {'requests':>13} {'KB before':>10} {'KB after':>9} {'saved':>6}  missing  miscased")
+    totals = [0, 0]
+    for page, result in results.items():
+        before, after = result['before'], result['after']
+        totals[0] += before['bytes']
+        totals[1] += after['bytes']
+        print(f"{page:24} {before['requests']:>5} -> {after['requests']:<5} {before['bytes'] / 1024:10.1f} "
+              f"{after['bytes'] / 1024:9.1f} {1 - after['bytes'] / before['bytes']:6.0%}  "
+              f"{before['missing']:>2} -> {after['missing']:<2}  {before['miscased']:>2} -> {after['miscased']}")
+    print(f"{'total':24} {'':13} {totals[0] / 1024:10.1f} {totals[1] / 1024:9.1f} {1 - totals[1] / totals[0]:6.0%}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or measure the fingerprinted static files')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    build_parser = subcommands.add_parser('build', help='write app/static/dist and its manifest')
+    build_parser.add_argument('--jpeg-quality', type=int, default=80)
+    build_parser.add_argument('--max-image-size', type=int, default=1920, help='longest side of a JPEG in pixels')
+    report_parser = subcommands.add_parser('report', help='bytes per cold page load without and with the build')
+    report_parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        manifest, warnings = build(jpeg_quality=args.jpeg_quality, max_image_size=args.max_image_size)
+        for warning in warnings:
+            print(f'warning: {warning}')
+        print(f"{len(manifest['files'])} files and {len(manifest['bundles'])} bundles "
+              f"written to {os.path.join(STATIC_DIR, DIST)}")
+    else:
+        results = report()
+        print_report(results)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
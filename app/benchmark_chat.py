@@ -0,0 +1,220 @@
+"""Replay recorded questions through the chat pipeline, offline, against a fake LLM.
+
+    python -m app.benchmark_chat --json before.json
+    python -m app.benchmark_chat --compare before.json --fail-over 0.2
+
+Questions go through ``get_user_query_response`` with the real embedding model
+and FAISS index; only the chat model is replaced by ``FakeChatModel``, so the
+numbers measure our own pipeline and are repeatable from commit to commit.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from app import llm as llm_module, metrics
+from app.config import Config
+from app.fake_llm import FakeChatModel
+from app.history import SQLHistory
+from app.indexes import version_path
+from app.memory import memory_store
+
+QUESTIONS_FILE = 'data/benchmark_questions.jsonl'
+PERCENTILES = (50, 95, 99)
+
+
+def load_questions(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def summarize(seconds):
+    values = np.asarray(seconds) * 1000
+    summary = {f'p{p}': round(float(np.percentile(values, p)), 3) for p in PERCENTILES}
+    summary.update(mean=round(float(values.mean()), 3), count=len(values))
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def index_bytes(db_path=llm_module.DB_FAISS_PATH):
+    return sum(entry.stat().st_size for entry in os.scandir(version_path(db_path)) if entry.is_file())
+
+
+def is_hit(gold, docs):
+    gold = [snippet.lower() for snippet in gold]
+    return any(snippet in doc.page_content.lower() for doc in docs for snippet in gold)
+
+
+def run(questions, repeat=1, llm_latency=0.0, history_dir=None):
+    from sqlalchemy import create_engine
+    # Chat history goes to a scratch SQLite database, as it would to the app's
+    history = SQLHistory(create_engine(f"sqlite:///{os.path.join(history_dir, 'history.db')}"))
+    history.create_tables()
+    memory_store.history = history
+
+    fake = FakeChatModel(latency=llm_latency)
+    service = llm_module.LLMService(llm=fake)
+    service.load()
+    # get_user_query_response picks this up instead of building a Groq-backed service
+    llm_module._service = service
+    rss_after_load = peak_rss_mb()
+
+    retrieved = []
+    retrieve = service.indexes.retrieve
+
+    def recording_retrieve(question, vector, expansion=''):
+        docs = retrieve(question, vector, expansion=expansion)
+        retrieved.extend(docs)
+        return docs
+
+    service.indexes.retrieve = recording_retrieve
+
+    totals, calls, prompt_tokens, stages = [], [], [], defaultdict(list)
+    labeled = hits = 0
+    for round_ in range(repeat):
+        for i, item in enumerate(questions):
+            # Questions sharing a "session" are asked in order as one conversation
+            session_id = f"benchmark-{round_}-{item.get('session', i)}"
+            retrieved.clear()
+            before, tokens_before = fake.calls, fake.prompt_tokens
+            trace = metrics.begin('benchmark')
+            start = time.perf_counter()
+            llm_module.get_user_query_response(item['question'], session_id)
+            totals.append(time.perf_counter() - start)
+            metrics.end()
+            for stage, seconds in trace['stages'].items():
+                stages[stage].append(seconds)
+            calls.append(fake.calls - before)
+            prompt_tokens.append(fake.prompt_tokens - tokens_before)
+            if item.get('gold'):
+                labeled += 1
+                hits += is_hit(item['gold'], retrieved)
+
+    return {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {
+            'qa_strategy': Config.QA_STRATEGY,
+            'index_type': Config.FAISS_INDEX_TYPE,
+            'retrieval_k': Config.RETRIEVAL_K,
+            'retrieval_fetch_k': Config.RETRIEVAL_FETCH_K,
+            'hybrid_search': Config.HYBRID_SEARCH,
+            'speculative_retrieval': Config.SPECULATIVE_RETRIEVAL,
+            'router': Config.ROUTER_ENABLED,
+            'context_max_tokens': Config.CONTEXT_MAX_TOKENS,
+            'semantic_cache': Config.SEMANTIC_CACHE_ENABLED,
+            'embedding_backend': Config.EMBEDDING_BACKEND,
+            'embedding_cache': Config.EMBEDDING_CACHE_SIZE,
+            'llm_latency': llm_latency,
+        },
+        'questions': len(questions),
+        'repeat': repeat,
+        'load_ms': round(sum(service.timings.values()) * 1000, 1),
+        'total_ms': summarize(totals),
+        'stages_ms': {stage: summarize(seconds) for stage, seconds in sorted(stages.items())},
+        'llm_calls': {'mean': round(float(np.mean(calls)), 3), 'max': int(max(calls)), 'total': int(sum(calls))},
+        'prompt_tokens': {'mean': round(float(np.mean(prompt_tokens)), 1), 'total': int(sum(prompt_tokens))},
+        'index_mb': round(index_bytes() / 1e6, 2),
+        'retrieval_hit_rate': round(hits / labeled, 4) if labeled else None,
+        'memory_mb': {'peak_after_load': rss_after_load, 'peak': peak_rss_mb()},
+    }
+
+
+def report(result):
+    print(f"{result['questions']} questions x {result['repeat']}, commit {result['commit']}, "
+          f"strategy={result['config']['qa_strategy']} index={result['config']['index_type']}")
+    print(f"{'stage':18} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'count':>6}")
+    for stage, summary in [('total', result['total_ms'])] + list(result['stages_ms'].items()):
+        print(f"{stage:18} {summary['p50']:9.2f} {summary['p95']:9.2f} {summary['p99']:9.2f} {summary['count']:6}")
+    print()
+    print(f"llm calls/question: {result['llm_calls']['mean']:.2f} (max {result['llm_calls']['max']})")
+    print(f"prompt tokens/question: {result['prompt_tokens']['mean']:.0f}")
+    print(f"index size:         {result['index_mb']:.1f} MB")
+    if result['retrieval_hit_rate'] is not None:
+        print(f"retrieval hit rate: {result['retrieval_hit_rate']:.0%}")
+    print(f"peak RSS:           {result['memory_mb']['peak']:.0f} MB "
+          f"({result['memory_mb']['peak_after_load']:.0f} MB after loading)")
+
+
+def compare(old, new, fail_over=None):
+    """Print old vs new for the headline numbers; return the gated ones that regressed beyond ``fail_over``."""
+    # (name, old, new, lower is better, gated); per-stage and tail timings are too noisy to gate on
+    rows = [
+        ('total p50 ms', old['total_ms']['p50'], new['total_ms']['p50'], True, False),
+        ('total p95 ms', old['total_ms']['p95'], new['total_ms']['p95'], True, True),
+        ('total p99 ms', old['total_ms']['p99'], new['total_ms']['p99'], True, False),
+        ('llm calls/question', old['llm_calls']['mean'], new['llm_calls']['mean'], True, True),
+        ('prompt tokens/question', old.get('prompt_tokens', {}).get('mean'), new['prompt_tokens']['mean'], True, True),
+        ('index MB', old.get('index_mb'), new['index_mb'], True, False),
+        ('retrieval hit rate', old['retrieval_hit_rate'], new['retrieval_hit_rate'], False, True),
+        ('peak RSS MB', old['memory_mb']['peak'], new['memory_mb']['peak'], True, True),
+    ]
+    for stage in sorted(set(old['stages_ms']) & set(new['stages_ms'])):
+        rows.append((f'{stage} p95 ms', old['stages_ms'][stage]['p95'], new['stages_ms'][stage]['p95'], True, False))
+
+    regressions = []
+    print(f"\n{'metric':22} {old['commit'] or 'old':>10} {new['commit'] or 'new':>10} {'change':>8}")
+    for name, before, after, lower_is_better, gated in rows:
+        if before is None or after is None:
+            continue
+        change = (after - before) / before if before else 0.0
+        print(f"{name:22} {before:10.3f} {after:10.3f} {change:+8.1%}")
+        if gated and fail_over is not None and (change if lower_is_better else -change) > fail_over:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline latency and retrieval benchmark for the chat pipeline')
+    parser.add_argument('--questions', default=QUESTIONS_FILE, help='JSON lines with "question", "gold" and optional "session"')
+    parser.add_argument('--repeat', type=int, default=3, help='replay the questions this many times')
+    parser.add_argument('--llm-latency', type=float, default=0.0, help='seconds the fake LLM takes per call')
+    parser.add_argument('--cache', action='store_true',
+                        help='keep the semantic and query embedding caches on (off by default so repeats are not cache hits)')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', help='results file from an earlier run to compare against')
+    parser.add_argument('--fail-over', type=float, help='exit non-zero if a headline metric regresses by more than this fraction')
+    args = parser.parse_args()
+
+    # Never reach out to the Hugging Face hub; the embedding model must already be cached
+    os.environ.setdefault('HF_HUB_OFFLINE', '1')
+    Config.METRICS_ENABLED = True
+    # The fake LLM has no rate limit to respect
+    Config.LLM_REQUESTS_PER_MINUTE = 0
+    Config.SEMANTIC_CACHE_ENABLED = args.cache
+    if not args.cache:
+        Config.EMBEDDING_CACHE_SIZE = 0
+
+    with tempfile.TemporaryDirectory() as history_dir:
+        result = run(load_questions(args.questions), repeat=args.repeat, llm_latency=args.llm_latency,
+                     history_dir=history_dir)
+    report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(json.load(f), result, args.fail_over)
+        if regressions:
+            print(f"\nregressed by more than {args.fail_over:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
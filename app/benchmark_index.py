@@ -0,0 +1,89 @@
+import argparse
+import json
+import os
+import time
+
+import faiss
+import numpy as np
+
+from app.config import Config
+from app.indexes import version_path
+from app.ingest import DB_FAISS_PATH
+from app.vectorstore import INDEX_FILE, build_search_index, set_search_params
+
+# Search-time settings to sweep for each index type
+SWEEPS = {
+    'flat': [{}],
+    'ivf': [{'nprobe': n} for n in (1, 4, 8, 16, 32)],
+    'hnsw': [{'ef_search': ef} for ef in (16, 32, 64, 128)],
+    'ivfpq': [{'nprobe': n} for n in (1, 4, 8, 16, 32)],
+}
+
+
+def make_queries(vectors, count, noise, seed=0):
+    # Perturbed copies of stored chunks stand in for real questions, so the
+    # benchmark needs neither the embedding model nor a query log
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), min(count, len(vectors)), replace=False)].copy()
+    queries += rng.normal(scale=noise, size=queries.shape).astype('float32')
+    return np.ascontiguousarray(queries, dtype='float32')
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def benchmark(vectors, queries, k, index_types):
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    results = []
+    for index_type in index_types:
+        start = time.perf_counter()
+        index = build_search_index(vectors, index_type, nlist=Config.FAISS_NLIST, hnsw_m=Config.FAISS_HNSW_M,
+                                   pq_m=Config.FAISS_PQ_M, train_sample=Config.FAISS_TRAIN_SAMPLE)
+        build_seconds = time.perf_counter() - start
+        size = faiss.serialize_index(index).nbytes
+        for params in SWEEPS[index_type]:
+            set_search_params(index, **params)
+            found = np.empty_like(truth)
+            start = time.perf_counter()
+            # One query at a time, the way the chat endpoint searches
+            for i, query in enumerate(queries):
+                _, found[i:i + 1] = index.search(query[None, :], k)
+            latency = (time.perf_counter() - start) / len(queries)
+            results.append({
+                'index': index_type,
+                'params': params,
+                'recall': recall_at_k(found, truth),
+                'latency_ms': latency * 1000,
+                'size_bytes': size,
+                'build_seconds': build_seconds,
+            })
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare approximate FAISS indexes with the exact one')
+    parser.add_argument('--db', default=DB_FAISS_PATH, help='vector store directory (its current version is used)')
+    parser.add_argument('--k', type=int, default=Config.RETRIEVAL_FETCH_K)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--noise', type=float, default=0.02, help='std-dev of the noise added to query vectors')
+    parser.add_argument('--types', nargs='+', default=list(SWEEPS), choices=list(SWEEPS))
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    base = faiss.read_index(os.path.join(version_path(args.db), INDEX_FILE))
+    vectors = base.reconstruct_n(0, base.ntotal)
+    results = benchmark(vectors, make_queries(vectors, args.queries, args.noise), args.k, args.types)
+
+    print(f"{base.ntotal} vectors, d={base.d}, k={args.k}")
+    print(f"{'index':8} {'params':18} {'recall@k':>9} {'ms/query':>9} {'size':>10}")
+    for row in results:
+        params = ' '.join(f"{key}={value}" for key, value in row['params'].items())
+        print(f"{row['index']:8} {params:18} {row['recall']:9.3f} {row['latency_ms']:9.3f} {row['size_bytes'] / 1024:8.0f}KB")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,103 @@
+"""Tail latency of LLM calls through app.gateway, against a fake model with injected slowness and errors.
+
+    python -m app.benchmark_llm
+    python -m app.benchmark_llm --slow-rate 0.1 --slow-latency 2 --error-rate 0.05 --json llm.json
+
+Runs the same seeded stream of calls directly against ``FakeChatModel``,
+through the gateway without hedging, and through it with hedging; with
+``--outage`` also through a gateway whose primary always fails, with a fake
+fallback.
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app.config import Config
+from app.fake_llm import FakeChatModel
+from app.gateway import GatewayChatModel, LLMGateway
+
+PERCENTILES = (50, 90, 95, 99, 99.9)
+PROMPT = 'What should I eat for breakfast with diabetes?'
+
+
+def measure(model, calls, concurrency):
+    def call(_):
+        start = time.perf_counter()
+        try:
+            model.invoke(PROMPT)
+            return time.perf_counter() - start, False
+        except Exception:
+            return time.perf_counter() - start, True
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, range(calls)))
+    latencies = np.asarray([seconds for seconds, _ in results]) * 1000
+    summary = {f'p{p:g}': round(float(np.percentile(latencies, p)), 1) for p in PERCENTILES}
+    summary.update(max=round(float(latencies.max()), 1), errors=sum(failed for _, failed in results))
+    return summary
+
+
+def run(args):
+    def fake(**overrides):
+        options = dict(latency=args.latency, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+                       error_rate=args.error_rate, seed=args.seed)
+        options.update(overrides)
+        return FakeChatModel(**options)
+
+    def gateway(primary, hedge_percentile, fallback=None):
+        return LLMGateway(primary, fallback, timeout=args.timeout, deadline=args.deadline, retries=args.retries,
+                          hedge_percentile=hedge_percentile, hedge_budget=args.hedge_budget,
+                          breaker_failures=Config.LLM_BREAKER_FAILURES, breaker_cooldown=Config.LLM_BREAKER_COOLDOWN)
+
+    scenarios = [('direct', None), ('gateway', 0), ('hedged', args.hedge_percentile)]
+    if args.outage:
+        scenarios.append(('outage', args.hedge_percentile))
+    results = {}
+    for name, hedge_percentile in scenarios:
+        primary = fake(error_rate=1.0) if name == 'outage' else fake()
+        fallback = fake(seed=args.seed + 1) if name == 'outage' else None
+        model = primary if hedge_percentile is None else GatewayChatModel(
+            gateway=gateway(primary, hedge_percentile, fallback))
+        summary = measure(model, args.calls, args.concurrency)
+        upstream_calls = primary.calls + (fallback.calls if fallback is not None else 0)
+        summary['upstream_calls_per_call'] = round(upstream_calls / args.calls, 3)
+        if hedge_percentile is not None:
+            summary['hedges'] = model.gateway.hedges
+        results[name] = summary
+    return {'config': {key: value for key, value in vars(args).items() if key != 'json'}, 'results': results}
+
+
+def report(result):
+    columns = [f'p{p:g}' for p in PERCENTILES] + ['max']
+    print(f"{'':8} " + ' '.join(f"{column + ' ms':>9}" for column in columns) + f" {'errors':>7} {'calls/call':>10}")
+    for name, summary in result['results'].items():
+        print(f"{name:8} " + ' '.join(f"{summary[column]:9.1f}" for column in columns)
+              + f" {summary['errors']:7} {summary['upstream_calls_per_call']:10.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tail latency of LLM calls with and without hedging')
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds a normal call takes')
+    parser.add_argument('--slow-rate', type=float, default=0.05, help='fraction of calls that are slow')
+    parser.add_argument('--slow-latency', type=float, default=1.0, help='seconds a slow call takes')
+    parser.add_argument('--error-rate', type=float, default=0.01, help='fraction of calls that fail')
+    parser.add_argument('--timeout', type=float, default=Config.LLM_TIMEOUT)
+    parser.add_argument('--deadline', type=float, default=Config.LLM_DEADLINE)
+    parser.add_argument('--retries', type=int, default=Config.LLM_RETRIES)
+    parser.add_argument('--hedge-percentile', type=float, default=Config.LLM_HEDGE_PERCENTILE or 95)
+    parser.add_argument('--hedge-budget', type=float, default=Config.LLM_HEDGE_BUDGET)
+    parser.add_argument('--outage', action='store_true', help='also run with a failing primary and a fake fallback')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    result = run(args)
+    report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
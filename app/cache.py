@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SemanticCache:
+    """Answer cache keyed on question meaning rather than exact text.
+
+    Questions are embedded and compared by cosine similarity against the
+    questions answered so far; an answer is reused when the best match is
+    above ``threshold``. Entries are evicted least-recently-used once
+    ``max_size`` is reached and expire after ``ttl`` seconds.
+    """
+
+    def __init__(self, embeddings, threshold=0.92, max_size=512, ttl=3600):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.version = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # slot -> (question, answer, created)
+        self._free = list(range(max_size))
+        self._vectors = None
+
+    def embed(self, question):
+        vector = np.asarray(self.embeddings.embed_query(question), dtype='float32')
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def check_version(self, version):
+        # Drop everything when the underlying corpus has changed
+        with self._lock:
+            if version != self.version:
+                self._clear()
+                self.version = version
+
+    def get(self, question, vector=None):
+        if vector is None:
+            vector = self.embed(question)
+        with self._lock:
+            self._expire()
+            slot = self._match(vector)
+            if slot is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(slot)
+            self.hits += 1
+            return self._entries[slot][1]
+
+    def put(self, question, answer, vector=None):
+        if self.max_size <= 0:
+            return
+        if vector is None:
+            vector = self.embed(question)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_size, vector.shape[0]), dtype='float32')
+            # A question that get() would match replaces that entry rather than
+            # taking a second slot
+            slot = self._match(vector)
+            if slot is not None:
+                del self._entries[slot]
+                self._free.append(slot)
+            elif not self._free:
+                slot, _ = self._entries.popitem(last=False)
+                self._free.append(slot)
+            slot = self._free.pop()
+            self._vectors[slot] = vector
+            self._entries[slot] = (question, answer, time.monotonic())
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+    def _match(self, vector):
+        if not self._entries:
+            return None
+        slots = np.fromiter(self._entries.keys(), dtype=np.int64, count=len(self._entries))
+        scores = self._vectors[slots] @ vector
+        best = int(np.argmax(scores))
+        return int(slots[best]) if scores[best] >= self.threshold else None
+
+    def _expire(self):
+        if not self.ttl:
+            return
+        cutoff = time.monotonic() - self.ttl
+        # Entries are in LRU order, not insertion order, so scan them all
+        expired = [slot for slot, (_, _, created) in self._entries.items() if created < cutoff]
+        for slot in expired:
+            del self._entries[slot]
+            self._free.append(slot)
+
+    def _clear(self):
+        self._entries.clear()
+        self._free = list(range(self.max_size))
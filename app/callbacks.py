@@ -0,0 +1,44 @@
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from app.metrics import record_stage, record_tokens
+
+
+class LLMCallCounter(BaseCallbackHandler):
+    """Counts, times and sums the token usage of the model calls made while answering one request."""
+
+    # Called directly rather than through an executor on the async path
+    run_inline = True
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.started = time.perf_counter()
+        self._running = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.calls += 1
+        self._running[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.calls += 1
+        self._running[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._running.pop(run_id, None)
+        if start is not None:
+            record_stage('llm', time.perf_counter() - start)
+        usage = (response.llm_output or {}).get('token_usage') or {}
+        if usage:
+            self.prompt_tokens += usage.get('prompt_tokens', 0)
+            self.completion_tokens += usage.get('completion_tokens', 0)
+            record_tokens(usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._running.pop(run_id, None)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
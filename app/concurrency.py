@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import metrics
+from app.config import Config
+
+
+class QueueFull(Exception):
+    """Raised when a chat request arrives while the queue is already full."""
+
+
+class ChatExecutor:
+    """Runs chat coroutines on one background event loop shared by all request threads.
+
+    While a request waits on the upstream LLM it only holds a coroutine, not a
+    thread of its own on the loop, so a handful of gunicorn threads can keep
+    many calls in flight. At most ``max_concurrency`` requests run at once;
+    up to ``max_queue`` more wait for a slot and anything beyond that is
+    rejected straight away with ``QueueFull``. The provider's rate limit is
+    applied by app.gateway, to every LLM call on any path.
+    """
+
+    def __init__(self, max_concurrency, max_queue, timeout):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.pending = 0
+        self.loop = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        ready = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.loop = loop
+            ready.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, name='chat-executor', daemon=True).start()
+        ready.wait()
+
+    async def _run(self, factory, trace):
+        # Each task has its own context, so the caller's trace is attached here
+        metrics.attach(trace)
+        start = time.perf_counter()
+        async with self.semaphore:
+            metrics.record_stage('queue_wait', time.perf_counter() - start)
+            return await factory()
+
+    def run(self, factory):
+        """Run ``factory()`` (a coroutine function) on the loop and wait for its result."""
+        with self._lock:
+            if self.loop is None:
+                self._start()
+            if self.pending >= self.max_concurrency + self.max_queue:
+                raise QueueFull()
+            self.pending += 1
+        try:
+            future = asyncio.run_coroutine_threadsafe(self._run(factory, metrics.current()), self.loop)
+            try:
+                return future.result(self.timeout)
+            except TimeoutError:
+                future.cancel()
+                raise
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def stats(self):
+        return {'pending': self.pending, 'max_concurrency': self.max_concurrency, 'max_queue': self.max_queue}
+
+
+chat_executor = ChatExecutor(max_concurrency=Config.CHAT_MAX_CONCURRENCY,
+                             max_queue=Config.CHAT_MAX_QUEUE,
+                             timeout=Config.CHAT_TIMEOUT)
+metrics.gauge('chat_executor_pending', lambda: chat_executor.pending)
+# Local CPU work (query embedding, FAISS/BM25 search) started ahead of the LLM
+# calls that decide whether it is needed; threads start on first use
+retrieval_pool = ThreadPoolExecutor(max_workers=Config.RETRIEVAL_WORKERS, thread_name_prefix='retrieval')
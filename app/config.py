@@ -3,7 +3,150 @@ from datetime import timedelta
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your_secret_key'
+    # Sent as X-Admin-Token to the /admin endpoints; they are disabled while unset
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///site.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
-    SESSION_TYPE = 'filesystem'  # Use filesystem-based session storage
+    # Flask-Session backend: sqlalchemy (the app database), redis or filesystem
+    SESSION_TYPE = os.environ.get('SESSION_TYPE', 'sqlalchemy')
+    # Expired sessions are deleted on average once every this many requests
+    SESSION_CLEANUP_N_REQUESTS = int(os.environ.get('SESSION_CLEANUP_N_REQUESTS', 100))
+    REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+
+    # bcrypt cost; existing hashes are upgraded on the next successful login
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    # Password hashing runs on this many processes (0 = on the request thread)
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', 32))
+    # Failed logins allowed per email and per client IP within the window (seconds)
+    LOGIN_MAX_ATTEMPTS = int(os.environ.get('LOGIN_MAX_ATTEMPTS', 5))
+    LOGIN_MAX_ATTEMPTS_PER_IP = int(os.environ.get('LOGIN_MAX_ATTEMPTS_PER_IP', 20))
+    LOGIN_ATTEMPT_WINDOW = int(os.environ.get('LOGIN_ATTEMPT_WINDOW', 300))
+
+    # Login and chat activity is written in batches of up to this many rows,
+    # at least every ACTIVITY_FLUSH_INTERVAL seconds
+    ACTIVITY_BATCH_SIZE = int(os.environ.get('ACTIVITY_BATCH_SIZE', 500))
+    ACTIVITY_FLUSH_INTERVAL = float(os.environ.get('ACTIVITY_FLUSH_INTERVAL', 2.0))
+    ACTIVITY_MAX_PENDING = int(os.environ.get('ACTIVITY_MAX_PENDING', 10000))
+    # A row that fails this many flushes is logged and dropped
+    ACTIVITY_MAX_ATTEMPTS = int(os.environ.get('ACTIVITY_MAX_ATTEMPTS', 3))
+
+    GROQ_API_KEY = os.environ.get('GROQ_API_KEY') or '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'
+    GROQ_MODEL = os.environ.get('GROQ_MODEL') or 'llama3-8b-8192'
+    # Load the embedding model, index and chains at worker start instead of on the first chat
+    LLM_WARMUP = os.environ.get('LLM_WARMUP', '1') == '1'
+
+    # Semantic answer cache in front of the chat pipeline, for the first question of a conversation
+    SEMANTIC_CACHE_ENABLED = os.environ.get('SEMANTIC_CACHE_ENABLED', '1') == '1'
+    SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', 0.92))
+    SEMANTIC_CACHE_MAX_SIZE = int(os.environ.get('SEMANTIC_CACHE_MAX_SIZE', 512))
+    SEMANTIC_CACHE_TTL = int(os.environ.get('SEMANTIC_CACHE_TTL', 3600))
+
+    # Query embeddings: torch, int8 (torch dynamic quantization), onnx or onnx-int8
+    EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'torch')
+    EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', 2048))
+    # Concurrent queries share a forward pass; 'off' embeds on the request thread
+    EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE', 32))
+    EMBEDDING_BATCH_WAIT_MS = os.environ.get('EMBEDDING_BATCH_WAIT_MS', '2')
+
+    # Local embedding router for first questions; the LLM categorizer handles follow-ups
+    # and questions below this margin
+    ROUTER_ENABLED = os.environ.get('ROUTER_ENABLED', '1') == '1'
+    ROUTER_MARGIN = float(os.environ.get('ROUTER_MARGIN', 0.08))
+
+    # Per-session conversation memory sent with each prompt
+    MEMORY_MAX_TURNS = int(os.environ.get('MEMORY_MAX_TURNS', 6))
+    MEMORY_MAX_TOKENS = int(os.environ.get('MEMORY_MAX_TOKENS', 1500))
+    MEMORY_SUMMARY_TOKENS = int(os.environ.get('MEMORY_SUMMARY_TOKENS', 300))
+    # Conversations idle this long are deleted from the chat history store
+    MEMORY_TTL = int(os.environ.get('MEMORY_TTL', 7 * 24 * 3600))
+    # Where chat history is kept: sql (the app database), redis or memory
+    CHAT_HISTORY_BACKEND = os.environ.get('CHAT_HISTORY_BACKEND', 'sql')
+    # The user's profile, rendered into at most this many tokens of every prompt
+    PROFILE_CONTEXT_TOKENS = int(os.environ.get('PROFILE_CONTEXT_TOKENS', 150))
+    PROFILE_CACHE_MAX_SIZE = int(os.environ.get('PROFILE_CACHE_MAX_SIZE', 10000))
+
+    # How retrieved chunks are combined into an answer for diabetes questions:
+    # 'map_rerank' makes one LLM call per chunk, 'rerank_stuff' over-fetches
+    # RETRIEVAL_FETCH_K candidates, reranks them locally and makes a single call
+    QA_STRATEGY = os.environ.get('QA_STRATEGY') or 'map_rerank'
+    RETRIEVAL_K = int(os.environ.get('RETRIEVAL_K', 3))
+    RETRIEVAL_FETCH_K = int(os.environ.get('RETRIEVAL_FETCH_K', 20))
+    RETRIEVAL_MMR_LAMBDA = float(os.environ.get('RETRIEVAL_MMR_LAMBDA', 0.7))
+    # Optional sentence-transformers cross-encoder, e.g. cross-encoder/ms-marco-MiniLM-L-6-v2
+    RERANKER_MODEL = os.environ.get('RERANKER_MODEL')
+    # Retrieved chunks are merged into non-overlapping passages of at most this many tokens
+    CONTEXT_MAX_TOKENS = int(os.environ.get('CONTEXT_MAX_TOKENS', 800))
+
+    # Chunking used by app.ingest; neighbouring chunks are joined again at query time,
+    # so the overlap only needs to bridge a cut sentence
+    CHUNK_SIZE = int(os.environ.get('CHUNK_SIZE', 512))
+    CHUNK_OVERLAP = int(os.environ.get('CHUNK_OVERLAP', 64))
+
+    # Vector index built by app.ingest: flat (exact), ivf, hnsw or ivfpq
+    FAISS_INDEX_TYPE = os.environ.get('FAISS_INDEX_TYPE') or 'flat'
+    FAISS_NLIST = int(os.environ.get('FAISS_NLIST', 0)) or None  # default ~4*sqrt(n)
+    FAISS_HNSW_M = int(os.environ.get('FAISS_HNSW_M', 32))
+    FAISS_PQ_M = int(os.environ.get('FAISS_PQ_M', 48))
+    FAISS_TRAIN_SAMPLE = int(os.environ.get('FAISS_TRAIN_SAMPLE', 50000))
+    # Index versions kept by app.ingest, and how often each process checks for a new one
+    INDEX_KEEP_VERSIONS = int(os.environ.get('INDEX_KEEP_VERSIONS', 3))
+    INDEX_POLL_INTERVAL = float(os.environ.get('INDEX_POLL_INTERVAL', 10))
+    # An old version is only deleted this many seconds after it stopped being current,
+    # long enough for every process to poll and load its successor
+    INDEX_PRUNE_GRACE = float(os.environ.get('INDEX_PRUNE_GRACE', 600))
+    # Search-time knobs for the approximate indexes
+    FAISS_NPROBE = int(os.environ.get('FAISS_NPROBE', 8))
+    FAISS_EF_SEARCH = int(os.environ.get('FAISS_EF_SEARCH', 64))
+
+    # Async chat execution: requests run on a shared event loop, CHAT_MAX_CONCURRENCY
+    # at a time with up to CHAT_MAX_QUEUE waiting
+    CHAT_ASYNC = os.environ.get('CHAT_ASYNC', '1') == '1'
+    CHAT_MAX_CONCURRENCY = int(os.environ.get('CHAT_MAX_CONCURRENCY', 16))
+    CHAT_MAX_QUEUE = int(os.environ.get('CHAT_MAX_QUEUE', 64))
+    CHAT_TIMEOUT = float(os.environ.get('CHAT_TIMEOUT', 60))
+    # The provider's rate limit for the whole deployment (0 for none). Each of the
+    # GUNICORN_WORKERS processes (exported by gunicorn.conf.py) paces its LLM
+    # attempts, retries and hedges included, to its share
+    LLM_REQUESTS_PER_MINUTE = int(os.environ.get('LLM_REQUESTS_PER_MINUTE', 30))
+    LLM_RATE_LIMIT_WORKERS = int(os.environ.get('GUNICORN_WORKERS', 1))
+    # Point the Groq client somewhere else, e.g. app.fake_llm_server for load tests
+    GROQ_API_BASE = os.environ.get('GROQ_API_BASE')
+
+    # LLM gateway (app.gateway): each attempt times out after LLM_TIMEOUT seconds
+    # and a call gives up after LLM_DEADLINE, retries and fallback included
+    LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', 15))
+    LLM_DEADLINE = float(os.environ.get('LLM_DEADLINE', 45))
+    LLM_RETRIES = int(os.environ.get('LLM_RETRIES', 2))
+    # Send a duplicate request when the first is slower than this percentile of
+    # recent calls (0 turns hedging off), for at most LLM_HEDGE_BUDGET of calls
+    LLM_HEDGE_PERCENTILE = float(os.environ.get('LLM_HEDGE_PERCENTILE', 95))
+    LLM_HEDGE_BUDGET = float(os.environ.get('LLM_HEDGE_BUDGET', 0.1))
+    LLM_BREAKER_FAILURES = int(os.environ.get('LLM_BREAKER_FAILURES', 5))
+    LLM_BREAKER_COOLDOWN = float(os.environ.get('LLM_BREAKER_COOLDOWN', 30))
+    # Secondary model: 'groq' (LLM_FALLBACK_MODEL on LLM_FALLBACK_API_BASE, by
+    # default the Groq API), 'local' (a small transformers model on the CPU) or
+    # 'fake'; unset for none
+    LLM_FALLBACK = os.environ.get('LLM_FALLBACK', '')
+    LLM_FALLBACK_MODEL = os.environ.get('LLM_FALLBACK_MODEL')
+    LLM_FALLBACK_API_BASE = os.environ.get('LLM_FALLBACK_API_BASE')
+    LLM_FALLBACK_API_KEY = os.environ.get('LLM_FALLBACK_API_KEY')
+
+    # Fuse BM25 (built by app.ingest) with vector search by reciprocal rank
+    HYBRID_SEARCH = os.environ.get('HYBRID_SEARCH', '1') == '1'
+    # Start retrieval for a new question while it is being categorized, on a
+    # pool of RETRIEVAL_WORKERS threads shared by the request threads
+    SPECULATIVE_RETRIEVAL = os.environ.get('SPECULATIVE_RETRIEVAL', '1') == '1'
+    RETRIEVAL_WORKERS = int(os.environ.get('RETRIEVAL_WORKERS', 4))
+
+    # Per-stage timings and token counts, served at /metrics
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+    # Also log one JSON line per request with its stage timings
+    METRICS_JSON_LOG = os.environ.get('METRICS_JSON_LOG', '0') == '1'
+    # LangChain's verbose chain logging, off unless debugging prompts
+    CHAIN_VERBOSE = os.environ.get('CHAIN_VERBOSE', '0') == '1'
+
+    # Serve the fingerprinted, precompressed files written by `python -m app.assets build`
+    # when app/static/dist/manifest.json exists; 0 serves the source files as they are
+    STATIC_BUILD = os.environ.get('STATIC_BUILD', '1') == '1'
@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from langchain_core.embeddings import Embeddings
+
+from app import metrics
+
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+
+
+def normalize(text):
+    # MiniLM's tokenizer lowercases and ignores runs of whitespace anyway
+    return ' '.join(text.split()).lower()
+
+
+class EmbeddingService(Embeddings):
+    """Query embeddings for the chat pipeline, cached and micro-batched.
+
+    Recently seen queries (after ``normalize``) are answered from an LRU of
+    ``cache_size`` vectors. Misses go to one background thread that runs the
+    model on everything queued at once, up to ``batch_size`` texts, so
+    concurrent requests share a forward pass instead of taking turns. When
+    more than one query is already waiting it lingers up to ``max_wait``
+    seconds for others to join; a lone query is embedded straight away.
+    ``max_wait=None`` embeds on the calling thread, without batching.
+
+    ``embed_documents`` (index building, router seeds) goes to the model directly.
+    """
+
+    def __init__(self, model, batch_size=32, max_wait=0.002, cache_size=2048):
+        self.model = model
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._pending = []  # (text, future, queued at)
+        self._inflight = {}  # text -> future, so duplicates share one slot
+        self._ready = threading.Condition()
+        self._thread = None
+
+    def embed_documents(self, texts):
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text):
+        text = normalize(text)
+        with self._ready:
+            vector = self._cache.get(text)
+            if vector is not None:
+                self._cache.move_to_end(text)
+                self.hits += 1
+                return list(vector)
+            self.misses += 1
+            if self.max_wait is not None:
+                future = self._submit(text)
+        if self.max_wait is None:
+            vector = self.model.embed_documents([text])[0]
+        else:
+            vector = future.result()
+        if self.cache_size:
+            with self._ready:
+                self._cache[text] = vector
+                self._cache.move_to_end(text)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return list(vector)
+
+    def _submit(self, text):
+        # Called with the lock held
+        future = self._inflight.get(text)
+        if future is None:
+            future = self._inflight[text] = Future()
+            self._pending.append((text, future, time.monotonic()))
+            if self._thread is None:
+                # Started on first use, after gunicorn has forked the worker
+                self._thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+                self._thread.start()
+            self._ready.notify()
+        return future
+
+    def _next_batch(self):
+        with self._ready:
+            while not self._pending:
+                self._ready.wait()
+            if len(self._pending) > 1 and self.max_wait:
+                deadline = self._pending[0][2] + self.max_wait
+                while len(self._pending) < self.batch_size and time.monotonic() < deadline:
+                    self._ready.wait(deadline - time.monotonic())
+            batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+            for text, _, _ in batch:
+                del self._inflight[text]
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            now = time.monotonic()
+            for _, _, queued in batch:
+                metrics.observe('embedding_queue_wait_seconds', now - queued)
+            metrics.observe('embedding_batch_size', len(batch), metrics.COUNT_BUCKETS)
+            try:
+                vectors = self.model.embed_documents([text for text, _, _ in batch])
+            except Exception as exc:
+                for _, future, _ in batch:
+                    future.set_exception(exc)
+                continue
+            for (_, future, _), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def stats(self):
+        with self._ready:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'pending': len(self._pending),
+            }
+
+
+class OnnxEmbeddings(Embeddings):
+    """Sentence embeddings from an ONNX export of the model, on onnxruntime.
+
+    Mean pooling followed by L2 normalization, as in the sentence-transformers
+    pipeline of all-MiniLM-L6-v2, so the vectors match the index.
+    """
+
+    def __init__(self, model_name, quantize=False):
+        try:
+            from optimum.onnxruntime import ORTModelForFeatureExtraction
+        except ImportError:
+            raise RuntimeError("EMBEDDING_BACKEND=onnx needs 'pip install optimum[onnxruntime]'")
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+        if quantize:
+            self.model = _quantize_onnx(self.model)
+
+    def embed_documents(self, texts):
+        import numpy as np
+        inputs = self.tokenizer(texts, padding=True, truncation=True, return_tensors='np')
+        hidden = self.model(**inputs).last_hidden_state
+        mask = inputs['attention_mask'][..., None].astype(hidden.dtype)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled.tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def _quantize_onnx(model):
+    import tempfile
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    # Dynamic int8 weights; avx2 kernels run on practically any x86 server
+    path = tempfile.mkdtemp(prefix='embeddings-int8-')
+    ORTQuantizer.from_pretrained(model).quantize(
+        save_dir=path, quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=False))
+    return ORTModelForFeatureExtraction.from_pretrained(path)
+
+
+def load_model(backend='torch', model_name=MODEL_NAME):
+    """The embedding model on the chosen CPU backend.
+
+    ``torch`` is the plain sentence-transformers model. ``int8`` applies torch
+    dynamic quantization to its linear layers, which needs nothing extra
+    installed. ``onnx`` and ``onnx-int8`` run an ONNX export on onnxruntime
+    through the optional ``optimum`` package.
+    """
+    if backend in ('onnx', 'onnx-int8'):
+        return OnnxEmbeddings(model_name, quantize=backend == 'onnx-int8')
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    embeddings = HuggingFaceEmbeddings(model_name=model_name)
+    if backend == 'int8':
+        import torch
+        torch.quantization.quantize_dynamic(embeddings.client, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    elif backend != 'torch':
+        raise ValueError(f"Unknown embedding backend {backend!r}")
+    return embeddings
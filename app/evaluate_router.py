@@ -0,0 +1,90 @@
+import argparse
+import statistics
+import time
+
+from app.llm import get_service
+
+# Held-out queries, not part of the router seeds or the categorize prompt
+DEFAULT_QUESTIONS = [
+    "What is HbA1c and what level should I aim for?",
+    "Can I eat bananas if I have type 2 diabetes?",
+    "How does insulin resistance develop?",
+    "What are the side effects of metformin?",
+    "Is gestational diabetes dangerous for the baby?",
+    "How often should I check my feet?",
+    "What does a fasting glucose of 130 mean?",
+    "Are SGLT2 inhibitors safe for kidneys?",
+    "Does stress raise blood sugar?",
+    "What snacks are good before bed for diabetics?",
+    "Who won the football game last night?",
+    "Recommend a good movie for the weekend.",
+    "How do I reset my email password?",
+    "Tell me a joke.",
+    "What's the best way to learn Python?",
+    "Thanks, that was helpful!",
+    "Good morning!",
+    "How do I cook pasta al dente?",
+    "What time zone is Tokyo in?",
+    "Can you translate hello into Spanish?",
+]
+
+# Follow-ups that only make sense with the history; the router must leave them to the LLM
+DEFAULT_FOLLOW_UPS = [
+    ("Human: What foods raise blood sugar the most?\nAI: Refined carbohydrates such as white bread and sugary drinks.",
+     "What about for kids?"),
+    ("Human: What are the side effects of metformin?\nAI: Mostly stomach upset, which usually eases over time.",
+     "And the dosage?"),
+    ("Human: How often should I test my glucose?\nAI: It depends on your treatment; ask your care team.",
+     "Why is that?"),
+    ("Human: Recommend a good movie for the weekend.\nAI: I can only help with diabetes questions.",
+     "Okay, what about insulin pens then?"),
+]
+
+
+def evaluate(questions):
+    """Route each question, a string or a ``(chat_history, question)`` pair, both ways."""
+    service = get_service()
+    rows = []
+    for question in questions:
+        chat_history, question = question if isinstance(question, tuple) else ('', question)
+        start = time.perf_counter()
+        local = service.route(question, chat_history)
+        router_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        remote = service.cuq_chain.run({'question': question, 'chat_history': chat_history}).strip()
+        llm_time = time.perf_counter() - start
+        rows.append((question, local, remote, router_time, llm_time))
+    return rows
+
+
+def report(rows):
+    routed = [row for row in rows if row[1] is not None]
+    agreed = [row for row in routed if row[1] == row[2]]
+    router_ms = statistics.mean(row[3] for row in rows) * 1000
+    llm_ms = statistics.mean(row[4] for row in rows) * 1000
+    # Routed queries skip the LLM call; fallbacks pay for both
+    saved_ms = (len(routed) * llm_ms - len(rows) * router_ms) / len(rows)
+
+    for question, local, remote, _, _ in rows:
+        marker = ' ' if local is None else ('=' if local == remote else '!')
+        print(f"{marker} {str(local):13} {remote:13} {question}")
+    print()
+    print(f"questions:           {len(rows)}")
+    print(f"routed locally:      {len(routed)} ({len(routed) / len(rows):.0%})")
+    print(f"agreement with LLM:  {len(agreed)}/{len(routed)}" + (f" ({len(agreed) / len(routed):.0%})" if routed else ''))
+    print(f"router latency:      {router_ms:.1f} ms/request")
+    print(f"LLM categorize:      {llm_ms:.1f} ms/request")
+    print(f"latency saved:       {saved_ms:.1f} ms/request")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the local router with the LLM categorizer')
+    parser.add_argument('questions', nargs='?', help='file with one question per line')
+    args = parser.parse_args()
+    if args.questions:
+        with open(args.questions, encoding='utf-8') as f:
+            questions = [line.strip() for line in f if line.strip()]
+    else:
+        questions = DEFAULT_QUESTIONS + DEFAULT_FOLLOW_UPS
+    report(evaluate(questions))
@@ -0,0 +1,72 @@
+"""Deterministic stand-in for the chat model, for offline benchmarks and load tests."""
+import random
+import re
+import time
+from typing import Any, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from app.memory import count_tokens
+
+ANSWER = ("Managing diabetes involves regular blood sugar monitoring, a balanced diet, "
+          "physical activity and taking medications as prescribed by your doctor.")
+
+# Words that make the fake categorizer answer "diabetes"
+MEDICAL_TERMS = re.compile(r'diabet|insulin|glucose|sugar|a1c|metformin|ketoacidosis|retinopathy|'
+                           r'neuropathy|sglt2|sick day|feet|foot|type [12]|medication', re.IGNORECASE)
+
+
+def reply_for(prompt):
+    # Enough to satisfy each chain's expected output format
+    if 'categorize the user query' in prompt:
+        query = prompt.rsplit('User Query:', 1)[-1]
+        return 'diabetes' if MEDICAL_TERMS.search(query) else 'not-diabetes'
+    if 'Score:' in prompt:
+        return f"{ANSWER}\nScore: 80"
+    if 'Standalone question:' in prompt:
+        # Condensing needs a real model; the follow-up as asked keeps retrieval deterministic
+        return prompt.rsplit('Follow Up Input:', 1)[-1].split('\n', 1)[0].strip()
+    return ANSWER
+
+
+class FakeChatModel(BaseChatModel):
+    """Answers with ``reply_for`` after sleeping ``latency`` seconds and counts its calls and prompt tokens.
+
+    For testing app.gateway, a ``slow_rate`` fraction of calls takes
+    ``slow_latency`` seconds instead, and an ``error_rate`` fraction fails.
+    """
+
+    latency: float = 0.0
+    slow_rate: float = 0.0
+    slow_latency: float = 0.0
+    error_rate: float = 0.0
+    seed: Optional[int] = None
+    rng: Any = None
+    calls: int = 0
+    prompt_tokens: int = 0
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self):
+        return 'fake'
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        self.calls += 1
+        latency = self.slow_latency if self.slow_rate and self.rng.random() < self.slow_rate else self.latency
+        if latency:
+            time.sleep(latency)
+        if self.error_rate and self.rng.random() < self.error_rate:
+            raise RuntimeError('Injected failure')
+        prompt = messages[-1].content
+        content = reply_for(prompt)
+        usage = {'prompt_tokens': sum(count_tokens(message.content) for message in messages),
+                 'completion_tokens': count_tokens(content)}
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        self.prompt_tokens += usage['prompt_tokens']
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))],
+                          llm_output={'token_usage': usage})
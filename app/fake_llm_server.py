@@ -0,0 +1,99 @@
+"""OpenAI-compatible stand-in for the Groq API, for offline load tests.
+
+    python -m app.fake_llm_server --latency 0.8 --rpm 30
+    GROQ_API_BASE=http://127.0.0.1:8081 gunicorn -c gunicorn.conf.py run:gunicorn_app
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import deque
+
+from aiohttp import web
+
+from app.fake_llm import reply_for
+
+
+class FakeLLM:
+    def __init__(self, latency, jitter, rpm, error_rate):
+        self.latency = latency
+        self.jitter = jitter
+        self.rpm = rpm
+        self.error_rate = error_rate
+        self.calls = deque()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def rate_limited(self):
+        now = time.monotonic()
+        while self.calls and self.calls[0] < now - 60:
+            self.calls.popleft()
+        if self.rpm and len(self.calls) >= self.rpm:
+            return True
+        self.calls.append(now)
+        return False
+
+    async def completions(self, request):
+        body = await request.json()
+        if self.rate_limited():
+            return web.json_response({'error': {'message': 'Rate limit reached', 'type': 'requests'}}, status=429)
+        if random.random() < self.error_rate:
+            return web.json_response({'error': {'message': 'Injected failure', 'type': 'server_error'}}, status=500)
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        finally:
+            self.in_flight -= 1
+
+        content = reply_for(body['messages'][-1]['content'])
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        if body.get('stream'):
+            response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+            await response.prepare(request)
+            for word in content.split(' '):
+                chunk = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': created,
+                         'model': body['model'],
+                         'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': word + ' '},
+                                      'finish_reason': None}]}
+                await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                await asyncio.sleep(0.01)
+            await response.write(b"data: [DONE]\n\n")
+            return response
+
+        tokens = len(content.split())
+        return web.json_response({
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': created,
+            'model': body['model'],
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': tokens, 'total_tokens': tokens},
+        })
+
+    async def stats(self, request):
+        return web.json_response({'max_in_flight': self.max_in_flight, 'in_flight': self.in_flight,
+                                  'calls_last_minute': len(self.calls)})
+
+
+def make_app(latency=0.5, jitter=0.1, rpm=0, error_rate=0.0):
+    fake = FakeLLM(latency, jitter, rpm, error_rate)
+    app = web.Application()
+    app.router.add_post('/openai/v1/chat/completions', fake.completions)
+    app.router.add_get('/stats', fake.stats)
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake Groq chat-completions server')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.5, help='mean response time in seconds')
+    parser.add_argument('--jitter', type=float, default=0.1, help='std-dev of the response time')
+    parser.add_argument('--rpm', type=int, default=0, help='answer 429 above this many requests per minute (0 = off)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 500')
+    args = parser.parse_args()
+    web.run_app(make_app(args.latency, args.jitter, args.rpm, args.error_rate), port=args.port)
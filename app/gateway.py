@@ -0,0 +1,573 @@
+"""Resilient access to the chat model for every chain in app.llm.
+
+``LLMGateway`` runs each call to the primary model under a deadline, retries
+failures with jittered exponential backoff, sends a duplicate ("hedged")
+request when the first one is slower than most recent calls, paces every
+request to the provider's rate limit, and stops calling a provider whose
+circuit breaker is open. Calls the primary cannot serve go to
+the fallback model, if one is configured. ``GatewayChatModel`` exposes the
+gateway to LangChain as an ordinary chat model.
+"""
+import asyncio
+import logging
+import math
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from app.config import Config
+from app.memory import count_tokens
+from app.metrics import inc, observe, record_stage
+
+logger = logging.getLogger(__name__)
+
+LOCAL_MODEL = 'Qwen/Qwen2.5-0.5B-Instruct'
+# Client errors that a retry or another attempt would only repeat
+PERMANENT_STATUS = {400, 401, 403, 404, 422}
+# What CircuitBreaker.allow returns for the single call let through after the cooldown
+TRIAL = 'trial'
+
+
+class LLMUnavailable(Exception):
+    """Raised when no model produced an answer within the deadline."""
+
+
+def _permanent(exc):
+    return getattr(exc, 'status_code', None) in PERMANENT_STATUS
+
+
+class CircuitBreaker:
+    """Stops calls to a provider after ``failures`` consecutive failed calls.
+
+    Once ``cooldown`` seconds have passed, a single trial call is let through.
+    If it succeeds the breaker closes again; if it fails the breaker stays open
+    for another cooldown. Every call ``allow`` lets through has to end in
+    ``success``, ``failure`` or ``release``, or no trial is ever let through again.
+    """
+
+    def __init__(self, failures=5, cooldown=30.0):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._failed = 0
+        self._opened = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened is not None
+
+    def allow(self):
+        """False while open; ``TRIAL`` for the trial call, True otherwise."""
+        with self._lock:
+            if self._opened is None:
+                return True
+            if self._trial or time.monotonic() - self._opened < self.cooldown:
+                return False
+            self._trial = True
+            return TRIAL
+
+    def release(self, permit):
+        """End a call that was cancelled before it had an outcome, freeing the trial slot if it held it."""
+        if permit == TRIAL:
+            with self._lock:
+                self._trial = False
+
+    def success(self):
+        with self._lock:
+            self._failed = 0
+            self._opened = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self._failed += 1
+            if self._trial or self._failed >= self.failures:
+                self._opened = time.monotonic()
+                self._trial = False
+                return True
+            return False
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, bursts up to ``capacity``."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait=None):
+        """Take a token and return how long to wait before using it.
+
+        Returns None, taking nothing, when the token would not be available
+        within ``max_wait`` seconds.
+        """
+        with self._lock:
+            now = time.monotonic()
+            tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+            if max_wait is not None and wait > max_wait:
+                self.tokens = tokens
+                return None
+            self.tokens = tokens - 1
+            return wait
+
+
+class LatencyWindow:
+    """The latencies of the last ``size`` successful attempts."""
+
+    def __init__(self, size=500, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+
+    def percentile(self, p):
+        samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return None
+        # Nearest rank
+        return samples[max(0, math.ceil(len(samples) * p / 100) - 1)]
+
+
+class Upstream:
+    def __init__(self, name, model, breaker, limiter=None):
+        self.name = name
+        self.model = model
+        self.breaker = breaker
+        self.limiter = limiter
+        self.latency = LatencyWindow()
+
+
+class LLMGateway:
+    """Deadlines, retries, hedging, circuit breaking and fallback around chat models.
+
+    Every attempt gets ``timeout`` seconds, and a whole call gets ``deadline``
+    seconds including retries and the fallback. When a fallback is configured,
+    the primary stops retrying early enough to leave the fallback one full
+    attempt. Failed attempts are retried up to ``retries`` times after a random
+    pause of up to ``backoff * 2**n`` seconds (at most ``backoff_max``), unless
+    the error is a client error that would only repeat. An attempt still
+    running after the ``hedge_percentile`` latency of recent attempts (and at
+    least ``hedge_min_delay`` seconds) gets a duplicate request, and the first
+    answer wins. Hedges are capped at ``hedge_budget`` of all calls so that a
+    slow provider does not receive double the traffic. After
+    ``breaker_failures`` consecutive failed calls a provider is skipped for
+    ``breaker_cooldown`` seconds.
+
+    Every request to the primary, retries and hedges included, first takes a
+    token from ``limiter``. An attempt that would have to wait past its
+    deadline for one is not made, and a hedge is only sent if a token is free.
+
+    On the sync path attempts run on a small thread pool. An attempt that is
+    abandoned keeps its thread until the client's own timeout, so give the
+    client the same ``timeout``. On the async path losing attempts are cancelled.
+    """
+
+    def __init__(self, primary, fallback=None, timeout=15.0, deadline=45.0, retries=2, backoff=0.25,
+                 backoff_max=4.0, hedge_percentile=95.0, hedge_min_delay=0.1, hedge_budget=0.1,
+                 breaker_failures=5, breaker_cooldown=30.0, limiter=None, workers=32):
+        self.upstreams = [Upstream('primary', primary, CircuitBreaker(breaker_failures, breaker_cooldown), limiter)]
+        if fallback is not None:
+            self.upstreams.append(Upstream('fallback', fallback, CircuitBreaker(breaker_failures, breaker_cooldown)))
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_budget = hedge_budget
+        self.workers = workers
+        self.calls = 0
+        self.hedges = 0
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self):
+        return self.upstreams[0]
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # Created on first use, after gunicorn has forked the worker
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='llm')
+            return self._pool
+
+    def _plan(self, deadline):
+        # (upstream, time by which its attempts must have started)
+        for i, upstream in enumerate(self.upstreams):
+            last = i == len(self.upstreams) - 1
+            yield upstream, deadline if last else deadline - self.timeout
+
+    def _hedge_delay(self, upstream):
+        if not self.hedge_percentile:
+            return None
+        threshold = upstream.latency.percentile(self.hedge_percentile)
+        return None if threshold is None else max(self.hedge_min_delay, threshold)
+
+    def _may_hedge(self, upstream):
+        with self._lock:
+            if self.hedges >= self.hedge_budget * self.calls:
+                return False
+            if upstream.limiter is not None and upstream.limiter.reserve(max_wait=0) is None:
+                return False
+            self.hedges += 1
+            return True
+
+    def _pause(self, attempt, remaining):
+        return min(random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt)), max(0.0, remaining))
+
+    def _attempts(self, upstream, stop_by):
+        """Yield (attempt number, breaker permit, rate limit wait) for ``upstream``
+        while its breaker, its rate limit and the clock allow.
+
+        The caller waits the given seconds before the attempt, and settles every
+        permit through ``_succeeded``, ``_failed``, ``_rejected`` or ``breaker.release``.
+        """
+        for attempt in range(self.retries + 1):
+            if time.monotonic() >= stop_by:
+                return
+            permit = upstream.breaker.allow()
+            if not permit:
+                return
+            pause = 0.0
+            if upstream.limiter is not None:
+                pause = upstream.limiter.reserve(max_wait=stop_by - time.monotonic())
+                if pause is None:
+                    upstream.breaker.release(permit)
+                    inc('llm_rate_limited_total', provider=upstream.name)
+                    return
+                record_stage('rate_limit_wait', pause)
+            if attempt:
+                inc('llm_retries_total', provider=upstream.name)
+            yield attempt, permit, pause
+
+    def _failed(self, upstream, exc):
+        inc('llm_attempts_total', provider=upstream.name, outcome='timeout' if isinstance(exc, TimeoutError) else 'error')
+        if upstream.breaker.failure():
+            logger.warning('Circuit breaker for the %s LLM is open after: %r', upstream.name, exc)
+
+    def _succeeded(self, upstream):
+        inc('llm_attempts_total', provider=upstream.name, outcome='ok')
+        upstream.breaker.success()
+
+    def _rejected(self, upstream):
+        # A client error is the provider answering; it says nothing against its health
+        inc('llm_attempts_total', provider=upstream.name, outcome='rejected')
+        upstream.breaker.success()
+
+    def _fallback(self, upstream, errors):
+        if upstream is not self.primary:
+            inc('llm_fallbacks_total')
+            if errors:
+                # While the primary's breaker is open this would repeat on every call
+                logger.warning('Falling back to the secondary LLM: %s', '; '.join(errors[-3:]))
+
+    def generate(self, messages, stop=None, **kwargs):
+        start = time.monotonic()
+        deadline = start + self.deadline
+        with self._lock:
+            self.calls += 1
+        errors = []
+        for upstream, stop_by in self._plan(deadline):
+            self._fallback(upstream, errors)
+            for attempt, permit, pause in self._attempts(upstream, stop_by):
+                try:
+                    time.sleep(pause)
+                    result = self._call(upstream, messages, stop, kwargs, min(self.timeout, deadline - time.monotonic()))
+                except Exception as exc:
+                    if _permanent(exc):
+                        self._rejected(upstream)
+                        raise
+                    self._failed(upstream, exc)
+                    errors.append(f'{upstream.name}: {exc!r}')
+                    time.sleep(self._pause(attempt, stop_by - time.monotonic()))
+                    continue
+                except BaseException:
+                    upstream.breaker.release(permit)
+                    raise
+                self._succeeded(upstream)
+                observe('llm_call_seconds', time.monotonic() - start, provider=upstream.name)
+                return result
+        raise LLMUnavailable('; '.join(errors) or 'All LLM circuit breakers are open')
+
+    def _attempt(self, upstream, messages, stop, kwargs):
+        start = time.monotonic()
+        result = upstream.model._generate(messages, stop=stop, **kwargs)
+        upstream.latency.add(time.monotonic() - start)
+        return result
+
+    def _call(self, upstream, messages, stop, kwargs, timeout):
+        pool = self._executor()
+        start = time.monotonic()
+        pending = {pool.submit(self._attempt, upstream, messages, stop, kwargs)}
+        hedge_at = self._hedge_delay(upstream)
+        error = None
+        while pending:
+            now = time.monotonic()
+            until = start + timeout if hedge_at is None else min(start + timeout, start + hedge_at)
+            done, pending = wait(pending, timeout=max(0.0, until - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+            if hedge_at is not None and pending and time.monotonic() >= start + hedge_at:
+                if time.monotonic() < start + timeout and self._may_hedge(upstream):
+                    inc('llm_hedges_total', provider=upstream.name)
+                    pending.add(pool.submit(self._attempt, upstream, messages, stop, kwargs))
+                hedge_at = None
+            elif pending and time.monotonic() >= start + timeout:
+                raise TimeoutError(f'No answer from the {upstream.name} LLM within {timeout:.1f}s')
+        raise error
+
+    async def agenerate(self, messages, stop=None, **kwargs):
+        start = time.monotonic()
+        deadline = start + self.deadline
+        with self._lock:
+            self.calls += 1
+        errors = []
+        for upstream, stop_by in self._plan(deadline):
+            self._fallback(upstream, errors)
+            for attempt, permit, pause in self._attempts(upstream, stop_by):
+                try:
+                    await asyncio.sleep(pause)
+                    result = await self._acall(upstream, messages, stop, kwargs,
+                                               min(self.timeout, deadline - time.monotonic()))
+                except Exception as exc:
+                    if _permanent(exc):
+                        self._rejected(upstream)
+                        raise
+                    self._failed(upstream, exc)
+                    errors.append(f'{upstream.name}: {exc!r}')
+                    await asyncio.sleep(self._pause(attempt, stop_by - time.monotonic()))
+                    continue
+                except BaseException:
+                    # Cancelled, e.g. by the ChatExecutor's timeout
+                    upstream.breaker.release(permit)
+                    raise
+                self._succeeded(upstream)
+                observe('llm_call_seconds', time.monotonic() - start, provider=upstream.name)
+                return result
+        raise LLMUnavailable('; '.join(errors) or 'All LLM circuit breakers are open')
+
+    async def _aattempt(self, upstream, messages, stop, kwargs):
+        start = time.monotonic()
+        result = await upstream.model._agenerate(messages, stop=stop, **kwargs)
+        upstream.latency.add(time.monotonic() - start)
+        return result
+
+    async def _acall(self, upstream, messages, stop, kwargs, timeout):
+        start = time.monotonic()
+        tasks = [asyncio.ensure_future(self._aattempt(upstream, messages, stop, kwargs))]
+        hedge_at = self._hedge_delay(upstream)
+        pending, error = set(tasks), None
+        try:
+            while pending:
+                until = start + timeout if hedge_at is None else min(start + timeout, start + hedge_at)
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, until - time.monotonic()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                if hedge_at is not None and pending and time.monotonic() >= start + hedge_at:
+                    if time.monotonic() < start + timeout and self._may_hedge(upstream):
+                        inc('llm_hedges_total', provider=upstream.name)
+                        task = asyncio.ensure_future(self._aattempt(upstream, messages, stop, kwargs))
+                        tasks.append(task)
+                        pending.add(task)
+                    hedge_at = None
+                elif pending and time.monotonic() >= start + timeout:
+                    raise TimeoutError(f'No answer from the {upstream.name} LLM within {timeout:.1f}s')
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stream(self, messages, stop=None, **kwargs):
+        """Yield message chunks, retrying or falling back only until the first one arrives.
+
+        Streams are not hedged; the client's timeout bounds the wait for the first chunk.
+        """
+        errors = []
+        for upstream, stop_by in self._plan(time.monotonic() + self.deadline):
+            self._fallback(upstream, errors)
+            for attempt, permit, pause in self._attempts(upstream, stop_by):
+                try:
+                    time.sleep(pause)
+                    chunks = upstream.model.stream(messages, stop=stop, **kwargs)
+                    first = next(chunks, None)
+                except Exception as exc:
+                    if _permanent(exc):
+                        self._rejected(upstream)
+                        raise
+                    self._failed(upstream, exc)
+                    errors.append(f'{upstream.name}: {exc!r}')
+                    time.sleep(self._pause(attempt, stop_by - time.monotonic()))
+                    continue
+                except BaseException:
+                    upstream.breaker.release(permit)
+                    raise
+                self._succeeded(upstream)
+                if first is not None:
+                    yield first
+                yield from chunks
+                return
+        raise LLMUnavailable('; '.join(errors) or 'All LLM circuit breakers are open')
+
+    async def astream(self, messages, stop=None, **kwargs):
+        errors = []
+        for upstream, stop_by in self._plan(time.monotonic() + self.deadline):
+            self._fallback(upstream, errors)
+            for attempt, permit, pause in self._attempts(upstream, stop_by):
+                chunks = upstream.model.astream(messages, stop=stop, **kwargs)
+                try:
+                    await asyncio.sleep(pause)
+                    first = await chunks.__anext__()
+                except StopAsyncIteration:
+                    self._succeeded(upstream)
+                    return
+                except Exception as exc:
+                    if _permanent(exc):
+                        self._rejected(upstream)
+                        raise
+                    self._failed(upstream, exc)
+                    errors.append(f'{upstream.name}: {exc!r}')
+                    await asyncio.sleep(self._pause(attempt, stop_by - time.monotonic()))
+                    continue
+                except BaseException:
+                    upstream.breaker.release(permit)
+                    raise
+                self._succeeded(upstream)
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+                return
+        raise LLMUnavailable('; '.join(errors) or 'All LLM circuit breakers are open')
+
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'hedges': self.hedges,
+            'providers': {upstream.name: {'circuit_open': upstream.breaker.is_open,
+                                          'p50_ms': _ms(upstream.latency.percentile(50)),
+                                          'p95_ms': _ms(upstream.latency.percentile(95))}
+                          for upstream in self.upstreams},
+        }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+class GatewayChatModel(BaseChatModel):
+    """Exposes ``LLMGateway`` to chains that expect a LangChain chat model."""
+
+    gateway: Any
+
+    @property
+    def _llm_type(self):
+        return 'gateway'
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        return self.gateway.generate(messages, stop=stop, **kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        return await self.gateway.agenerate(messages, stop=stop, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        for chunk in self.gateway.stream(messages, stop=stop, **kwargs):
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        async for chunk in self.gateway.astream(messages, stop=stop, **kwargs):
+            yield ChatGenerationChunk(message=chunk)
+
+
+class LocalChatModel(BaseChatModel):
+    """A small instruction-tuned model on the CPU through transformers, as a last-resort fallback."""
+
+    model_name: str = LOCAL_MODEL
+    max_new_tokens: int = 256
+    pipeline: Any = None
+    lock: Any = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        from transformers import pipeline
+        self.pipeline = pipeline('text-generation', model=self.model_name, device='cpu')
+        # One generation at a time; parallel ones would only compete for the same cores
+        self.lock = threading.Lock()
+
+    @property
+    def _llm_type(self):
+        return 'local'
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        roles = {'human': 'user', 'ai': 'assistant', 'system': 'system'}
+        chat = [{'role': roles.get(message.type, 'user'), 'content': message.content} for message in messages]
+        with self.lock:
+            content = self.pipeline(chat, max_new_tokens=self.max_new_tokens, do_sample=False,
+                                    return_full_text=False)[0]['generated_text']
+        for word in stop or ():
+            content = content.split(word, 1)[0]
+        usage = {'prompt_tokens': sum(count_tokens(message.content) for message in messages),
+                 'completion_tokens': count_tokens(content)}
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))],
+                          llm_output={'token_usage': usage})
+
+
+def fallback_model(kind, model_name=None):
+    """The secondary model named by ``LLM_FALLBACK``, or None."""
+    if not kind:
+        return None
+    if kind == 'groq':
+        # Any OpenAI-compatible endpoint works through LLM_FALLBACK_API_BASE
+        from langchain_groq import ChatGroq
+        return ChatGroq(groq_api_key=Config.LLM_FALLBACK_API_KEY or Config.GROQ_API_KEY,
+                        model_name=model_name or Config.GROQ_MODEL,
+                        groq_api_base=Config.LLM_FALLBACK_API_BASE or Config.GROQ_API_BASE,
+                        request_timeout=Config.LLM_TIMEOUT, max_retries=0)
+    if kind == 'local':
+        return LocalChatModel(model_name=model_name or LOCAL_MODEL)
+    if kind == 'fake':
+        from app.fake_llm import FakeChatModel
+        return FakeChatModel()
+    raise ValueError(f"Unknown LLM fallback {kind!r}")
+
+
+def rate_limiter():
+    """This worker's share of ``LLM_REQUESTS_PER_MINUTE``, or None without a limit."""
+    if Config.LLM_REQUESTS_PER_MINUTE <= 0:
+        return None
+    per_minute = Config.LLM_REQUESTS_PER_MINUTE / max(1, Config.LLM_RATE_LIMIT_WORKERS)
+    # A minute's worth of burst: the calls of a single chat turn go out without
+    # waiting, and only sustained load is paced to the refill rate
+    return TokenBucket(per_minute / 60, capacity=max(1.0, per_minute))
+
+
+def from_config(primary, fallback=None):
+    return LLMGateway(primary, fallback,
+                      timeout=Config.LLM_TIMEOUT,
+                      deadline=Config.LLM_DEADLINE,
+                      retries=Config.LLM_RETRIES,
+                      hedge_percentile=Config.LLM_HEDGE_PERCENTILE,
+                      hedge_budget=Config.LLM_HEDGE_BUDGET,
+                      breaker_failures=Config.LLM_BREAKER_FAILURES,
+                      breaker_cooldown=Config.LLM_BREAKER_COOLDOWN,
+                      limiter=rate_limiter())
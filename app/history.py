@@ -0,0 +1,224 @@
+"""Storage backends for chat history.
+
+Each backend keeps, per conversation, a running summary, the id of the last
+message folded into it and the messages after that. Turns are appended one at
+a time and only the most recent ones are read back, so the cost of a request
+does not grow with the length of the conversation.
+
+    load(conversation_id, limit) -> (summary, summarized_through, [(id, question, answer), ...])
+
+``limit`` caps the turns returned, newest kept; None returns every turn not folded yet.
+"""
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+
+class MemoryHistory:
+    """Process-local history, for a single worker or the offline benchmarks."""
+
+    def __init__(self):
+        self._conversations = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def _conversation(self, conversation_id, user_id=None):
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None:
+            conversation = {'user_id': user_id, 'summary': '', 'through': 0, 'turns': [], 'updated': time.time()}
+            self._conversations[conversation_id] = conversation
+        return conversation
+
+    def start(self, conversation_id, user_id=None):
+        with self._lock:
+            self._conversation(conversation_id, user_id)
+
+    def append(self, conversation_id, question, answer):
+        with self._lock:
+            conversation = self._conversation(conversation_id)
+            message_id = self._next_id
+            self._next_id += 1
+            conversation['turns'].append((message_id, question, answer))
+            conversation['updated'] = time.time()
+            return message_id
+
+    def load(self, conversation_id, limit):
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                return '', 0, []
+            turns = conversation['turns'][-limit:] if limit is not None else conversation['turns']
+            return conversation['summary'], conversation['through'], list(turns)
+
+    def fold(self, conversation_id, summary, through):
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None or conversation['through'] >= through:
+                return
+            conversation['summary'] = summary
+            conversation['through'] = through
+            conversation['turns'] = [turn for turn in conversation['turns'] if turn[0] > through]
+
+    def delete(self, conversation_id):
+        with self._lock:
+            self._conversations.pop(conversation_id, None)
+
+    def gc(self, max_idle):
+        cutoff = time.time() - max_idle
+        with self._lock:
+            expired = [key for key, conversation in self._conversations.items() if conversation['updated'] < cutoff]
+            for key in expired:
+                del self._conversations[key]
+        return len(expired)
+
+
+class SQLHistory:
+    """History in the ``conversation`` and ``chat_message`` tables of any SQLAlchemy database.
+
+    Works on the tables directly with SQLAlchemy Core so that it can be used
+    from the chat executor's threads without a Flask app context.
+    """
+
+    def __init__(self, engine):
+        from app.models import ChatMessage, Conversation
+        self.engine = engine
+        self.conversations = Conversation.__table__
+        self.messages = ChatMessage.__table__
+
+    def create_tables(self):
+        self.conversations.create(bind=self.engine, checkfirst=True)
+        self.messages.create(bind=self.engine, checkfirst=True)
+
+    def _insert_conversation(self, conn, conversation_id, user_id, now):
+        conn.execute(self.conversations.insert().values(id=conversation_id, user_id=user_id, summary='',
+                                                        summarized_through=0, created_at=now, updated_at=now))
+
+    def start(self, conversation_id, user_id=None):
+        with self.engine.begin() as conn:
+            found = conn.execute(select(self.conversations.c.id)
+                                 .where(self.conversations.c.id == conversation_id)).first()
+            if found is None:
+                self._insert_conversation(conn, conversation_id, user_id, datetime.utcnow())
+
+    def append(self, conversation_id, question, answer):
+        now = datetime.utcnow()
+        with self.engine.begin() as conn:
+            touched = conn.execute(self.conversations.update()
+                                   .where(self.conversations.c.id == conversation_id)
+                                   .values(updated_at=now)).rowcount
+            if not touched:
+                self._insert_conversation(conn, conversation_id, None, now)
+            result = conn.execute(self.messages.insert().values(conversation_id=conversation_id, question=question,
+                                                                answer=answer, created_at=now))
+            return result.inserted_primary_key[0]
+
+    def load(self, conversation_id, limit):
+        conversations, messages = self.conversations.c, self.messages.c
+        with self.engine.connect() as conn:
+            row = conn.execute(select(conversations.summary, conversations.summarized_through)
+                               .where(conversations.id == conversation_id)).first()
+            if row is None:
+                return '', 0, []
+            turns = conn.execute(select(messages.id, messages.question, messages.answer)
+                                 .where(messages.conversation_id == conversation_id,
+                                        messages.id > row.summarized_through)
+                                 .order_by(messages.id.desc())
+                                 .limit(limit)).all()
+        return row.summary, row.summarized_through, [tuple(turn) for turn in reversed(turns)]
+
+    def fold(self, conversation_id, summary, through):
+        with self.engine.begin() as conn:
+            folded = conn.execute(self.conversations.update()
+                                  .where(self.conversations.c.id == conversation_id,
+                                         self.conversations.c.summarized_through < through)
+                                  .values(summary=summary, summarized_through=through)).rowcount
+            if folded:
+                # Folded turns live on only in the summary
+                conn.execute(self.messages.delete().where(self.messages.c.conversation_id == conversation_id,
+                                                          self.messages.c.id <= through))
+
+    def delete(self, conversation_id):
+        with self.engine.begin() as conn:
+            conn.execute(self.messages.delete().where(self.messages.c.conversation_id == conversation_id))
+            conn.execute(self.conversations.delete().where(self.conversations.c.id == conversation_id))
+
+    def gc(self, max_idle):
+        cutoff = datetime.utcnow() - timedelta(seconds=max_idle)
+        expired = select(self.conversations.c.id).where(self.conversations.c.updated_at < cutoff)
+        with self.engine.begin() as conn:
+            conn.execute(self.messages.delete().where(self.messages.c.conversation_id.in_(expired)))
+            return conn.execute(self.conversations.delete().where(self.conversations.c.updated_at < cutoff)).rowcount
+
+
+class RedisHistory:
+    """History in Redis, shared by every worker; idle conversations expire on their own."""
+
+    def __init__(self, client, ttl):
+        self.client = client
+        self.ttl = ttl
+
+    def _keys(self, conversation_id):
+        return f"chat:{conversation_id}:meta", f"chat:{conversation_id}:turns"
+
+    def start(self, conversation_id, user_id=None):
+        meta, _ = self._keys(conversation_id)
+        pipe = self.client.pipeline()
+        if user_id is not None:
+            pipe.hset(meta, 'user_id', user_id)
+        pipe.hsetnx(meta, 'through', 0)
+        pipe.expire(meta, self.ttl)
+        pipe.execute()
+
+    def append(self, conversation_id, question, answer):
+        meta, turns = self._keys(conversation_id)
+        message_id = self.client.hincrby(meta, 'seq', 1)
+        pipe = self.client.pipeline()
+        pipe.rpush(turns, json.dumps([message_id, question, answer]))
+        pipe.expire(meta, self.ttl)
+        pipe.expire(turns, self.ttl)
+        pipe.execute()
+        return message_id
+
+    def load(self, conversation_id, limit):
+        meta, turns = self._keys(conversation_id)
+        pipe = self.client.pipeline()
+        pipe.hmget(meta, 'summary', 'through')
+        pipe.lrange(turns, -limit if limit is not None else 0, -1)
+        (summary, through), raw = pipe.execute()
+        through = int(through or 0)
+        loaded = [tuple(json.loads(turn)) for turn in raw]
+        return summary or '', through, [turn for turn in loaded if turn[0] > through]
+
+    def fold(self, conversation_id, summary, through):
+        meta, turns = self._keys(conversation_id)
+        if int(self.client.hget(meta, 'through') or 0) >= through:
+            return
+        folded = sum(1 for turn in self.client.lrange(turns, 0, -1) if json.loads(turn)[0] <= through)
+        pipe = self.client.pipeline()
+        pipe.hset(meta, mapping={'summary': summary, 'through': through})
+        pipe.ltrim(turns, folded, -1)
+        pipe.execute()
+
+    def delete(self, conversation_id):
+        self.client.delete(*self._keys(conversation_id))
+
+    def gc(self, max_idle):
+        # Keys carry a TTL, so Redis drops idle conversations itself
+        return 0
+
+
+def make_history(backend, engine=None, redis_url=None, ttl=None):
+    if backend == 'memory':
+        return MemoryHistory()
+    if backend == 'redis':
+        import redis
+        return RedisHistory(redis.Redis.from_url(redis_url, decode_responses=True), ttl)
+    if backend == 'sql':
+        if engine is None:
+            raise RuntimeError('The sql chat history backend needs an engine; call memory_store.init_app(app)')
+        # The tables come from the migrations (flask db upgrade)
+        return SQLHistory(engine)
+    raise ValueError(f"Unknown chat history backend {backend!r}")
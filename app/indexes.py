@@ -0,0 +1,270 @@
+"""Versioned vector store directories and hot reloading of the index being served.
+
+    vectorstore/db_faiss/CURRENT            name of the live version
+    vectorstore/db_faiss/versions/<name>/   index.faiss, chunks.sqlite, bm25.*, manifest.json
+                                            RETIRED, written when CURRENT moves away from it
+
+``app.ingest`` writes each update as a new version and then repoints
+``CURRENT``. Every process notices the new pointer, loads that version in the
+background and swaps it in once it is ready. A store without ``CURRENT`` that
+has a ``v1/`` directory, as deployments before versioning did, adopts it as
+its first version (see ``adopt``); otherwise the files directly in the root
+are served as is.
+"""
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = 'CURRENT'
+RETIRED_FILE = 'RETIRED'
+VERSIONS_DIR = 'versions'
+LEGACY = 'legacy'
+# The version directory stores had next to their live files before versioning
+ADOPTED = 'v1'
+
+Loaded = namedtuple('Loaded', 'version path reranker loaded_at load_seconds')
+
+
+def versions(root):
+    """Names of the complete versions under ``root``, oldest first."""
+    path = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(path):
+        return []
+    return sorted(name for name in os.listdir(path)
+                  if not name.startswith('.') and os.path.isdir(os.path.join(path, name)))
+
+
+def current_version(root):
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def version_path(root, version=None):
+    """Directory of ``version``, by default the current one (the root itself for a legacy store)."""
+    version = version or current_version(root)
+    if version is None or version == LEGACY:
+        return root
+    return os.path.join(root, VERSIONS_DIR, version)
+
+
+def new_version(root):
+    """A fresh, sortable version name and a scratch directory to build it in."""
+    name = time.strftime('%Y%m%d-%H%M%S')
+    taken = set(versions(root))
+    suffix = 1
+    while (f'{name}-{suffix}' if suffix > 1 else name) in taken:
+        suffix += 1
+    name = f'{name}-{suffix}' if suffix > 1 else name
+    tmp_path = os.path.join(root, VERSIONS_DIR, f'.{name}.tmp')
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    return name, tmp_path
+
+
+def set_current(root, version):
+    if version != LEGACY and version not in versions(root):
+        raise ValueError(f"No index version {version!r} under {root}")
+    previous = current_version(root)
+    # Written next to the pointer and renamed over it, so readers see the old or the new name
+    tmp = os.path.join(root, f'.{CURRENT_FILE}.{os.getpid()}.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(version + '\n')
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+    if previous not in (None, LEGACY, version) and previous in versions(root):
+        # Processes go on serving it until their next poll; prune waits for that
+        with open(os.path.join(version_path(root, previous), RETIRED_FILE), 'w', encoding='utf-8') as f:
+            f.write(f'{time.time()}\n')
+
+
+def adopt(root):
+    """Make ``<root>/v1`` the first version of a store that has no ``CURRENT`` yet.
+
+    Its chunks are converted from the pickled docstore to ``chunks.sqlite``
+    and a BM25 index is built, in a scratch directory that is then renamed to
+    ``versions/v1``, so processes that race to do this on first load end up
+    with a single copy. ``<root>/v1`` itself is left untouched, and the files
+    in the root stay available as the ``legacy`` version. Returns True if
+    this call made it current.
+    """
+    source = os.path.join(root, ADOPTED)
+    if current_version(root) is not None or not os.path.isdir(source):
+        return False
+    target = version_path(root, ADOPTED)
+    if not os.path.isdir(target):
+        from app.lexical import BM25Index
+        from app.vectorstore import CHUNKS_FILE, INDEX_FILE, chunk_texts, convert
+        tmp_path = os.path.join(root, VERSIONS_DIR, f'.{ADOPTED}.{os.getpid()}.tmp')
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        shutil.copyfile(os.path.join(source, INDEX_FILE), os.path.join(tmp_path, INDEX_FILE))
+        if os.path.exists(os.path.join(source, CHUNKS_FILE)):
+            shutil.copyfile(os.path.join(source, CHUNKS_FILE), os.path.join(tmp_path, CHUNKS_FILE))
+        else:
+            convert(source, tmp_path)
+        BM25Index.build(chunk_texts(os.path.join(tmp_path, CHUNKS_FILE))).save(tmp_path)
+        try:
+            os.rename(tmp_path, target)
+        except OSError:
+            # Another process adopted it first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+    if current_version(root) is not None:
+        return False
+    set_current(root, ADOPTED)
+    logger.info('Adopted %s as index version %s', source, ADOPTED)
+    return True
+
+
+def retired_at(root, version):
+    """When ``version`` stopped being current, or None if it is current or never was."""
+    try:
+        with open(os.path.join(version_path(root, version), RETIRED_FILE), encoding='utf-8') as f:
+            return float(f.read())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def publish(root, version, tmp_path, keep, grace=600):
+    """Move a finished build into place, make it current and prune old versions."""
+    previous = current_version(root)
+    os.rename(tmp_path, version_path(root, version))
+    set_current(root, version)
+    prune(root, keep, grace, protect=(previous,))
+
+
+def prune(root, keep, grace=600, protect=()):
+    """Delete all but the ``keep`` newest versions.
+
+    The current version and those in ``protect`` are always kept, and so is
+    any version that stopped being current less than ``grace`` seconds ago:
+    processes that have not polled ``CURRENT`` since may still serve it.
+    """
+    current = current_version(root)
+    names = versions(root)
+    for name in names[:max(0, len(names) - keep)]:
+        if name == current or name in protect:
+            continue
+        retired = retired_at(root, name)
+        if retired is not None and time.time() - retired < grace:
+            continue
+        shutil.rmtree(version_path(root, name), ignore_errors=True)
+
+
+class IndexManager:
+    """The retrieval index a process serves from, swapped without a restart.
+
+    ``build(path)`` returns a ready-to-use ``Reranker`` for a store directory.
+    ``poll`` is cheap enough to call on every request: at most every
+    ``poll_interval`` seconds it reads ``CURRENT`` and, when that names a
+    version other than the one being served, loads it on a background thread.
+    Requests keep using the old index until the new one is loaded and warmed
+    up; the swap is a single reference assignment. The version served before
+    stays loaded so that ``rollback`` is instant.
+    """
+
+    def __init__(self, root, build, poll_interval=10):
+        self.root = root
+        self.build = build
+        self.poll_interval = poll_interval
+        self.active = None
+        self.previous = None
+        self.loading = None
+        self.error = None
+        self._failed = None
+        self._last_poll = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self.active.version
+
+    def retrieve(self, question, vector, expansion=''):
+        return self.active.reranker.retrieve(question, vector, expansion=expansion)
+
+    def load(self, version=None):
+        """Load ``version`` (default: the current one) on this thread and serve it."""
+        if version is None:
+            adopt(self.root)
+        version = version or current_version(self.root) or LEGACY
+        start = time.perf_counter()
+        reranker = self.build(version_path(self.root, version))
+        loaded = Loaded(version, version_path(self.root, version), reranker, time.time(),
+                        time.perf_counter() - start)
+        with self._lock:
+            if self.active is not None and self.active.version != version:
+                self.previous = self.active
+            self.active = loaded
+        logger.info('Serving index version %s (loaded in %.1fs)', version, loaded.load_seconds)
+        return loaded
+
+    def poll(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_poll < self.poll_interval:
+                return
+            self._last_poll = now
+        version = current_version(self.root) or LEGACY
+        # A version that failed to load is only retried through an explicit reload
+        if self.active is not None and version not in (self.active.version, self._failed):
+            self.reload(version)
+
+    def reload(self, version=None):
+        """Start loading ``version`` in the background; False if a load is already running."""
+        version = version or current_version(self.root) or LEGACY
+        with self._lock:
+            if self.loading is not None:
+                return False
+            self.loading = version
+        threading.Thread(target=self._reload, args=(version,), name='index-reload', daemon=True).start()
+        return True
+
+    def _reload(self, version):
+        try:
+            if self.previous is not None and self.previous.version == version:
+                self._swap()
+            else:
+                self.load(version)
+            self.error = self._failed = None
+        except Exception as exc:
+            logger.exception('Loading index version %s failed', version)
+            self.error = f'{version}: {exc}'
+            self._failed = version
+        finally:
+            with self._lock:
+                self.loading = None
+
+    def _swap(self):
+        with self._lock:
+            self.active, self.previous = self.previous, self.active
+        logger.info('Serving index version %s again', self.active.version)
+
+    def rollback(self):
+        """Point ``CURRENT`` back at the previously served version and serve it here right away."""
+        if self.previous is None:
+            raise ValueError('No previous index version is loaded')
+        set_current(self.root, self.previous.version)
+        self._swap()
+        return self.active.version
+
+    def status(self):
+        def describe(loaded):
+            if loaded is None:
+                return None
+            return {'version': loaded.version, 'path': loaded.path,
+                    'loaded_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(loaded.loaded_at)),
+                    'load_seconds': round(loaded.load_seconds, 3)}
+        return {
+            'active': describe(self.active),
+            'previous': describe(self.previous),
+            'current_pointer': current_version(self.root) or LEGACY,
+            'loading': self.loading,
+            'error': self.error,
+            'available': versions(self.root),
+        }
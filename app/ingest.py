@@ -1,27 +1,294 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+
+import faiss
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
-from langchain_community.document_loaders import TextLoader, DirectoryLoader
+from langchain_community.document_loaders import TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter 
 
+from app.config import Config
+from app.indexes import adopt, new_version, publish, version_path
+from app.lexical import BM25_MATRIX_FILE, BM25_VOCAB_FILE, BM25Index
+from app.passages import NearDuplicates, fingerprint
+from app.vectorstore import (CHUNKS_FILE, DOCSTORE_FILE, INDEX_FILE, INDEX_TYPES, SEARCH_INDEX_FILE,
+                             build_search_index, chunk_texts, index_vectors, load_store_for_update, save_store)
+
 DATA_PATH = 'data/'
 DB_FAISS_PATH = 'vectorstore/db_faiss'
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+EMBED_BATCH_SIZE = 64
+EMBED_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+MANIFEST_FILE = 'manifest.json'
+# Files that make up a store
+STORE_FILES = (INDEX_FILE, CHUNKS_FILE, DOCSTORE_FILE, SEARCH_INDEX_FILE, BM25_MATRIX_FILE, BM25_VOCAB_FILE,
+               MANIFEST_FILE)
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_ids(source, texts):
+    # Content-derived ids, so an unchanged chunk keeps its id (and its vector)
+    # across runs even when other parts of the same file change
+    ids, seen = [], {}
+    for text in texts:
+        chunk_id = hashlib.sha256(f"{source}\n{text}".encode('utf-8')).hexdigest()[:32]
+        seen[chunk_id] = seen.get(chunk_id, 0) + 1
+        ids.append(chunk_id if seen[chunk_id] == 1 else f"{chunk_id}-{seen[chunk_id]}")
+    return ids
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+_worker_embeddings = None
+
+
+def _init_worker(model_name):
+    global _worker_embeddings
+    # Several workers share the CPU, so keep torch from oversubscribing it
+    import torch
+    torch.set_num_threads(1)
+    _worker_embeddings = HuggingFaceEmbeddings(model_name=model_name)
+
+
+def _embed_batch(texts):
+    return _worker_embeddings.embed_documents(texts)
+
+
+def embed_batches(batches, embeddings, workers):
+    """Yield ``(batch, vectors)`` in order, embedding on ``workers`` processes.
+
+    At most two batches per worker are in flight, so memory stays bounded no
+    matter how many chunks the ``batches`` generator produces.
+    """
+    if workers <= 1:
+        for batch in batches:
+            yield batch, embeddings.embed_documents([text for _, text, _ in batch])
+        return
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                             initargs=(MODEL_NAME,)) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append((batch, pool.submit(_embed_batch, [text for _, text, _ in batch])))
+            if len(pending) >= workers * 2:
+                batch, future = pending.popleft()
+                yield batch, future.result()
+        while pending:
+            batch, future = pending.popleft()
+            yield batch, future.result()
+
+
+def load_manifest(db_path):
+    try:
+        with open(os.path.join(db_path, MANIFEST_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def stored_fingerprint(db, chunk_id):
+    doc = db.docstore.search(chunk_id)
+    return doc.metadata.get('simhash') or fingerprint(doc.page_content)
+
+
+def changed_chunks(data_path, old_files, files, stats, text_splitter, db=None, moved=None):
+    """Yield ``(id, text, metadata)`` for chunks that are not indexed yet.
+
+    Files are read and split one at a time. New chunks that are near
+    duplicates of a chunk already kept (see app.passages) are left out.
+    ``files`` is filled in with the manifest entry of every file seen,
+    unchanged ones included, listing only the chunks that are indexed.
+    Indexed chunks of a changed file keep their vector, but their offset in
+    the file may have moved: ``moved`` is filled in with their new metadata.
+    """
+    hashes = {}
+    for name in sorted(os.listdir(data_path)):
+        path = os.path.join(data_path, name)
+        if name.endswith('.txt') and os.path.isfile(path):
+            hashes[path] = file_hash(path)
+
+    duplicates = NearDuplicates()
+    # Chunks of unchanged files stay in the index, so new chunks are checked against them
+    for path, digest in hashes.items():
+        previous = old_files.get(path)
+        if previous and previous['hash'] == digest:
+            for chunk_id in previous['chunks']:
+                duplicates.add(stored_fingerprint(db, chunk_id), chunk_id)
+
+    for path, digest in hashes.items():
+        stats['files'] += 1
+        previous = old_files.get(path)
+        if previous and previous['hash'] == digest:
+            files[path] = previous
+            continue
+
+        stats['files_changed'] += 1
+        documents = TextLoader(path, autodetect_encoding=True).load()
+        chunks = text_splitter.split_documents(documents)
+        ids = chunk_ids(path, [chunk.page_content for chunk in chunks])
+        kept = []
+        files[path] = {'hash': digest, 'chunks': kept}
+        known = set(previous['chunks']) if previous else set()
+        for chunk_id, chunk in zip(ids, chunks):
+            value = fingerprint(chunk.page_content)
+            # start_index lets app.passages join neighbouring chunks at query time
+            metadata = {'source': path, 'start_index': chunk.metadata['start_index'], 'simhash': value}
+            if chunk_id not in known:
+                if duplicates.find(value) is not None:
+                    stats['duplicates'] += 1
+                    continue
+                yield chunk_id, chunk.page_content, metadata
+            elif moved is not None:
+                moved[chunk_id] = metadata
+            duplicates.add(value, chunk_id)
+            kept.append(chunk_id)
+
 
 # Create vector database
-def create_vector_db():
-    loader = DirectoryLoader(DATA_PATH,
-                             glob='*.txt',
-                             loader_cls=TextLoader,
-                             loader_kwargs={'autodetect_encoding': True})
+def create_vector_db(data_path=DATA_PATH, db_path=DB_FAISS_PATH, full=False,
+                     batch_size=EMBED_BATCH_SIZE, workers=EMBED_WORKERS, index_type=None,
+                     keep_versions=Config.INDEX_KEEP_VERSIONS):
+    """Bring the FAISS index at ``db_path`` in line with the files under ``data_path``.
+
+    Only files whose content hash changed since the last run are re-split, and
+    only chunks that were not already indexed are embedded, ``batch_size`` at a
+    time across ``workers`` processes. Chunks of removed or edited files that no
+    longer exist are deleted. ``full`` forces a rebuild. Unless ``index_type``
+    (default ``Config.FAISS_INDEX_TYPE``) is 'flat', an approximate search index
+    is trained and built from the updated vectors. Any change is written as a
+    new version under ``db_path`` and made current (see app.indexes), keeping
+    the ``keep_versions`` newest versions. Returns a dict of counters for reporting.
+
+    An update holds the vectors and the chunk ids in memory, plus the new
+    chunks; the texts of the rest are read back from ``chunks.sqlite`` in
+    batches. A full rebuild holds every chunk.
+    """
+    index_type = index_type or Config.FAISS_INDEX_TYPE
+    search = {'type': index_type, 'nlist': Config.FAISS_NLIST, 'hnsw_m': Config.FAISS_HNSW_M,
+              'pq_m': Config.FAISS_PQ_M}
+    start = time.perf_counter()
+    embeddings = HuggingFaceEmbeddings(model_name=MODEL_NAME)
+    chunking = {'size': Config.CHUNK_SIZE, 'overlap': Config.CHUNK_OVERLAP}
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=Config.CHUNK_SIZE,
+                                                   chunk_overlap=Config.CHUNK_OVERLAP,
+                                                   add_start_index=True)
+
+    adopt(db_path)
+    current_path = version_path(db_path)
+    manifest = None if full else load_manifest(current_path)
+    if manifest is not None and not os.path.exists(os.path.join(current_path, CHUNKS_FILE)):
+        # Written before chunks moved out of index.pkl; rebuild once
+        manifest = None
+    if manifest is not None and manifest.get('chunking') != chunking:
+        # Every chunk changes with the splitter settings
+        manifest = None
+    db = None
+    if manifest is not None:
+        db = load_store_for_update(current_path, embeddings)
+    old_files = manifest['files'] if manifest else {}
+
+    stats = {'files': 0, 'files_changed': 0, 'chunks': 0, 'reused': 0, 'embedded': 0, 'deleted': 0,
+             'duplicates': 0}
+    files, moved = {}, {}
+    chunks = changed_chunks(data_path, old_files, files, stats, text_splitter, db, moved)
+    embed_start = time.perf_counter()
+    for batch, vectors in embed_batches(batched(chunks, batch_size), embeddings, workers):
+        ids = [chunk_id for chunk_id, _, _ in batch]
+        text_embeddings = [(text, vector) for (_, text, _), vector in zip(batch, vectors)]
+        metadatas = [metadata for _, _, metadata in batch]
+        if db is None:
+            db = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids)
+        else:
+            db.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        stats['embedded'] += len(batch)
+    embed_seconds = time.perf_counter() - embed_start
+
+    keep = {chunk_id for entry in files.values() for chunk_id in entry['chunks']}
+    stale = [chunk_id for entry in old_files.values() for chunk_id in entry['chunks'] if chunk_id not in keep]
+    stats['chunks'] = len(keep)
+    stats['reused'] = len(keep) - stats['embedded']
+    stats['deleted'] = len(stale)
+    stats['chunks_per_second'] = stats['embedded'] / embed_seconds if embed_seconds and stats['embedded'] else 0.0
+
+    if db is not None and stale:
+        db.delete(stale)
+    relocated = 0
+    for chunk_id, metadata in moved.items():
+        if db.docstore.search(chunk_id).metadata != metadata:
+            db.docstore.set_metadata(chunk_id, metadata)
+            relocated += 1
+
+    changed = (stats['embedded'] or stale or relocated or manifest is None or manifest.get('search') != search
+               or not BM25Index.exists(current_path))
+    if db is not None and changed:
+        # Built in a scratch directory and published as a whole, so readers
+        # never see a half-written store
+        version, tmp_path = new_version(db_path)
+        save_store(db, tmp_path)
+        if index_type != 'flat':
+            build_start = time.perf_counter()
+            index = build_search_index(index_vectors(db.index), index_type,
+                                       nlist=Config.FAISS_NLIST, hnsw_m=Config.FAISS_HNSW_M,
+                                       pq_m=Config.FAISS_PQ_M, train_sample=Config.FAISS_TRAIN_SAMPLE)
+            faiss.write_index(index, os.path.join(tmp_path, SEARCH_INDEX_FILE))
+            stats['index_build_seconds'] = time.perf_counter() - build_start
+        # Rebuilt from scratch each time: it needs no embedding and takes well under a second.
+        # The texts are streamed back from the chunks file just written
+        BM25Index.build(chunk_texts(os.path.join(tmp_path, CHUNKS_FILE))).save(tmp_path)
+        with open(os.path.join(tmp_path, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'files': files, 'search': search, 'chunking': chunking}, f)
+        publish(db_path, version, tmp_path, keep_versions, Config.INDEX_PRUNE_GRACE)
+        current_path = version_path(db_path, version)
+        stats['version'] = version
+
+    stats['index_bytes'] = sum(os.path.getsize(os.path.join(current_path, name)) for name in STORE_FILES
+                               if os.path.exists(os.path.join(current_path, name)))
 
-    documents = loader.load()
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=512,
-                                                   chunk_overlap=256)
-    texts = text_splitter.split_documents(documents)
+    stats['seconds'] = time.perf_counter() - start
+    return stats
 
-    embeddings = HuggingFaceEmbeddings(model_name='sentence-transformers/all-MiniLM-L6-v2')
 
-    db = FAISS.from_documents(texts, embeddings)
-    db.save_local(DB_FAISS_PATH)
 if __name__ == "__main__":
-    create_vector_db()
+    parser = argparse.ArgumentParser(description='Build or update the FAISS index from the text corpus')
+    parser.add_argument('--data', default=DATA_PATH, help='directory with the .txt corpus')
+    parser.add_argument('--db', default=DB_FAISS_PATH, help='vector store directory')
+    parser.add_argument('--full', action='store_true', help='ignore the manifest and re-embed everything')
+    parser.add_argument('--batch-size', type=int, default=EMBED_BATCH_SIZE, help='chunks per embedding batch')
+    parser.add_argument('--workers', type=int, default=EMBED_WORKERS, help='embedding processes (1 = in-process)')
+    parser.add_argument('--index-type', choices=INDEX_TYPES, default=Config.FAISS_INDEX_TYPE,
+                        help='search index to build next to the exact one')
+    parser.add_argument('--keep', type=int, default=Config.INDEX_KEEP_VERSIONS, help='index versions to keep')
+    args = parser.parse_args()
 
+    stats = create_vector_db(args.data, args.db, full=args.full,
+                             batch_size=args.batch_size, workers=args.workers, index_type=args.index_type,
+                             keep_versions=args.keep)
+    print(f"files: {stats['files']} ({stats['files_changed']} changed)")
+    print(f"chunks: {stats['chunks']} (reused {stats['reused']}, embedded {stats['embedded']}, deleted {stats['deleted']}, "
+          f"near-duplicates skipped {stats['duplicates']})")
+    print(f"index size: {stats['index_bytes'] / 1e6:.1f} MB")
+    print(f"version: {stats.get('version', 'unchanged')}")
+    print(f"throughput: {stats['chunks_per_second']:.1f} chunks/s")
+    if 'index_build_seconds' in stats:
+        print(f"{args.index_type} index build: {stats['index_build_seconds']:.1f}s")
+    print(f"wall time: {stats['seconds']:.1f}s")
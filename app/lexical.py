@@ -0,0 +1,94 @@
+import json
+import os
+import re
+
+import numpy as np
+from scipy import sparse
+
+BM25_MATRIX_FILE = 'bm25.npz'
+BM25_VOCAB_FILE = 'bm25_vocab.json'
+
+# Keeps tokens such as "hba1c", "sglt2" and "7.5" intact
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+STOPWORDS = frozenset("""a an and are as at be but by can do does for from has have how i if in into is it its
+me my of on or our so than that the their them then there these they this to was we were what when where
+which who why will with you your""".split())
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """BM25 over the chunks of the vector store, aligned with the FAISS positions.
+
+    The full BM25 weight of every (chunk, term) pair is computed at build time
+    and stored as a CSC matrix, so scoring a query is just summing the columns
+    of its terms.
+    """
+
+    def __init__(self, matrix, vocabulary):
+        self.matrix = matrix
+        self.vocabulary = vocabulary
+
+    @classmethod
+    def build(cls, texts, k1=1.5, b=0.75):
+        """Index ``texts``, any iterable of chunk texts in position order."""
+        vocabulary, rows, cols, counts, lengths = {}, [], [], [], []
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            terms, tf = np.unique([vocabulary.setdefault(token, len(vocabulary)) for token in tokens],
+                                  return_counts=True)
+            rows.extend([row] * len(terms))
+            cols.extend(terms)
+            counts.extend(tf)
+
+        lengths = np.asarray(lengths, dtype='float32')
+        tf = sparse.csr_matrix((np.asarray(counts, dtype='float32'), (rows, cols)),
+                               shape=(len(lengths), len(vocabulary)))
+        df = np.bincount(tf.indices, minlength=len(vocabulary))
+        idf = np.log(1 + (len(lengths) - df + 0.5) / (df + 0.5)).astype('float32')
+        avgdl = lengths.mean() if len(lengths) else 1.0
+        norm = k1 * (1 - b + b * lengths / avgdl)
+        # tf * (k1 + 1) / (tf + norm(doc)), applied to the stored non-zeros only
+        doc_norm = np.repeat(norm, np.diff(tf.indptr))
+        tf.data = tf.data * (k1 + 1) / (tf.data + doc_norm) * idf[tf.indices]
+        return cls(tf.tocsc(), vocabulary)
+
+    def save(self, db_path):
+        sparse.save_npz(os.path.join(db_path, BM25_MATRIX_FILE), self.matrix)
+        with open(os.path.join(db_path, BM25_VOCAB_FILE), 'w', encoding='utf-8') as f:
+            json.dump(self.vocabulary, f)
+
+    @classmethod
+    def load(cls, db_path):
+        matrix = sparse.load_npz(os.path.join(db_path, BM25_MATRIX_FILE)).tocsc()
+        with open(os.path.join(db_path, BM25_VOCAB_FILE), encoding='utf-8') as f:
+            vocabulary = json.load(f)
+        return cls(matrix, vocabulary)
+
+    @classmethod
+    def exists(cls, db_path):
+        return os.path.exists(os.path.join(db_path, BM25_MATRIX_FILE))
+
+    def search(self, query, k):
+        """Return up to ``k`` chunk positions, best first."""
+        cols = [self.vocabulary[token] for token in set(tokenize(query)) if token in self.vocabulary]
+        if not cols:
+            return []
+        scores = np.asarray(self.matrix[:, cols].sum(axis=1)).ravel()
+        k = min(k, np.count_nonzero(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])].tolist()
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse several best-first lists of positions; returns positions best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, position in enumerate(ranking):
+            scores[position] = scores.get(position, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -1,53 +1,502 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from app.config import Config
+from app.memory import memory_store
+from app.concurrency import retrieval_pool
+from app.metrics import annotate, gauge, inc, observe, span, COUNT_BUCKETS
+from app.passages import pack
+from app.profile import profile_cache
 from app.prompt import prompt_template, question_categorize_prompt_template, conversation_prompt_template
-from langchain.prompts import PromptTemplate
-from langchain_groq import ChatGroq
-from langchain_community.vectorstores import FAISS
-from langchain.chains import RetrievalQA, LLMChain
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
+from app.router import DIABETES
 
 DB_FAISS_PATH = 'vectorstore/db_faiss'
-PROMPT=PromptTemplate(template=prompt_template, input_variables=["chat_history", "context", "question"])
-CATEGORIZE_PROMPT=PromptTemplate(template=question_categorize_prompt_template, input_variables=["chat_history", "question"])
-CONVERSATIONAL_PROMPT=PromptTemplate(template=conversation_prompt_template, input_variables=["chat_history", "question"])
-
-embeddings = HuggingFaceEmbeddings(model_name='sentence-transformers/all-MiniLM-L6-v2')
-llm = ChatGroq(
-    groq_api_key='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',
-    model_name='llama3-8b-8192'
-)
-
-memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-db = FAISS.load_local(DB_FAISS_PATH, embeddings, allow_dangerous_deserialization=True)
-qa_chain = ConversationalRetrievalChain.from_llm(llm=llm,
-                                    chain_type='map_rerank',
-                                    retriever=db.as_retriever(search_kwargs={'k': 3}),
-                                    memory=memory,
-                                    # combine_docs_chain_kwargs={'prompt': PROMPT},
-                                    verbose=True
-                                    )
-
-# Chain for categorizing a user query into General Statement and Medical-Related question
-cuq_chain = LLMChain(prompt=CATEGORIZE_PROMPT, llm=llm, verbose=True)
-
-# Chain for answering based on the chat history only
-conv_chain = LLMChain(prompt=CONVERSATIONAL_PROMPT, llm=llm, memory=memory, verbose=True)
-
-def get_user_query_response(question, chat_history):
-    cat = cuq_chain.run({'question': question, 'chat_history': chat_history})
-    print(cat)
-    if cat.strip() == 'diabetes':
-        # print(qa_chain({'question': question, 'chat_history': chat_history}))
-        return qa_chain({'question': question, 'chat_history': chat_history})['answer']
-    else:
-        # print(conv_chain({'question': question, 'chat_history': chat_history}))
-        return conv_chain({'question': question, 'chat_history': chat_history})['text']
-
-# query = "What is type 2 diabetes?"
-# response = qa_chain({'query': query})
-# print(response)
-
-# query = "What to do if I've CYSTIC FIBROSIS?"
-# response = qa_chain({'query': query})
-# print(response)
\ No newline at end of file
+
+logger = logging.getLogger(__name__)
+
+
+class LLMService:
+    """Embedding model, vector index and chains for the chat endpoint.
+
+    Everything here is expensive to build (torch, the sentence-transformers
+    model, FAISS deserialization), so it is only created on first use through
+    ``get_service`` and then shared by every request in the process.
+    """
+
+    def __init__(self, llm=None):
+        # A chat model passed in here is used instead of Groq (e.g. by app.benchmark_chat)
+        self.llm = llm
+        self.timings = {}
+
+    @contextmanager
+    def _timed(self, component):
+        start = time.perf_counter()
+        yield
+        self.timings[component] = time.perf_counter() - start
+
+    def load(self):
+        # Heavy imports are kept here so that importing app.llm stays cheap
+        with self._timed('imports'):
+            from langchain.prompts import PromptTemplate
+            from langchain_groq import ChatGroq
+            from langchain.chains import LLMChain
+            from app.embeddings import EmbeddingService, load_model
+            from langchain.chains import ConversationalRetrievalChain
+            from langchain.chains.question_answering import map_rerank_prompt
+            from langchain.memory.prompt import SUMMARY_PROMPT
+            from app import gateway
+            from app.cache import SemanticCache
+            from app.indexes import IndexManager
+            from app.rerank import RerankRetriever
+            from app.router import QueryRouter
+
+        # {profile} is the user's profile block from profile_prompt, or empty
+        self.PROMPT = PromptTemplate(template=prompt_template, input_variables=["profile", "chat_history", "context", "question"])
+        self.CATEGORIZE_PROMPT = PromptTemplate(template=question_categorize_prompt_template, input_variables=["chat_history", "question"])
+        self.CONVERSATIONAL_PROMPT = PromptTemplate(template=conversation_prompt_template, input_variables=["profile", "chat_history", "question"])
+        # LangChain's map_rerank prompt with the profile in front; the chain passes "profile" through from its inputs
+        self.MAP_RERANK_PROMPT = PromptTemplate(template="{profile}" + map_rerank_prompt.prompt_template,
+                                                input_variables=["profile", "context", "question"],
+                                                output_parser=map_rerank_prompt.output_parser)
+        self.SUMMARY_PROMPT = SUMMARY_PROMPT
+
+        with self._timed('embeddings'):
+            wait_ms = Config.EMBEDDING_BATCH_WAIT_MS
+            self.embeddings = EmbeddingService(load_model(Config.EMBEDDING_BACKEND),
+                                               batch_size=Config.EMBEDDING_BATCH_SIZE,
+                                               max_wait=None if wait_ms == 'off' else float(wait_ms) / 1000,
+                                               cache_size=Config.EMBEDDING_CACHE_SIZE)
+            # The first forward pass is noticeably slower than the rest
+            self.embeddings.embed_documents(['warm up'])
+            gauge('embedding_cache_hits', lambda: self.embeddings.hits)
+            gauge('embedding_cache_misses', lambda: self.embeddings.misses)
+            gauge('embedding_cache_hit_ratio', lambda: self.embeddings.stats()['hit_rate'])
+
+        with self._timed('llm'):
+            if self.llm is None:
+                # Timeouts and retries are left to the gateway
+                self.llm = ChatGroq(
+                    groq_api_key=Config.GROQ_API_KEY,
+                    model_name=Config.GROQ_MODEL,
+                    groq_api_base=Config.GROQ_API_BASE,
+                    request_timeout=Config.LLM_TIMEOUT,
+                    max_retries=0
+                )
+            # Every chain and direct call goes through the gateway
+            self.gateway = gateway.from_config(self.llm, gateway.fallback_model(Config.LLM_FALLBACK,
+                                                                                Config.LLM_FALLBACK_MODEL))
+            self.llm = gateway.GatewayChatModel(gateway=self.gateway)
+            gauge('llm_circuit_open', lambda: int(self.gateway.primary.breaker.is_open))
+
+        with self._timed('index'):
+            # Versioned store; a new version is picked up and swapped in without a restart
+            self.indexes = IndexManager(DB_FAISS_PATH, self.open_index, poll_interval=Config.INDEX_POLL_INTERVAL)
+            self.indexes.load()
+
+        with self._timed('chains'):
+            # History is passed in per call from the session's memory window, so the
+            # chains themselves stay stateless and can be shared between users
+            retriever = RerankRetriever(reranker=self.indexes, embeddings=self.embeddings,
+                                        context_tokens=Config.CONTEXT_MAX_TOKENS)
+            self.qa_chain = ConversationalRetrievalChain.from_llm(llm=self.llm,
+                                                chain_type='map_rerank',
+                                                retriever=retriever,
+                                                combine_docs_chain_kwargs={'prompt': self.MAP_RERANK_PROMPT},
+                                                verbose=Config.CHAIN_VERBOSE
+                                                )
+
+            # Chain for categorizing a user query into General Statement and Medical-Related question
+            self.cuq_chain = LLMChain(prompt=self.CATEGORIZE_PROMPT, llm=self.llm, verbose=Config.CHAIN_VERBOSE)
+
+            # Chain for answering based on the chat history only
+            self.conv_chain = LLMChain(prompt=self.CONVERSATIONAL_PROMPT, llm=self.llm, verbose=Config.CHAIN_VERBOSE)
+
+        with self._timed('cache'):
+            # Previously answered diabetes questions, matched by embedding similarity
+            self.semantic_cache = SemanticCache(self.embeddings,
+                                                threshold=Config.SEMANTIC_CACHE_THRESHOLD,
+                                                max_size=Config.SEMANTIC_CACHE_MAX_SIZE,
+                                                ttl=Config.SEMANTIC_CACHE_TTL)
+            gauge('semantic_cache_hits', lambda: self.semantic_cache.hits)
+            gauge('semantic_cache_misses', lambda: self.semantic_cache.misses)
+
+        with self._timed('router'):
+            # Local categorizer over the same embeddings; cuq_chain is the low-confidence fallback
+            self.router = QueryRouter(self.embeddings, margin=Config.ROUTER_MARGIN)
+
+    def open_index(self, path):
+        """A warmed-up ``Reranker`` over the store at ``path``, for ``IndexManager``."""
+        from app.lexical import BM25Index
+        from app.rerank import Reranker
+        from app.vectorstore import load_store
+        db = load_store(path, self.embeddings, nprobe=Config.FAISS_NPROBE, ef_search=Config.FAISS_EF_SEARCH)
+        # BM25 catches drug names, lab units and acronyms that MiniLM matches poorly
+        lexical = BM25Index.load(path) if Config.HYBRID_SEARCH and BM25Index.exists(path) else None
+        if self.indexes.active is not None:
+            # Same settings and cross-encoder, new store
+            reranker = self.indexes.active.reranker.with_store(db, lexical)
+        else:
+            reranker = Reranker(db,
+                                k=Config.RETRIEVAL_K,
+                                fetch_k=Config.RETRIEVAL_FETCH_K,
+                                lambda_mult=Config.RETRIEVAL_MMR_LAMBDA,
+                                model_name=Config.RERANKER_MODEL,
+                                lexical=lexical)
+        # Page in the index and open the chunk store before any request uses them
+        reranker.retrieve('warm up', self.embeddings.embed_documents(['warm up'])[0])
+        return reranker
+
+    def load_history(self, session_id, user_id=None):
+        with span('history_load'):
+            window = memory_store.get(session_id)
+        with span('profile_load'):
+            profile = profile_cache.get(user_id)
+        return window, self.history_messages(window), profile
+
+    def history_messages(self, window):
+        from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+        summary, turns = window.snapshot()
+        messages = []
+        if summary:
+            messages.append(SystemMessage(content=f"Summary of the earlier conversation: {summary}"))
+        for question, answer in turns:
+            messages.extend([HumanMessage(content=question), AIMessage(content=answer)])
+        return messages
+
+    def summarizer(self, callbacks=None):
+        def summarize(summary, turns):
+            return self.llm.invoke(self._summary_prompt(summary, turns), config={'callbacks': callbacks}).content
+        return summarize
+
+    def asummarizer(self, callbacks=None):
+        async def summarize(summary, turns):
+            return (await self.llm.ainvoke(self._summary_prompt(summary, turns), config={'callbacks': callbacks})).content
+        return summarize
+
+    def _summary_prompt(self, summary, turns):
+        lines = '\n'.join(f"Human: {question}\nAI: {answer}" for question, answer in turns)
+        return self.SUMMARY_PROMPT.format(summary=summary, new_lines=lines)
+
+    def route(self, question, chat_history, vector=None):
+        """The local router's category for ``question``, or None to ask the LLM categorizer.
+
+        The router only sees the question, so follow-ups ("and the dosage?")
+        always go to the LLM, which gets the history too.
+        """
+        if not Config.ROUTER_ENABLED or chat_history:
+            return None
+        return self.router.classify(question, vector=vector)
+
+    def categorize(self, question, chat_history, vector=None, callbacks=None):
+        with span('categorize'):
+            cat = self.route(question, chat_history, vector=vector)
+            if cat is None:
+                cat = self.cuq_chain.run({'question': question, 'chat_history': chat_history}, callbacks=callbacks).strip()
+        annotate('category', cat)
+        return cat
+
+    def answer(self, question, session_id, user_id=None):
+        from langchain_core.messages import get_buffer_string
+        from app.callbacks import LLMCallCounter
+        counter = LLMCallCounter()
+        window, messages, profile = self.load_history(session_id, user_id)
+        chat_history = get_buffer_string(messages)
+
+        answer = self._answer(question, messages, chat_history, profile, callbacks=[counter])
+        if answer:
+            with span('memory_update'):
+                window.add(question, answer, summarize=self.summarizer([counter]))
+        self.record(counter)
+        return answer
+
+    async def aanswer(self, question, session_id, user_id=None):
+        """Async counterpart of ``answer`` for the shared event loop in app.concurrency.
+
+        LLM calls go through the ``ainvoke`` APIs, rate limited by the LLM
+        gateway; CPU-bound embedding and FAISS work runs in the loop's
+        thread pool so it never blocks other requests.
+        """
+        from langchain_core.messages import get_buffer_string
+        from app.callbacks import LLMCallCounter
+        loop = asyncio.get_running_loop()
+        counter = LLMCallCounter()
+        callbacks = [counter]
+        config = {'callbacks': callbacks}
+        # Reading the history is a storage round trip, so it runs off the event loop
+        window, messages, profile = await loop.run_in_executor(None, contextvars.copy_context().run,
+                                                               self.load_history, session_id, user_id)
+        chat_history = get_buffer_string(messages)
+        use_cache = self.use_cache(profile, chat_history)
+
+        # copy_context carries the request's metrics trace into the worker thread
+        vector, answer = await loop.run_in_executor(None, contextvars.copy_context().run,
+                                                    self._lookup, question, use_cache)
+        if answer is None:
+            prefetch = self.prefetch(question, chat_history, vector, profile.terms)
+            with span('categorize'):
+                cat = self.route(question, chat_history, vector=vector)
+                if cat is None:
+                    cat = (await self.cuq_chain.ainvoke({'question': question, 'chat_history': chat_history}, config=config))['text'].strip()
+            annotate('category', cat)
+            if cat == DIABETES:
+                docs = await self.aprefetched(prefetch)
+                if docs is not None:
+                    if Config.QA_STRATEGY == 'map_rerank':
+                        combine = self.qa_chain.combine_docs_chain
+                        answer = (await combine.ainvoke({'input_documents': docs, 'question': question,
+                                                         'profile': self.profile_prompt(profile)},
+                                                        config=config))[combine.output_key]
+                    else:
+                        prompt = self.PROMPT.format(profile=self.profile_prompt(profile), chat_history=chat_history,
+                                                    context=self.format_docs(docs), question=question)
+                        answer = (await self.llm.ainvoke(prompt, config=config)).content
+                elif Config.QA_STRATEGY == 'map_rerank':
+                    answer = (await self.qa_chain.ainvoke({'question': question, 'chat_history': messages,
+                                                           'profile': self.profile_prompt(profile)},
+                                                          config=dict(config, metadata=self.retrieval_metadata(profile))))['answer']
+                else:
+                    retrieval_question = question
+                    if chat_history:
+                        retrieval_question = (await self.qa_chain.question_generator.ainvoke(
+                            {'question': question, 'chat_history': chat_history}, config=config))['text']
+                    docs = await loop.run_in_executor(None, contextvars.copy_context().run,
+                                                      functools.partial(self.retrieve, retrieval_question, '',
+                                                                        vector if retrieval_question == question else None,
+                                                                        expansion=profile.terms))
+                    prompt = self.PROMPT.format(profile=self.profile_prompt(profile), chat_history=chat_history,
+                                                context=self.format_docs(docs), question=question)
+                    answer = (await self.llm.ainvoke(prompt, config=config)).content
+                if use_cache and answer:
+                    self.semantic_cache.put(question, answer, vector=vector)
+            else:
+                self.discard(prefetch)
+                answer = (await self.conv_chain.ainvoke({'question': question, 'chat_history': chat_history,
+                                                         'profile': self.profile_prompt(profile)}, config=config))['text']
+
+        if answer:
+            with span('memory_update'):
+                await window.aadd(question, answer, self.asummarizer(callbacks))
+        self.record(counter)
+        return answer
+
+    def record(self, counter):
+        observe('chat_llm_calls', counter.calls, COUNT_BUCKETS, strategy=Config.QA_STRATEGY)
+        observe('chat_answer_seconds', counter.elapsed(), strategy=Config.QA_STRATEGY)
+        logger.info('strategy=%s llm_calls=%d tokens=%d/%d latency=%.0fms', Config.QA_STRATEGY, counter.calls,
+                    counter.prompt_tokens, counter.completion_tokens, counter.elapsed() * 1000)
+
+    def stream_answer(self, question, session_id, user_id=None):
+        """Yield the answer in pieces as the chat model produces them.
+
+        map_rerank needs every candidate answer before it can pick one, so the
+        diabetes path streams a single generation over the retrieved context
+        with PROMPT instead.
+        """
+        from langchain_core.messages import get_buffer_string
+        from app.callbacks import LLMCallCounter
+        counter = LLMCallCounter()
+        callbacks = [counter]
+        window, messages, profile = self.load_history(session_id, user_id)
+        chat_history = get_buffer_string(messages)
+        use_cache = self.use_cache(profile, chat_history)
+
+        vector, cached = self._lookup(question, use_cache)
+        if cached is not None:
+            window.add(question, cached, summarize=self.summarizer(callbacks))
+            yield cached
+            return
+
+        prefetch = self.prefetch(question, chat_history, vector, profile.terms)
+        cat = self.categorize(question, chat_history, vector=vector, callbacks=callbacks)
+        if cat == DIABETES:
+            docs = self.prefetched(prefetch)
+            if docs is None:
+                docs = self.retrieve(question, chat_history, vector=vector, callbacks=callbacks, expansion=profile.terms)
+            prompt = self.PROMPT.format(profile=self.profile_prompt(profile),
+                                        chat_history=chat_history,
+                                        context=self.format_docs(docs),
+                                        question=question)
+        else:
+            self.discard(prefetch)
+            prompt = self.CONVERSATIONAL_PROMPT.format(profile=self.profile_prompt(profile), chat_history=chat_history,
+                                                       question=question)
+
+        parts = []
+        for chunk in self.llm.stream(prompt, config={'callbacks': callbacks}):
+            if chunk.content:
+                parts.append(chunk.content)
+                yield chunk.content
+        answer = ''.join(parts)
+        if answer:
+            with span('memory_update'):
+                window.add(question, answer, summarize=self.summarizer(callbacks))
+            if cat == DIABETES and use_cache:
+                self.semantic_cache.put(question, answer, vector=vector)
+        self.record(counter)
+
+    def retrieve(self, question, chat_history, vector=None, callbacks=None, expansion=''):
+        if chat_history:
+            # Same condensing step ConversationalRetrievalChain runs before retrieval
+            with span('condense_question'):
+                question = self.qa_chain.question_generator.run(question=question, chat_history=chat_history,
+                                                                callbacks=callbacks)
+            vector = None
+        if vector is None:
+            with span('embed_query'):
+                vector = self.embeddings.embed_query(question)
+        with span('retrieve'):
+            docs = self.indexes.retrieve(question, vector, expansion=expansion)
+        with span('pack_context'):
+            return pack(docs, Config.CONTEXT_MAX_TOKENS)
+
+    def prefetch(self, question, chat_history, vector=None, expansion=''):
+        """Start retrieving for ``question`` on ``retrieval_pool`` while it is being categorized.
+
+        Embedding and search are local, so they overlap the categorize call and
+        are ready, or nearly, once the question turns out to be a DIABETES one.
+        With history, retrieval runs on the condensed question, which takes an
+        LLM call of its own, so nothing is started. Returns a future or None.
+        """
+        if not Config.SPECULATIVE_RETRIEVAL or chat_history:
+            return None
+
+        def run():
+            with span('speculative_retrieve'):
+                return self.retrieve(question, '', vector=vector, expansion=expansion)
+        return retrieval_pool.submit(contextvars.copy_context().run, run)
+
+    def prefetched(self, future):
+        """The documents from ``prefetch``, or None when they should be retrieved inline."""
+        if future is None:
+            return None
+        if future.cancel():
+            # Still queued behind other requests; running it here is no slower
+            inc('speculative_retrieval_total', outcome='queued')
+            return None
+        with span('speculative_wait'):
+            docs = future.result()
+        inc('speculative_retrieval_total', outcome='used')
+        return docs
+
+    async def aprefetched(self, future):
+        if future is None:
+            return None
+        if future.cancel():
+            inc('speculative_retrieval_total', outcome='queued')
+            return None
+        with span('speculative_wait'):
+            docs = await asyncio.wrap_future(future)
+        inc('speculative_retrieval_total', outcome='used')
+        return docs
+
+    def discard(self, future):
+        # A search already running is left to finish; its result is dropped
+        if future is not None:
+            future.cancel()
+            inc('speculative_retrieval_total', outcome='discarded')
+
+    def format_docs(self, docs):
+        return '\n\n'.join(doc.page_content for doc in docs)
+
+    def use_cache(self, profile, chat_history):
+        # Answers written for one user's profile must not be served to another, and a
+        # follow-up ("what about for children?") only means something within its own conversation
+        return Config.SEMANTIC_CACHE_ENABLED and not profile.context and not chat_history
+
+    def profile_prompt(self, profile):
+        # Kept out of the chat history, which decides whether the question is condensed first.
+        # The block is capped at PROFILE_CONTEXT_TOKENS, so it costs the same every turn
+        return f"About the user: {profile.context}\n\n" if profile.context else ''
+
+    def retrieval_metadata(self, profile):
+        # Read by RerankRetriever inside ConversationalRetrievalChain
+        return {'query_expansion': profile.terms}
+
+    def _lookup(self, question, use_cache):
+        vector = None
+        if use_cache or Config.ROUTER_ENABLED:
+            with span('embed_query'):
+                vector = self.semantic_cache.embed(question)
+        if use_cache:
+            with span('cache_lookup'):
+                self.semantic_cache.check_version(self.indexes.version)
+                cached = self.semantic_cache.get(question, vector=vector)
+            if cached is not None:
+                annotate('category', 'cached')
+            return vector, cached
+        return vector, None
+
+    def _answer(self, question, messages, chat_history, profile, callbacks=None):
+        use_cache = self.use_cache(profile, chat_history)
+        vector, cached = self._lookup(question, use_cache)
+        if cached is not None:
+            return cached
+
+        prefetch = self.prefetch(question, chat_history, vector, profile.terms)
+        cat = self.categorize(question, chat_history, vector=vector, callbacks=callbacks)
+        if cat == DIABETES:
+            docs = self.prefetched(prefetch)
+            if Config.QA_STRATEGY == 'map_rerank':
+                if docs is None:
+                    answer = self.qa_chain({'question': question, 'chat_history': messages,
+                                            'profile': self.profile_prompt(profile)}, callbacks=callbacks,
+                                           metadata=self.retrieval_metadata(profile))['answer']
+                else:
+                    # The step ConversationalRetrievalChain runs on the documents it retrieves
+                    answer = self.qa_chain.combine_docs_chain.run(input_documents=docs, question=question,
+                                                                  profile=self.profile_prompt(profile),
+                                                                  callbacks=callbacks)
+            else:
+                if docs is None:
+                    docs = self.retrieve(question, chat_history, vector=vector, callbacks=callbacks,
+                                         expansion=profile.terms)
+                prompt = self.PROMPT.format(profile=self.profile_prompt(profile), chat_history=chat_history,
+                                            context=self.format_docs(docs), question=question)
+                answer = self.llm.invoke(prompt, config={'callbacks': callbacks}).content
+            if use_cache and answer:
+                self.semantic_cache.put(question, answer, vector=vector)
+            return answer
+        else:
+            self.discard(prefetch)
+            return self.conv_chain({'question': question, 'chat_history': chat_history,
+                                    'profile': self.profile_prompt(profile)}, callbacks=callbacks)['text']
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service():
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                service = LLMService()
+                service.load()
+                _service = service
+                logger.info('LLM service ready: %s', startup_report(service.timings))
+    _service.indexes.poll()
+    return _service
+
+
+def warm_up():
+    # Called from gunicorn hooks so the first chat request doesn't pay for loading
+    return get_service().timings
+
+
+def startup_report(timings):
+    parts = [f'{name}={seconds * 1000:.0f}ms' for name, seconds in timings.items()]
+    return f"total={sum(timings.values()) * 1000:.0f}ms " + ' '.join(parts)
+
+
+def get_user_query_response(question, session_id, user_id=None):
+    return get_service().answer(question, session_id, user_id=user_id)
+
+
+def stream_user_query_response(question, session_id, user_id=None):
+    return get_service().stream_answer(question, session_id, user_id=user_id)
@@ -0,0 +1,54 @@
+"""Fire concurrent chat requests at a running server and summarize the outcome.
+
+    python -m app.load_test --url http://127.0.0.1:8000 --users 100 --requests 5
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+
+import aiohttp
+
+QUESTIONS = [
+    "What are the early symptoms of diabetes?",
+    "Is it safe for someone with diabetes to drink alcohol?",
+    "What is a good breakfast for someone with diabetes?",
+    "How can I prevent complications from diabetes?",
+]
+
+
+async def user(url, requests, statuses, latencies):
+    # A separate cookie jar per user, so each gets its own chat session
+    async with aiohttp.ClientSession() as session:
+        for i in range(requests):
+            start = time.perf_counter()
+            async with session.post(f"{url}/chat", json={'query': QUESTIONS[i % len(QUESTIONS)]}) as response:
+                await response.read()
+                statuses[response.status] += 1
+                if response.status == 200:
+                    latencies.append(time.perf_counter() - start)
+
+
+async def main(url, users, requests):
+    statuses, latencies = Counter(), []
+    start = time.perf_counter()
+    await asyncio.gather(*(user(url, requests, statuses, latencies) for _ in range(users)))
+    elapsed = time.perf_counter() - start
+
+    print(f"{sum(statuses.values())} requests in {elapsed:.1f}s")
+    for status, count in sorted(statuses.items()):
+        print(f"  HTTP {status}: {count}")
+    if latencies:
+        latencies.sort()
+        print(f"latency p50={statistics.median(latencies):.2f}s "
+              f"p95={latencies[int(len(latencies) * 0.95) - 1]:.2f}s max={latencies[-1]:.2f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Concurrent /chat load test')
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=3, help='requests per user')
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.users, args.requests))
@@ -0,0 +1,154 @@
+import asyncio
+import threading
+import time
+
+from app.config import Config
+
+
+def count_tokens(text):
+    # Rough estimate (~4 characters per token), good enough for budgeting
+    return max(1, len(text) // 4)
+
+
+def truncate_tokens(text, max_tokens):
+    limit = max_tokens * 4
+    return text if len(text) <= limit else text[-limit:]
+
+
+class ConversationWindow:
+    """The last few turns of one conversation plus a summary of older ones.
+
+    Turns are appended to ``history`` one at a time. Once there are more than
+    ``max_turns`` or they exceed ``max_tokens``, the oldest are folded into
+    the summary, which is itself capped at ``summary_tokens``, and dropped
+    from storage, so the history sent with each prompt and the rows kept per
+    conversation stay bounded however long the conversation runs. Folding
+    cuts the window to half its bounds, so the summarizer (an LLM call) runs
+    once every few turns rather than on every turn of a long conversation.
+    """
+
+    def __init__(self, history, conversation_id, max_turns, max_tokens, summary_tokens):
+        self.history = history
+        self.conversation_id = conversation_id
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.summary = ''
+
+    def add(self, question, answer, summarize=None):
+        evicted, through = self._push(question, answer)
+        if evicted:
+            self._fold(summarize(self.summary, evicted) if summarize is not None else self._outline(evicted), through)
+
+    async def aadd(self, question, answer, asummarize):
+        # Storage calls can block, so they run in the loop's thread pool
+        loop = asyncio.get_running_loop()
+        evicted, through = await loop.run_in_executor(None, self._push, question, answer)
+        if evicted:
+            await loop.run_in_executor(None, self._fold, await asummarize(self.summary, evicted), through)
+
+    def _push(self, question, answer):
+        self.history.append(self.conversation_id, question, answer)
+        # Every turn not folded yet, normally at most max_turns + 1. After a failed
+        # summary there are more, and they are all summarized now: fold drops every
+        # turn up to ``through``, so none may be skipped
+        self.summary, _, turns = self.history.load(self.conversation_id, None)
+        evicted = self._overflow(turns, refill=True)
+        return [(question, answer) for _, question, answer in evicted], evicted[-1][0] if evicted else 0
+
+    def _overflow(self, turns, refill=False):
+        """The oldest ``turns`` beyond the window's bounds; with ``refill``, down to half the bounds."""
+        evicted, turns = [], list(turns)
+        if not _over(turns, self.max_turns, self.max_tokens):
+            return evicted
+        max_turns, max_tokens = self.max_turns, self.max_tokens
+        if refill:
+            max_turns, max_tokens = max(1, max_turns // 2), max_tokens // 2
+        while _over(turns, max_turns, max_tokens):
+            evicted.append(turns.pop(0))
+        return evicted
+
+    def _fold(self, summary, through):
+        # Summarizing may call the LLM, so it happens between the storage calls
+        self.history.fold(self.conversation_id, truncate_tokens(summary.strip(), self.summary_tokens), through)
+
+    def _outline(self, evicted):
+        return '\n'.join([self.summary] + [f"User asked: {question}" for question, _ in evicted])
+
+    def snapshot(self):
+        self.summary, _, turns = self.history.load(self.conversation_id, self.max_turns)
+        # Normally already within bounds; trims what a failed summary left behind
+        evicted = len(self._overflow(turns))
+        return self.summary, [(question, answer) for _, question, answer in turns[evicted:]]
+
+
+def tokens(turns):
+    return sum(count_tokens(question) + count_tokens(answer) for _, question, answer in turns)
+
+
+def _over(turns, max_turns, max_tokens):
+    # The newest turn is always kept, however long it is
+    return len(turns) > max_turns or (len(turns) > 1 and tokens(turns) > max_tokens)
+
+
+class SessionMemoryStore:
+    """Conversation windows over a chat history backend, keyed by chat session id.
+
+    The backend is chosen by ``CHAT_HISTORY_BACKEND``: ``sql`` uses the app's
+    database, ``redis`` a shared Redis and ``memory`` a process-local dict.
+    Conversations idle for more than ``ttl`` seconds are garbage-collected.
+    """
+
+    def __init__(self, backend, max_turns=6, max_tokens=1500, summary_tokens=300, ttl=604800, gc_interval=300):
+        self.backend = backend
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.ttl = ttl
+        self.gc_interval = gc_interval
+        self.history = None
+        self._lock = threading.Lock()
+        self._last_gc = time.monotonic()
+
+    def init_app(self, app):
+        from app import db
+        from app.history import make_history
+        engine = None
+        if self.backend == 'sql':
+            with app.app_context():
+                engine = db.engine
+        self.history = make_history(self.backend, engine=engine, redis_url=Config.REDIS_URL, ttl=self.ttl)
+
+    def _history(self):
+        if self.history is None:
+            from app.history import make_history
+            with self._lock:
+                if self.history is None:
+                    self.history = make_history(self.backend, redis_url=Config.REDIS_URL, ttl=self.ttl)
+        return self.history
+
+    def get(self, session_id):
+        history = self._history()
+        self._gc(history)
+        return ConversationWindow(history, session_id, self.max_turns, self.max_tokens, self.summary_tokens)
+
+    def start(self, session_id, user_id=None):
+        self._history().start(session_id, user_id=user_id)
+
+    def clear(self, session_id):
+        self._history().delete(session_id)
+
+    def _gc(self, history):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_gc < self.gc_interval:
+                return
+            self._last_gc = now
+        history.gc(self.ttl)
+
+
+memory_store = SessionMemoryStore(Config.CHAT_HISTORY_BACKEND,
+                                  max_turns=Config.MEMORY_MAX_TURNS,
+                                  max_tokens=Config.MEMORY_MAX_TOKENS,
+                                  summary_tokens=Config.MEMORY_SUMMARY_TOKENS,
+                                  ttl=Config.MEMORY_TTL)
@@ -0,0 +1,225 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+
+from app.config import Config
+
+# Upper bounds in seconds, roughly log-spaced from "local" to "slow upstream"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# For small per-request counts such as LLM calls
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 8)
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    def __init__(self, name, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.labels = labels
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            else:
+                self.counts[-1] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Counter:
+    def __init__(self, name, labels=()):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+_histograms = {}
+_counters = {}
+_gauges = {}
+_registry_lock = threading.Lock()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def histogram(name, buckets=DEFAULT_BUCKETS, **labels):
+    key = _key(name, labels)
+    metric = _histograms.get(key)
+    if metric is None:
+        with _registry_lock:
+            metric = _histograms.setdefault(key, Histogram(name, key[1], buckets))
+    return metric
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    histogram(name, buckets, **labels).observe(value)
+
+
+def inc(name, amount=1, **labels):
+    key = _key(name, labels)
+    metric = _counters.get(key)
+    if metric is None:
+        with _registry_lock:
+            metric = _counters.setdefault(key, Counter(name, key[1]))
+    metric.inc(amount)
+
+
+def gauge(name, fn):
+    """Register ``fn`` to be called for the current value of ``name`` at scrape time."""
+    _gauges[name] = fn
+
+
+# Per-request trace: the stages timed so far and token counts, emitted as one
+# JSON log line at the end of the request when METRICS_JSON_LOG is set
+_trace = contextvars.ContextVar('trace', default=None)
+
+
+def begin(path=None):
+    if not Config.METRICS_ENABLED:
+        return None
+    trace = {'id': uuid.uuid4().hex[:16], 'path': path, 'started': time.perf_counter(), 'stages': {}, 'tokens': {}}
+    _trace.set(trace)
+    return trace
+
+
+def current():
+    return _trace.get()
+
+
+def attach(trace):
+    # Used where work for a request continues on another thread or task
+    _trace.set(trace)
+
+
+def end():
+    trace = _trace.get()
+    if trace is None:
+        return
+    _trace.set(None)
+    if Config.METRICS_JSON_LOG:
+        logger.info(json.dumps({
+            'request_id': trace['id'],
+            'path': trace['path'],
+            'total_ms': round((time.perf_counter() - trace['started']) * 1000, 2),
+            'stages_ms': {stage: round(seconds * 1000, 2) for stage, seconds in trace['stages'].items()},
+            'tokens': trace['tokens'],
+        }))
+
+
+def annotate(key, value):
+    # Extra per-request facts, e.g. the chat category for app.activity
+    trace = _trace.get()
+    if trace is not None:
+        trace[key] = value
+
+
+def record_stage(stage, seconds):
+    if not Config.METRICS_ENABLED:
+        return
+    observe('chat_stage_seconds', seconds, stage=stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace['stages'][stage] = trace['stages'].get(stage, 0.0) + seconds
+
+
+def record_tokens(prompt_tokens, completion_tokens):
+    if not Config.METRICS_ENABLED:
+        return
+    inc('llm_tokens_total', prompt_tokens, type='prompt')
+    inc('llm_tokens_total', completion_tokens, type='completion')
+    trace = _trace.get()
+    if trace is not None:
+        tokens = trace['tokens']
+        tokens['prompt'] = tokens.get('prompt', 0) + prompt_tokens
+        tokens['completion'] = tokens.get('completion', 0) + completion_tokens
+
+
+@contextmanager
+def _span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+_noop = nullcontext()
+
+
+def span(stage):
+    """Time a pipeline stage; a shared no-op when metrics are disabled."""
+    return _span(stage) if Config.METRICS_ENABLED else _noop
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines, typed = [], set()
+    for metric in sorted(_counters.values(), key=lambda m: (m.name, m.labels)):
+        if metric.name not in typed:
+            lines.append(f"# TYPE {metric.name} counter")
+            typed.add(metric.name)
+        lines.append(f"{metric.name}{_labels(metric.labels)} {metric.value}")
+    for name, fn in sorted(_gauges.items()):
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {fn()}")
+    for metric in sorted(_histograms.values(), key=lambda m: (m.name, m.labels)):
+        if metric.name not in typed:
+            lines.append(f"# TYPE {metric.name} histogram")
+            typed.add(metric.name)
+        with metric._lock:
+            cumulative = 0
+            for bound, count in zip(metric.buckets, metric.counts):
+                cumulative += count
+                lines.append(f"{metric.name}_bucket{_labels(metric.labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{metric.name}_bucket{_labels(metric.labels, [('le', '+Inf')])} {metric.count}")
+            lines.append(f"{metric.name}_sum{_labels(metric.labels)} {metric.sum}")
+            lines.append(f"{metric.name}_count{_labels(metric.labels)} {metric.count}")
+    return '\n'.join(lines) + '\n'
+
+
+def instrument_session(app):
+    """Time loading and saving the server-side session, and open the request trace."""
+    interface = app.session_interface
+    open_session, save_session = interface.open_session, interface.save_session
+
+    def timed_open_session(app, request):
+        # The session is opened before any before_request handler runs
+        begin(request.path)
+        with span('session_load'):
+            return open_session(app, request)
+
+    def timed_save_session(app, session, response):
+        with span('session_save'):
+            return save_session(app, session, response)
+
+    interface.open_session = timed_open_session
+    interface.save_session = timed_save_session
+
+    @app.teardown_request
+    def end_trace(exc):
+        end()
@@ -5,7 +5,7 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(150), unique=True, nullable=False)
     password = db.Column(db.String(150), nullable=False)
-    created_on = db.Column(db.DateTime, default=datetime.utcnow)
+    created_on = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     full_name = db.Column(db.String(150), nullable=True)
     age = db.Column(db.Integer, nullable=True)
     gender = db.Column(db.Integer, nullable=True)  # 0, 1, 2
@@ -25,10 +25,67 @@ class User(db.Model):
     height = db.Column(db.Float, nullable=True)
     management_goals = db.Column(db.String, nullable=True)
     learning_preference = db.Column(db.String, nullable=True)
-    is_active = db.Column(db.Integer, default=1, nullable=False)
+    is_active = db.Column(db.Integer, default=1, nullable=False, index=True)
+    # Rendered from the fields above by app.profile whenever the profile is saved
+    profile_context = db.Column(db.Text, nullable=True)
+    profile_terms = db.Column(db.String, nullable=True)
+    # Bumped with every update of the columns above, so cached copies can tell they are stale
+    profile_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+# Fields returned by the /users and /user endpoints, in response order
+USER_FIELDS = ('id', 'email', 'full_name', 'age', 'gender', 'street_address', 'city', 'state', 'country', 'zip',
+               'diagnose_date', 'blood_glucose_level', 'blood_glucose_fasting_level', 'medications',
+               'medical_conditions', 'dietary_pref', 'physical_activity', 'weight', 'height', 'management_goals',
+               'learning_preference', 'created_on')
+
+def serialize_user(row, fields=USER_FIELDS):
+    # Works for User objects and for rows of projected columns alike
+    return {field: getattr(row, field) for field in fields}
 
 class LoginHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     user = db.relationship('User', backref=db.backref('login_history', lazy=True))
+    # A user's logins in time order
+    __table_args__ = (db.Index('ix_login_history_user_id_timestamp', 'user_id', 'timestamp'),)
+
+class Conversation(db.Model):
+    # Keyed by the chat id kept in the user's session
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    summary = db.Column(db.Text, nullable=False, default='')
+    # Messages up to this id have been folded into the summary and deleted
+    summarized_through = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class ChatMessage(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.String(32), db.ForeignKey('conversation.id'), nullable=False)
+    question = db.Column(db.Text, nullable=False)
+    answer = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # The last few turns of a conversation are read with one range scan
+    __table_args__ = (db.Index('ix_chat_message_conversation_id_id', 'conversation_id', 'id'),)
+
+class ActivityEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    kind = db.Column(db.String(32), nullable=False)  # chat
+    category = db.Column(db.String(32), nullable=True)
+    latency_ms = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (db.Index('ix_activity_event_user_id_created_at', 'user_id', 'created_at'),)
+
+class ActivityDaily(db.Model):
+    # Per-user daily totals maintained by app.activity, so summaries never scan the raw events.
+    # user_id 0 stands for anonymous chats and category '' for none, keeping the key unique
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    kind = db.Column(db.String(32), nullable=False)
+    category = db.Column(db.String(32), nullable=False, default='')
+    count = db.Column(db.Integer, nullable=False, default=0)
+    latency_ms_sum = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (db.UniqueConstraint('user_id', 'day', 'kind', 'category', name='uq_activity_daily_key'),)
@@ -0,0 +1,158 @@
+"""Near-duplicate detection for chunks and packing of retrieved chunks into prompt context.
+
+Chunks are fingerprinted with a 64-bit SimHash over word trigrams; two chunks
+whose fingerprints differ in only a few bits are treated as the same text.
+Ingestion uses this to keep repeated passages out of the index, and ``pack``
+uses it, together with the chunks' ``start_index``, to turn the retrieved
+chunks into a few non-overlapping passages within a token budget.
+"""
+import hashlib
+import re
+from collections import defaultdict
+
+import numpy as np
+
+from app.memory import count_tokens
+
+WORD_RE = re.compile(r"\w+")
+# Shortest shared text that counts as two chunks overlapping
+MIN_OVERLAP = 32
+# A passage cut to fit the budget is dropped rather than kept this short
+MIN_PASSAGE_TOKENS = 32
+
+
+def fingerprint(text):
+    words = WORD_RE.findall(text.lower())
+    shingles = {' '.join(words[i:i + 3]) for i in range(max(1, len(words) - 2))} if words else set()
+    if not shingles:
+        return 0
+    hashes = np.fromiter((int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+                          for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    # Each bit of the fingerprint is the majority vote of that bit over the shingles
+    votes = bits.sum(axis=0) * 2 > len(hashes)
+    return int(np.packbits(votes, bitorder='little').view(np.uint64)[0])
+
+
+class NearDuplicates:
+    """Fingerprints seen so far, looked up by Hamming distance.
+
+    Each fingerprint is filed under ``distance + 1`` bands of its bits. Two
+    fingerprints at most ``distance`` bits apart agree on at least one whole
+    band, so only the entries sharing a band with the query are compared.
+    The default of 7 bits (eight one-byte bands) was picked on our corpus,
+    where chunks that close are the same text with a few words changed.
+    """
+
+    def __init__(self, distance=7):
+        self.distance = distance
+        self._width = 64 // (distance + 1)
+        self._bands = defaultdict(list)
+
+    def _keys(self, value):
+        mask = (1 << self._width) - 1
+        return [(band, (value >> (self._width * band)) & mask) for band in range(self.distance + 1)]
+
+    def find(self, value):
+        for key in self._keys(value):
+            for other, item in self._bands[key]:
+                if bin(value ^ other).count('1') <= self.distance:
+                    return item
+        return None
+
+    def add(self, value, item):
+        for key in self._keys(value):
+            self._bands[key].append((value, item))
+
+
+def _join(first, second):
+    # ``first`` followed by ``second`` when the end of one is the start of the other
+    position = first.find(second[:MIN_OVERLAP])
+    while position != -1:
+        if second.startswith(first[position:]):
+            return first[:position] + second
+        position = first.find(second[:MIN_OVERLAP], position + 1)
+    return None
+
+
+class _Passage:
+    def __init__(self, text, source, start):
+        self.text = text
+        self.source = source
+        self.start = start
+
+    def merge(self, text, start):
+        if text in self.text:
+            return True
+        if self.text in text:
+            self.text, self.start = text, start
+            return True
+        if start is not None and self.start is not None:
+            # The offsets say which chunk comes first
+            orders = [(self.text, text)] if start >= self.start else [(text, self.text)]
+        else:
+            orders = [(self.text, text), (text, self.text)]
+        for first, second in orders:
+            joined = _join(first, second)
+            if joined is not None:
+                if start is not None and self.start is not None:
+                    self.start = min(start, self.start)
+                self.text = joined
+                return True
+        return False
+
+
+def _truncate(text, max_tokens):
+    # Keep the beginning, cut back to the last sentence or word that fits
+    limit = max_tokens * 4
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    end = max(cut.rfind('. '), cut.rfind('\n'))
+    return cut[:end + 1] if end > limit // 2 else cut[:cut.rfind(' ') + 1 or limit]
+
+
+def pack(docs, max_tokens):
+    """Merge ``docs`` (best first) into non-overlapping passages of at most ``max_tokens`` in total.
+
+    Chunks from the same source that overlap are joined into one passage, and
+    chunks contained in or nearly identical to an earlier one are dropped.
+    Passages keep the rank of their best chunk; the first one that does not
+    fit is cut short and the rest are left out.
+    """
+    from langchain_core.documents import Document
+    passages, seen = [], NearDuplicates()
+    for doc in docs:
+        text, source, start = doc.page_content, doc.metadata.get('source'), doc.metadata.get('start_index')
+        if any(passage.source == source and passage.merge(text, start) for passage in passages):
+            continue
+        value = doc.metadata.get('simhash') or fingerprint(text)
+        if seen.find(value) is not None:
+            continue
+        seen.add(value, len(passages))
+        passages.append(_Passage(text, source, start))
+
+    # A chunk that bridged two passages can leave them overlapping each other
+    merged = True
+    while merged:
+        merged = False
+        for i, passage in enumerate(passages):
+            for other in passages[i + 1:]:
+                if other.source == passage.source and passage.merge(other.text, other.start):
+                    passages.remove(other)
+                    merged = True
+                    break
+            if merged:
+                break
+
+    packed, used = [], 0
+    for passage in passages:
+        tokens = count_tokens(passage.text)
+        if used + tokens > max_tokens:
+            if max_tokens - used >= MIN_PASSAGE_TOKENS:
+                packed.append((passage, _truncate(passage.text, max_tokens - used)))
+            break
+        packed.append((passage, passage.text))
+        used += tokens
+    return [Document(page_content=text, metadata={'source': passage.source, 'start_index': passage.start})
+            for passage, text in packed]
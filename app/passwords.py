@@ -0,0 +1,133 @@
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt as _bcrypt
+
+from app import metrics
+from app.config import Config
+
+
+class HasherBusy(Exception):
+    """Raised when the password hashing queue is already full."""
+
+
+def _hash(password, rounds):
+    return _bcrypt.hashpw(password.encode('utf-8'), _bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(hashed, password):
+    return _bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+class PasswordHasher:
+    """bcrypt on a small process pool, so hashing never holds a request thread's CPU.
+
+    Produces and checks the same hashes as Flask-Bcrypt. At most ``workers``
+    hashes run at once with ``max_queue`` more waiting; beyond that callers get
+    ``HasherBusy`` instead of piling up. ``workers=0`` hashes inline.
+    """
+
+    def __init__(self, rounds, workers, max_queue):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_queue = max_queue
+        self.pending = 0
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _run(self, op, fn, *args):
+        start = time.perf_counter()
+        if not self.workers:
+            result = fn(*args)
+        else:
+            with self._lock:
+                if self.pending >= self.workers + self.max_queue:
+                    raise HasherBusy()
+                self.pending += 1
+                if self._pool is None:
+                    # Created on first use, i.e. after gunicorn has forked the worker;
+                    # spawn avoids forking a process that is already running threads
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            try:
+                result = self._pool.submit(fn, *args).result()
+            finally:
+                with self._lock:
+                    self.pending -= 1
+        metrics.observe('password_hash_seconds', time.perf_counter() - start, op=op)
+        return result
+
+    def hash(self, password):
+        return self._run('hash', _hash, password, self.rounds)
+
+    def check(self, hashed, password):
+        return self._run('check', _check, hashed, password)
+
+    def needs_rehash(self, hashed):
+        # bcrypt hashes look like $2b$<cost>$<salt and digest>
+        try:
+            return int(hashed.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return False
+
+
+class AttemptLimiter:
+    """Counts failed attempts per key over a sliding ``window`` of seconds.
+
+    Kept per process, so with several gunicorn workers the effective limit is
+    somewhat higher; it is meant to shed floods cheaply, not as an exact quota.
+    """
+
+    def __init__(self, max_attempts, window):
+        self.max_attempts = max_attempts
+        self.window = window
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def _recent(self, key, now):
+        failures = self._failures.get(key)
+        if failures is None:
+            return None
+        while failures and failures[0] <= now - self.window:
+            failures.popleft()
+        if not failures:
+            del self._failures[key]
+            return None
+        return failures
+
+    def retry_after(self, key):
+        """Seconds until ``key`` may try again, or 0 if it is not blocked."""
+        now = time.monotonic()
+        with self._lock:
+            failures = self._recent(key, now)
+            if failures is None or len(failures) < self.max_attempts:
+                return 0
+            return int(failures[0] + self.window - now) + 1
+
+    def fail(self, key):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._failures) > 10000:
+                # Keys that stopped failing are otherwise only dropped when seen again
+                for stale in list(self._failures):
+                    self._recent(stale, now)
+            failures = self._recent(key, now)
+            if failures is None:
+                failures = self._failures[key] = deque()
+            failures.append(now)
+
+    def reset(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+
+password_hasher = PasswordHasher(rounds=Config.BCRYPT_LOG_ROUNDS,
+                                 workers=Config.PASSWORD_HASH_WORKERS,
+                                 max_queue=Config.PASSWORD_HASH_MAX_QUEUE)
+metrics.gauge('password_hash_pending', lambda: password_hasher.pending)
+
+login_limiter_email = AttemptLimiter(Config.LOGIN_MAX_ATTEMPTS, Config.LOGIN_ATTEMPT_WINDOW)
+login_limiter_ip = AttemptLimiter(Config.LOGIN_MAX_ATTEMPTS_PER_IP, Config.LOGIN_ATTEMPT_WINDOW)
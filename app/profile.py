@@ -0,0 +1,161 @@
+"""What the chat pipeline knows about the user it is answering.
+
+The clinical fields of a ``User`` are rendered once, when the profile is
+saved, into a short context block for the prompt and a few expansion terms
+for lexical retrieval. Both are stored on the user row; chat requests read
+them through ``profile_cache`` instead of loading the full profile each turn.
+"""
+import re
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import date, datetime
+
+from sqlalchemy import select
+
+from app.config import Config
+from app.memory import count_tokens
+
+Profile = namedtuple('Profile', 'context terms')
+EMPTY = Profile('', '')
+
+# Option order of the profile form (app/static/Assets/js/profile.js)
+GENDERS = {1: 'male', 2: 'female', 3: 'other'}
+DIETS = {1: 'vegetarian', 2: 'vegan', 3: 'gluten-free', 4: 'kosher'}
+
+
+def _label(value, labels):
+    # The profile form sends option text, older rows hold the option index
+    if value is None or value == '':
+        return None
+    if isinstance(value, int) or str(value).isdigit():
+        return labels.get(int(value))
+    return str(value).strip().lower() or None
+
+
+def _number(value):
+    return f'{value:g}' if isinstance(value, float) else value
+
+
+def _terms(*values):
+    terms = []
+    for value in values:
+        for term in re.split(r'[,;/\n]+', value or ''):
+            term = term.strip().lower()
+            if term and term not in terms:
+                terms.append(term)
+    return terms
+
+
+def build_profile(user, max_tokens):
+    """Render ``user`` (a model instance or row) into a ``Profile``.
+
+    Lines are added most useful first and stop at ``max_tokens``, so the block
+    costs the same in every prompt however much the user has filled in.
+    """
+    diet = _label(user.dietary_pref, DIETS)
+    diagnosed = user.diagnose_date
+    if isinstance(diagnosed, datetime):
+        # Only the day matters, whether it was parsed from a form or read back from the database
+        diagnosed = diagnosed.date()
+    facts = [
+        ('Age', user.age),
+        ('Sex', _label(user.gender, GENDERS)),
+        ('Diagnosed with diabetes', diagnosed.isoformat() if isinstance(diagnosed, date) else diagnosed),
+        ('Blood glucose', _number(user.blood_glucose_level)),
+        ('Fasting blood glucose', _number(user.blood_glucose_fasting_level)),
+        ('Medications', user.medications),
+        ('Other conditions', user.medical_conditions),
+        ('Diet', diet),
+        ('Physical activity', user.physical_activity),
+        ('Weight', _number(user.weight)),
+        ('Height', _number(user.height)),
+        ('Goals', user.management_goals),
+        ('Prefers', user.learning_preference),
+    ]
+    lines, used = [], 0
+    for name, value in facts:
+        if value is None or str(value).strip() == '':
+            continue
+        line = f'{name}: {str(value).strip()}'
+        used += count_tokens(line)
+        if used > max_tokens:
+            break
+        lines.append(line)
+    terms = _terms(user.medications, user.medical_conditions, diet)
+    return Profile('; '.join(lines), ' '.join(terms))
+
+
+class ProfileCache:
+    """Per-process cache of the stored ``Profile`` of each user.
+
+    Every read checks the user's ``profile_version``, a primary key lookup of
+    one integer, and reloads the profile when ``refresh`` has bumped it since,
+    so an update made through any worker is seen by all of them on their next
+    request.
+    """
+
+    def __init__(self, max_tokens=150, max_size=10000):
+        self.max_tokens = max_tokens
+        self.max_size = max_size
+        self.engine = None
+        self._entries = OrderedDict()  # user_id -> (profile, version)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        from app import db
+        with app.app_context():
+            self.engine = db.engine
+
+    def get(self, user_id):
+        if user_id is None or self.engine is None:
+            return EMPTY
+        from app.models import User
+        users = User.__table__
+        with self.engine.connect() as conn:
+            version = conn.execute(select(users.c.profile_version)
+                                   .where(users.c.id == user_id, users.c.is_active == 1)).scalar()
+        if version is None:
+            return EMPTY
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] == version:
+                self._entries.move_to_end(user_id)
+                return entry[0]
+        profile = self._load(user_id)
+        with self._lock:
+            self._entries[user_id] = (profile, version)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return profile
+
+    def refresh(self, user):
+        """Recompute ``user``'s stored profile columns and bump its version, in the caller's transaction."""
+        from app.models import User
+        profile = build_profile(user, self.max_tokens)
+        user.profile_context, user.profile_terms = profile
+        # Incremented in SQL, so concurrent updates never end up on the same version
+        user.profile_version = User.profile_version + 1
+        return profile
+
+    def _load(self, user_id):
+        from app.models import User
+        users = User.__table__
+        with self.engine.connect() as conn:
+            row = conn.execute(select(users.c.profile_context, users.c.profile_terms)
+                               .where(users.c.id == user_id, users.c.is_active == 1)).first()
+        if row is None:
+            return EMPTY
+        if row.profile_context is not None:
+            return Profile(row.profile_context, row.profile_terms or '')
+        # Profiles saved before these columns existed are rendered once, on first use
+        with self.engine.begin() as conn:
+            user = conn.execute(select(users).where(users.c.id == user_id)).first()
+            profile = build_profile(user, self.max_tokens)
+            conn.execute(users.update().where(users.c.id == user_id)
+                         .values(profile_context=profile.context, profile_terms=profile.terms))
+        return profile
+
+
+profile_cache = ProfileCache(max_tokens=Config.PROFILE_CONTEXT_TOKENS,
+                             max_size=Config.PROFILE_CACHE_MAX_SIZE)
@@ -11,7 +11,7 @@
 
 prompt_template = """You are a helpful assistant. Given the following conversation and a follow-up question, provide a helpful and accurate answer.
 
-Chat History:
+{profile}Chat History:
 {chat_history}
 
 Context from the retrieved documents:
@@ -100,10 +100,34 @@ Category:
 """
 
 conversation_prompt_template = """
-You are a medical assistant specialized in diabetes and having a conversation with a user. Below is the chat history:
+You are a medical assistant specialized in diabetes and having a conversation with a user.
+{profile}Below is the chat history:
 
 {chat_history}
     
 User: {question}
 AI:
-"""
\ No newline at end of file
+"""
+
+# Seed queries for the local embedding router in app/router.py, taken from the
+# few-shot examples of question_categorize_prompt_template above
+diabetes_examples = [
+    "Can you suggest some exercises for lowering blood sugar?",
+    "Could my diabetes be causing my fatigue?",
+    "What are the early symptoms of diabetes?",
+    "How can I prevent complications from diabetes?",
+    "Is it safe for someone with diabetes to drink alcohol?",
+    "What medications are commonly prescribed for type 2 diabetes?",
+    "What is the best way to monitor my blood sugar levels?",
+    "What is a good breakfast for someone with diabetes?",
+]
+
+not_diabetes_examples = [
+    "How long is the flight from New York to Paris?",
+    "What is the capital of France?",
+    "Can you help me with my math homework?",
+    "What's the weather like today?",
+    "How do I set up a new phone?",
+    "Hi, how are you?",
+    "What are you doing?",
+]
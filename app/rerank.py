@@ -0,0 +1,92 @@
+import copy
+from typing import Any
+
+import numpy as np
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from langchain_core.retrievers import BaseRetriever
+
+from app.lexical import reciprocal_rank_fusion
+from app.metrics import span
+from app.passages import pack
+
+
+class Reranker:
+    """Over-fetch candidates from FAISS and keep the best ``k`` on CPU.
+
+    When a BM25 index is given, its top ``fetch_k`` chunks are fused with the
+    vector candidates by reciprocal rank. With a cross-encoder model configured
+    the candidates are rescored against the question; otherwise maximal
+    marginal relevance over the stored MiniLM vectors is used, which also drops
+    near-identical overlapping chunks.
+    """
+
+    def __init__(self, db, k=3, fetch_k=20, lambda_mult=0.7, model_name=None, lexical=None):
+        self.db = db
+        self.k = k
+        self.fetch_k = fetch_k
+        self.lambda_mult = lambda_mult
+        self.lexical = lexical
+        self.cross_encoder = None
+        if model_name:
+            from sentence_transformers import CrossEncoder
+            self.cross_encoder = CrossEncoder(model_name, device='cpu')
+
+    def candidates(self, question, vector, expansion=''):
+        with span('faiss_search'):
+            _, positions = self.db.index.search(vector[None, :], self.fetch_k)
+        ranking = [int(position) for position in positions[0] if position != -1]
+        if self.lexical is not None:
+            with span('bm25_search'):
+                # Profile terms (medications, conditions) only steer the keyword side
+                lexical = self.lexical.search(f'{question} {expansion}' if expansion else question, self.fetch_k)
+            ranking = reciprocal_rank_fusion([ranking, lexical])[:self.fetch_k]
+        return ranking
+
+    def document(self, position):
+        return self.db.docstore.search(self.db.index_to_docstore_id[position])
+
+    def retrieve(self, question, vector, expansion=''):
+        vector = np.asarray(vector, dtype='float32')
+        positions = self.candidates(question, vector, expansion)
+        if not positions:
+            return []
+        if self.cross_encoder is None:
+            vectors = np.stack([self.db.index.reconstruct(position) for position in positions])
+            selected = maximal_marginal_relevance(vector, vectors, lambda_mult=self.lambda_mult, k=self.k)
+            return [self.document(positions[i]) for i in selected]
+        docs = [self.document(position) for position in positions]
+        scores = self.cross_encoder.predict([(question, doc.page_content) for doc in docs])
+        ranked = sorted(zip(scores, range(len(docs))), reverse=True)[:self.k]
+        return [docs[i] for _, i in ranked]
+
+    def with_store(self, db, lexical=None):
+        """A copy over another store that shares this one's settings and cross-encoder."""
+        reranker = copy.copy(self)
+        reranker.db = db
+        reranker.lexical = lexical
+        return reranker
+
+    def as_retriever(self, embeddings, context_tokens=None):
+        return RerankRetriever(reranker=self, embeddings=embeddings, context_tokens=context_tokens)
+
+
+class RerankRetriever(BaseRetriever):
+    """Exposes ``Reranker`` to chains that expect a LangChain retriever.
+
+    With ``context_tokens`` the chunks are packed into passages first, which
+    for map_rerank also means one LLM call less per pair of merged chunks.
+    """
+
+    reranker: Any
+    embeddings: Any
+    context_tokens: Any = None
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        with span('embed_query'):
+            vector = self.embeddings.embed_query(query)
+        with span('retrieve'):
+            docs = self.reranker.retrieve(query, vector, expansion=run_manager.metadata.get('query_expansion', ''))
+        if self.context_tokens is None:
+            return docs
+        with span('pack_context'):
+            return pack(docs, self.context_tokens)
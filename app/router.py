@@ -0,0 +1,43 @@
+import numpy as np
+
+from app.prompt import diabetes_examples, not_diabetes_examples
+
+DIABETES = 'diabetes'
+NOT_DIABETES = 'not-diabetes'
+
+
+class QueryRouter:
+    """Nearest-centroid classifier over sentence embeddings.
+
+    Each category is represented by the normalized mean embedding of its seed
+    queries. A query is routed locally only when the gap between its cosine
+    similarity to the two centroids is at least ``margin``; otherwise
+    ``classify`` returns None and the caller falls back to the LLM categorizer.
+    """
+
+    def __init__(self, embeddings, margin=0.08,
+                 diabetes_seeds=diabetes_examples, other_seeds=not_diabetes_examples):
+        self.embeddings = embeddings
+        self.margin = margin
+        self.labels = [DIABETES, NOT_DIABETES]
+        self.centroids = np.stack([self._centroid(diabetes_seeds), self._centroid(other_seeds)])
+
+    def _centroid(self, seeds):
+        vectors = np.asarray(self.embeddings.embed_documents(list(seeds)), dtype='float32')
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        centroid = vectors.mean(axis=0)
+        return centroid / np.linalg.norm(centroid)
+
+    def scores(self, question, vector=None):
+        if vector is None:
+            vector = np.asarray(self.embeddings.embed_query(question), dtype='float32')
+            vector /= np.linalg.norm(vector)
+        return self.centroids @ vector
+
+    def classify(self, question, vector=None):
+        diabetes, other = self.scores(question, vector=vector)
+        if diabetes - other >= self.margin:
+            return DIABETES
+        if other - diabetes >= self.margin:
+            return NOT_DIABETES
+        return None
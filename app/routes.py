@@ -1,9 +1,23 @@
-from flask import Blueprint, request, jsonify, render_template
+import hmac
+import json
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from flask import Blueprint, Response, current_app, request, jsonify, render_template, stream_with_context
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from app import db, bcrypt
-from app.models import User, LoginHistory
-from app.llm import get_user_query_response
+from app import db
+from app.models import User, USER_FIELDS, serialize_user
+from app.activity import activity_buffer, activity_summary
+from app.concurrency import QueueFull, chat_executor
+from app.config import Config
+from app.gateway import LLMUnavailable
+from app.indexes import set_current
+from app.llm import get_service, get_user_query_response, stream_user_query_response
+from app.metrics import current, inc, observe, render
+from app.memory import memory_store
+from app.passwords import HasherBusy, login_limiter_email, login_limiter_ip, password_hasher
+from app.profile import profile_cache
 from datetime import datetime
+from uuid import uuid4
 from flask import session
 from flask import redirect, url_for
 
@@ -29,7 +43,10 @@ def register():
         return jsonify({'message': 'User with this email already exists!'}), 400
 
     # Hash the password and save the new user
-    hashed_password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+    try:
+        hashed_password = password_hasher.hash(data['password'])
+    except HasherBusy:
+        return _busy()
     new_user = User(email=data['email'], password=hashed_password, full_name=data['full_name'])
     db.session.add(new_user)
     db.session.commit()
@@ -37,7 +54,9 @@ def register():
     # Log in the new user automatically by setting up the session
     session['user_name'] = new_user.full_name
     session['user_email'] = new_user.email
-    session['chat_history'] = []
+    session['user_id'] = new_user.id
+    session['chat_id'] = uuid4().hex
+    memory_store.start(session['chat_id'], user_id=new_user.id)
 
     return jsonify({'message': 'User registered successfully!', 'redirect_url': url_for('main.main_page')})
 
@@ -51,27 +70,55 @@ def login():
         return render_template('login.html')
 
     data = request.get_json()
+    # Floods of failed attempts are turned away before any database or hashing work
+    email_key, ip_key = data['email'].lower(), request.remote_addr
+    retry_after = max(login_limiter_email.retry_after(email_key), login_limiter_ip.retry_after(ip_key))
+    if retry_after:
+        inc('login_rejected_total', reason='rate_limited')
+        return jsonify({'message': 'Too many failed login attempts, please retry later.'}), 429, \
+            {'Retry-After': str(retry_after)}
+
     user = User.query.filter_by(email=data['email'], is_active=1).first()
-    if user and bcrypt.check_password_hash(user.password, data['password']):
-        session['chat_history'] = []
+    try:
+        valid = user is not None and password_hasher.check(user.password, data['password'])
+    except HasherBusy:
+        return _busy()
+    if valid:
+        login_limiter_email.reset(email_key)
+        if password_hasher.needs_rehash(user.password):
+            # BCRYPT_LOG_ROUNDS changed since this hash was made
+            try:
+                user.password = password_hasher.hash(data['password'])
+                db.session.commit()
+            except HasherBusy:
+                pass
+        session['chat_id'] = uuid4().hex
+        memory_store.start(session['chat_id'], user_id=user.id)
         session['user_name'] = user.full_name  # Store the user's name in session
         session['user_email'] = user.email  # Store the user's email in session
+        session['user_id'] = user.id
 
-        print("Session data after login:", session)
+        current_app.logger.debug('User %s logged in, chat %s', user.id, session['chat_id'])
 
-        # Create access token and record login history
+        # Create access token and record login history; the row is written with the next activity batch
         access_token = create_access_token(identity={'id': user.id, 'email': user.email})
-        login_history = LoginHistory(user_id=user.id, timestamp=datetime.utcnow())
-        db.session.add(login_history)
-        db.session.commit()
+        activity_buffer.record_login(user.id)
         
         return jsonify({'access_token': access_token, 'user_id': user.id, 'redirect_url': url_for('main.main_page')})
     else:
+        login_limiter_email.fail(email_key)
+        login_limiter_ip.fail(ip_key)
         return jsonify({'message': 'Login failed!'}), 401
 
 
+def _busy():
+    return jsonify({'message': 'Server busy, please retry shortly.'}), 503, {'Retry-After': '2'}
+
+
 @main.route('/logout')
 def logout():
+    if 'chat_id' in session:
+        memory_store.clear(session['chat_id'])
     session.clear()
     return redirect(url_for('main.index'))
 
@@ -91,14 +138,25 @@ def getting_started():
 def user_profile():
     user_name = session.get('user_name', 'Guest')
     user_email = session.get('user_email', 'guest@example.com')
-    print("User email from session:", user_email)  # Debugging line
+    current_app.logger.debug('User profile page for %s', user_email)
     return render_template('user-profile.html', user_name=user_name, user_email=user_email)
 
 @main.route('/user-activities')
 def user_activities():
     user_name = session.get('user_name', 'Guest')
     user_email = session.get('user_email', 'guest@example.com')
-    return render_template('user-activities.html',user_name=user_name, user_email=user_email)
+    activity = activity_summary(session['user_id']) if 'user_id' in session else None
+    return render_template('user-activities.html',user_name=user_name, user_email=user_email, activity=activity)
+
+@main.route('/user-activities/summary')
+def user_activities_summary():
+    if 'user_id' not in session:
+        return jsonify({'message': 'Not logged in'}), 401
+    try:
+        days = min(max(int(request.args.get('days', 30)), 1), 366)
+    except ValueError:
+        return jsonify({'message': 'Invalid days'}), 400
+    return jsonify(activity_summary(session['user_id'], days=days))
 
 @main.route('/user-profile-settings')
 def user_profile_settings():
@@ -113,70 +171,61 @@ def user_account_settings():
     return render_template('user-account-settings.html',user_name=user_name, user_email=user_email)
 
 
+# Page size for /users when ?limit is not given, and the largest allowed
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def _requested_fields():
+    """Fields named in ``?fields=id,email`` (all of USER_FIELDS by default), or None if any is unknown."""
+    if not request.args.get('fields'):
+        return USER_FIELDS
+    fields = tuple(field.strip() for field in request.args['fields'].split(',') if field.strip())
+    if not fields or any(field not in USER_FIELDS for field in fields):
+        return None
+    return fields
+
+
+def _columns(fields):
+    # Only the requested columns are selected; id is always needed for the cursor
+    return [getattr(User, field) for field in dict.fromkeys(('id',) + fields)]
+
+
 @main.route('/users', methods=['GET'])
 @jwt_required()
 def get_users():
-    users = User.query.filter_by(is_active=1).all()
-    output = []
-    for user in users:
-        user_data = {
-            'id': user.id,
-            'email': user.email,
-            'full_name': user.full_name,
-            'age': user.age,
-            'gender': user.gender,
-            'street_address': user.street_address,
-            'city': user.city,
-            'state': user.state,
-            'country': user.country,
-            'zip': user.zip,
-            'diagnose_date': user.diagnose_date,
-            'blood_glucose_level': user.blood_glucose_level,
-            'blood_glucose_fasting_level': user.blood_glucose_fasting_level,
-            'medications': user.medications,
-            'medical_conditions': user.medical_conditions,
-            'dietary_pref': user.dietary_pref,
-            'physical_activity': user.physical_activity,
-            'weight': user.weight,
-            'height': user.height,
-            'management_goals': user.management_goals,
-            'learning_preference': user.learning_preference,
-            'created_on': user.created_on
-        }
-        output.append(user_data)
-    return jsonify({'users': output})
+    fields = _requested_fields()
+    if fields is None:
+        return jsonify({'message': f"Unknown field; choose from {', '.join(USER_FIELDS)}"}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+        after = int(request.args.get('after', 0))
+        created_since = request.args.get('created_since')
+        created_since = datetime.strptime(created_since, "%Y-%m-%d") if created_since else None
+    except ValueError:
+        return jsonify({'message': 'Invalid limit, after or created_since'}), 400
+
+    # Keyset pagination: each page continues after the last id of the previous one
+    query = User.query.with_entities(*_columns(fields)).filter(User.is_active == 1, User.id > after)
+    if request.args.get('email'):
+        query = query.filter(User.email == request.args['email'])
+    if created_since:
+        query = query.filter(User.created_on >= created_since)
+    rows = query.order_by(User.id).limit(limit + 1).all()
+
+    next_after = rows[limit - 1].id if len(rows) > limit else None
+    return jsonify({'users': [serialize_user(row, fields) for row in rows[:limit]], 'next_after': next_after})
 
 @main.route('/user/<user_id>', methods=['GET'])
 @jwt_required()
 def get_user(user_id):
-    user = User.query.filter_by(id=user_id, is_active=1).first() 
+    fields = _requested_fields()
+    if fields is None:
+        return jsonify({'message': f"Unknown field; choose from {', '.join(USER_FIELDS)}"}), 400
+    user = User.query.with_entities(*_columns(fields)).filter_by(id=user_id, is_active=1).first()
     if not user:
         return jsonify({'message': 'User not found!'})
-    user_data = {
-        'id': user.id,
-        'email': user.email,
-        'full_name': user.full_name,
-        'age': user.age,
-        'gender': user.gender,
-        'street_address': user.street_address,
-        'city': user.city,
-        'state': user.state,
-        'country': user.country,
-        'zip': user.zip,
-        'diagnose_date': user.diagnose_date,
-        'blood_glucose_level': user.blood_glucose_level,
-        'blood_glucose_fasting_level': user.blood_glucose_fasting_level,
-        'medications': user.medications,
-        'medical_conditions': user.medical_conditions,
-        'dietary_pref': user.dietary_pref,
-        'physical_activity': user.physical_activity,
-        'weight': user.weight,
-        'height': user.height,
-        'management_goals': user.management_goals,
-        'learning_preference': user.learning_preference,
-        'created_on': user.created_on
-    }
-    return jsonify({'user': user_data})
+    return jsonify({'user': serialize_user(user, fields)})
 
 @main.route('/user/<user_id>', methods=['PUT'])
 @jwt_required()
@@ -206,12 +255,17 @@ def update_user(user_id):
     user.learning_preference = data.get('learning_preference', user.learning_preference)
     
     if 'diagnose_date' in data:
-        user.diagnose_date = datetime.strptime(data.get('diagnose_date') , "%Y-%m-%d")
+        user.diagnose_date = datetime.strptime(data.get('diagnose_date') , "%Y-%m-%d").date()
     else:
         user.diagnose_date
 
     if 'password' in data:
-        user.password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+        try:
+            user.password = password_hasher.hash(data['password'])
+        except HasherBusy:
+            return _busy()
+    # Stored with the update; every worker's cache sees the new version on its next read
+    profile_cache.refresh(user)
     db.session.commit()
     return jsonify({'message': 'User updated successfully!'})
 
@@ -238,20 +292,125 @@ def chat():
     if not data or 'query' not in data:
         return jsonify({'message': 'Invalid request: missing query'}), 400
 
-    # Retrieve chat history from session or create a new one
-    chat_history = session.get('chat_history', [])
-    
-    # Append the user query to the chat history
-    chat_history.append({'role': 'user', 'content': data['query']})
-
-    # Generate the response with the maintained chat history
-    response = get_user_query_response(data['query'], chat_history)
+    # The conversation history itself is kept server-side in app.memory, keyed by this id
+    if 'chat_id' not in session:
+        session['chat_id'] = uuid4().hex
+
+    # Generate the response; the turn is added to the session's memory window
+    query, chat_id = data['query'], session['chat_id']
+    user_id = session.get('user_id')
+    start = time.perf_counter()
+    try:
+        if Config.CHAT_ASYNC:
+            service = get_service()  # load outside the event loop on the first request
+            response = chat_executor.run(lambda: service.aanswer(query, chat_id, user_id=user_id))
+        else:
+            response = get_user_query_response(query, chat_id, user_id=user_id)
+    except QueueFull:
+        return jsonify({'message': 'Too many chat requests, please retry shortly.'}), 503, {'Retry-After': '5'}
+    except FutureTimeoutError:
+        return jsonify({'message': 'Request timed out.'}), 504
+    except LLMUnavailable:
+        current_app.logger.exception('No LLM could answer the chat request')
+        return jsonify({'message': 'The assistant is unavailable, please retry shortly.'}), 503, {'Retry-After': '30'}
 
-    # Add AI's response to the chat history if available
     if response:
-        chat_history.append({'role': 'assistant', 'content': response})
-        session['chat_history'] = chat_history  # Update the session with the modified history
+        _record_chat(user_id, start)
         return jsonify({'response': response})
     else:
         return jsonify({'message': 'Request could not be processed.'}), 500
 
+
+
+
+def _record_chat(user_id, start):
+    # The pipeline notes the question's category on the request trace
+    trace = current()
+    activity_buffer.record_chat(user_id, category=trace.get('category') if trace else None,
+                                latency_ms=round((time.perf_counter() - start) * 1000))
+
+
+def _sse(data, event=None):
+    prefix = f"event: {event}\n" if event else ''
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@main.route('/chat/stream', methods=['POST'])
+@jwt_required(optional=True)
+def chat_stream():
+    data = request.get_json()
+
+    if not data or 'query' not in data:
+        return jsonify({'message': 'Invalid request: missing query'}), 400
+
+    # The session is saved before the body is streamed, so the id must exist now
+    if 'chat_id' not in session:
+        session['chat_id'] = uuid4().hex
+    query, chat_id = data['query'], session['chat_id']
+    user_id = session.get('user_id')
+
+    def generate():
+        start = time.perf_counter()
+        ttft = None
+        parts = []
+        try:
+            for token in stream_user_query_response(query, chat_id, user_id=user_id):
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                    observe('chat_time_to_first_token_seconds', ttft)
+                parts.append(token)
+                yield _sse({'token': token})
+        except Exception:
+            current_app.logger.exception('Streaming chat response failed')
+            yield _sse({'message': 'Request could not be processed.'}, event='error')
+            return
+        observe('chat_stream_duration_seconds', time.perf_counter() - start)
+        _record_chat(user_id, start)
+        yield _sse({'response': ''.join(parts), 'ttft_ms': round((ttft or 0) * 1000)}, event='done')
+
+    # X-Accel-Buffering stops nginx from holding the stream back until it completes
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@main.route('/metrics')
+def metrics():
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+def _is_admin():
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(Config.ADMIN_TOKEN) and hmac.compare_digest(token.encode(), Config.ADMIN_TOKEN.encode())
+
+
+@main.route('/admin/index', methods=['GET', 'POST'])
+def admin_index():
+    if not _is_admin():
+        return jsonify({'message': 'Forbidden'}), 403
+    indexes = get_service().indexes
+    if request.method == 'GET':
+        return jsonify(indexes.status())
+
+    # Make a published version current; every worker switches to it on its next poll
+    version = (request.get_json(silent=True) or {}).get('version')
+    if not version:
+        return jsonify({'message': 'Invalid request: missing version'}), 400
+    try:
+        set_current(indexes.root, version)
+    except ValueError as exc:
+        return jsonify({'message': str(exc)}), 404
+    if not indexes.reload(version):
+        return jsonify({'message': 'An index is already loading', **indexes.status()}), 409
+    return jsonify(indexes.status()), 202
+
+
+@main.route('/admin/index/rollback', methods=['POST'])
+def admin_index_rollback():
+    if not _is_admin():
+        return jsonify({'message': 'Forbidden'}), 403
+    indexes = get_service().indexes
+    try:
+        indexes.rollback()
+    except ValueError as exc:
+        return jsonify({'message': str(exc)}), 409
+    return jsonify(indexes.status())
@@ -0,0 +1,299 @@
+import json
+import logging
+import math
+import os
+import pickle
+import sqlite3
+import threading
+from collections.abc import Mapping
+
+import faiss
+import numpy as np
+
+INDEX_FILE = 'index.faiss'
+# Chunk texts and metadata, one row per index position
+CHUNKS_FILE = 'chunks.sqlite'
+# Pickled docstore written by FAISS.save_local; only read by convert()
+DOCSTORE_FILE = 'index.pkl'
+# Approximate index built from the exact one; the exact index.faiss stays the
+# source of truth so incremental ingestion can keep deleting and adding vectors
+SEARCH_INDEX_FILE = 'search.faiss'
+INDEX_TYPES = ('flat', 'ivf', 'hnsw', 'ivfpq')
+
+logger = logging.getLogger(__name__)
+
+
+def auto_nlist(n):
+    # Common rule of thumb of ~4*sqrt(n) lists, limited so that every list
+    # still gets the 39 training points faiss asks for
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def pq_subquantizers(d, m):
+    # The number of sub-quantizers has to divide the dimension
+    while d % m:
+        m -= 1
+    return m
+
+
+def build_search_index(vectors, index_type, nlist=None, hnsw_m=32, pq_m=48, train_sample=50000, seed=0):
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    n, d = vectors.shape
+    if index_type == 'flat':
+        index = faiss.IndexFlatL2(d)
+    elif index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(d, hnsw_m)
+        index.hnsw.efConstruction = 200
+    elif index_type in ('ivf', 'ivfpq'):
+        nlist = max(1, min(nlist or auto_nlist(n), n))
+        quantizer = faiss.IndexFlatL2(d)
+        if index_type == 'ivf':
+            index = faiss.IndexIVFFlat(quantizer, d, nlist)
+        else:
+            # 8-bit codes need 256 centroids per sub-quantizer; use fewer bits on small corpora
+            nbits = max(4, min(8, int(math.log2(max(n // 39, 16)))))
+            index = faiss.IndexIVFPQ(quantizer, d, nlist, pq_subquantizers(d, pq_m), nbits)
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(n, min(n, train_sample), replace=False)]
+        index.train(sample)
+    else:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    index.add(vectors)
+    if index_type in ('ivf', 'ivfpq'):
+        # MMR reranking reconstructs the fetched vectors, which IVF can only do
+        # with a direct map; write_index persists it so mmap'd workers share it
+        faiss.extract_index_ivf(index).make_direct_map()
+    return index
+
+
+def index_vectors(index):
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        if nprobe:
+            ivf.nprobe = nprobe
+        if ivf.direct_map.no():
+            # Built into every worker's private memory; ingest persists it instead
+            logger.warning('IVF index has no direct map, building one; re-run ingest to store it with the index')
+            ivf.make_direct_map()
+    if ef_search and isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+
+
+class SQLiteDocstore:
+    """Read-only docstore that fetches chunks from ``chunks.sqlite`` on demand.
+
+    Documents are keyed by their index position, so nothing but the rows that
+    a search actually returns is ever read into memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.connection = connection
+        return connection
+
+    def search(self, position):
+        from langchain_core.documents import Document
+        row = self._connection().execute('SELECT text, metadata FROM chunks WHERE position = ?',
+                                         (position,)).fetchone()
+        if row is None:
+            return f"ID {position} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+
+class PositionIds(Mapping):
+    """Identity ``index_to_docstore_id`` for a docstore keyed by position."""
+
+    def __init__(self, size):
+        self.size = size
+
+    def __getitem__(self, position):
+        if not 0 <= position < self.size:
+            raise KeyError(position)
+        return int(position)
+
+    def __iter__(self):
+        return iter(range(self.size))
+
+    def __len__(self):
+        return self.size
+
+
+class ChunkUpdates:
+    """Docstore for an ingest run: the chunks of an existing ``chunks.sqlite`` plus the run's changes.
+
+    Documents are keyed by chunk id. Only added chunks and changed metadata
+    are held in memory; everything else is read from the file when asked for.
+    """
+
+    def __init__(self, path, batch_size=1000):
+        self.path = path
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        self._added = {}
+        self._metadata = {}
+        self._deleted = set()
+
+    def search(self, chunk_id):
+        from langchain_core.documents import Document
+        if chunk_id in self._added:
+            return self._added[chunk_id]
+        row = None if chunk_id in self._deleted else self.connection.execute(
+            'SELECT text, metadata FROM chunks WHERE id = ?', (chunk_id,)).fetchone()
+        if row is None:
+            return f"ID {chunk_id} not found."
+        return Document(page_content=row[0], metadata=self._metadata.get(chunk_id) or json.loads(row[1]))
+
+    def add(self, texts):
+        self._added.update(texts)
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            self._added.pop(chunk_id, None)
+            self._metadata.pop(chunk_id, None)
+            self._deleted.add(chunk_id)
+
+    def set_metadata(self, chunk_id, metadata):
+        if chunk_id in self._added:
+            self._added[chunk_id].metadata = metadata
+        else:
+            self._metadata[chunk_id] = metadata
+
+    def documents(self, ids):
+        """Yield the documents of ``ids`` in order, reading stored ones ``batch_size`` at a time."""
+        from langchain_core.documents import Document
+        for start in range(0, len(ids), self.batch_size):
+            batch = ids[start:start + self.batch_size]
+            wanted = [chunk_id for chunk_id in batch if chunk_id not in self._added]
+            stored = {}
+            if wanted:
+                rows = self.connection.execute(
+                    f"SELECT id, text, metadata FROM chunks WHERE id IN ({','.join('?' * len(wanted))})", wanted)
+                stored = {chunk_id: (text, metadata) for chunk_id, text, metadata in rows}
+            for chunk_id in batch:
+                if chunk_id in self._added:
+                    yield self._added[chunk_id]
+                else:
+                    text, metadata = stored[chunk_id]
+                    yield Document(page_content=text,
+                                   metadata=self._metadata.get(chunk_id) or json.loads(metadata))
+
+
+def chunk_texts(path, batch_size=1000):
+    """Yield the chunk texts of a chunks file in position order, ``batch_size`` rows at a time."""
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        cursor = connection.execute('SELECT text FROM chunks ORDER BY position')
+        while rows := cursor.fetchmany(batch_size):
+            for (text,) in rows:
+                yield text
+    finally:
+        connection.close()
+
+
+def write_chunks(path, rows):
+    """Write ``(position, id, text, metadata)`` rows to a fresh chunks file."""
+    if os.path.exists(path):
+        os.remove(path)
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute('CREATE TABLE chunks (position INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, '
+                           'text TEXT NOT NULL, metadata TEXT NOT NULL)')
+        connection.executemany('INSERT INTO chunks VALUES (?, ?, ?, ?)',
+                               ((position, chunk_id, text, json.dumps(metadata))
+                                for position, chunk_id, text, metadata in rows))
+    connection.close()
+
+
+def save_store(db, db_path):
+    """Write a langchain FAISS store as index.faiss plus chunks.sqlite."""
+    os.makedirs(db_path, exist_ok=True)
+    faiss.write_index(db.index, os.path.join(db_path, INDEX_FILE))
+
+    def rows():
+        positions = sorted(db.index_to_docstore_id.items())
+        ids = [chunk_id for _, chunk_id in positions]
+        if isinstance(db.docstore, ChunkUpdates):
+            docs = db.docstore.documents(ids)
+        else:
+            docs = (db.docstore.search(chunk_id) for chunk_id in ids)
+        for (position, chunk_id), doc in zip(positions, docs):
+            yield position, chunk_id, doc.page_content, doc.metadata
+    write_chunks(os.path.join(db_path, CHUNKS_FILE), rows())
+
+
+def load_store_for_update(db_path, embeddings):
+    """Load the exact index into a mutable FAISS store for ingestion.
+
+    Of the chunks only the ids are read up front; texts and metadata stay in
+    ``chunks.sqlite`` until they are needed (see ``ChunkUpdates``).
+    """
+    from langchain_community.docstore.base import AddableMixin
+    from langchain_community.vectorstores import FAISS
+    # FAISS.add_embeddings only accepts docstores that are AddableMixins
+    AddableMixin.register(ChunkUpdates)
+    index = faiss.read_index(os.path.join(db_path, INDEX_FILE))
+    docstore = ChunkUpdates(os.path.join(db_path, CHUNKS_FILE))
+    index_to_docstore_id = dict(docstore.connection.execute('SELECT position, id FROM chunks ORDER BY position'))
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def read_index_mmap(path):
+    # Memory-mapped and read-only, so every worker shares the same page cache
+    # instead of holding its own copy of the vectors
+    flag = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP)
+    try:
+        return faiss.read_index(path, faiss.IO_FLAG_READ_ONLY | flag)
+    except RuntimeError:
+        logger.warning('%s cannot be memory-mapped, reading it into memory', path)
+        return faiss.read_index(path)
+
+
+def load_store(db_path, embeddings, nprobe=None, ef_search=None):
+    """Load the vector store for serving, preferring the approximate search index if one was built."""
+    from langchain_community.vectorstores import FAISS
+    index_file = SEARCH_INDEX_FILE if os.path.exists(os.path.join(db_path, SEARCH_INDEX_FILE)) else INDEX_FILE
+    index = read_index_mmap(os.path.join(db_path, index_file))
+    set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+    chunks_path = os.path.join(db_path, CHUNKS_FILE)
+    if not os.path.exists(chunks_path):
+        raise FileNotFoundError(f"{chunks_path} is missing; run 'python -m app.vectorstore convert {db_path}'")
+    return FAISS(embeddings, index, SQLiteDocstore(chunks_path), PositionIds(index.ntotal))
+
+
+def convert(db_path, out_path=None):
+    """Convert a FAISS.save_local store (index.pkl docstore) into chunks.sqlite, in ``out_path`` if given."""
+    # The one place a pickle is still read: the store being converted is our own
+    with open(os.path.join(db_path, DOCSTORE_FILE), 'rb') as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    def rows():
+        for position, chunk_id in sorted(index_to_docstore_id.items()):
+            doc = docstore.search(chunk_id)
+            yield position, chunk_id, doc.page_content, doc.metadata
+    write_chunks(os.path.join(out_path or db_path, CHUNKS_FILE), rows())
+    return len(index_to_docstore_id)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Vector store maintenance')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert_parser = subparsers.add_parser('convert', help='replace the index.pkl docstore with chunks.sqlite')
+    convert_parser.add_argument('db_path', nargs='?', default='vectorstore/db_faiss')
+    convert_parser.add_argument('--remove-pickle', action='store_true', help='delete index.pkl afterwards')
+    args = parser.parse_args()
+
+    count = convert(args.db_path)
+    if args.remove_pickle:
+        os.remove(os.path.join(args.db_path, DOCSTORE_FILE))
+    print(f"wrote {count} chunks to {os.path.join(args.db_path, CHUNKS_FILE)}")
@@ -0,0 +1,38 @@
+import os
+
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+# Read back by app.config to split LLM_REQUESTS_PER_MINUTE between the workers,
+# so it has to be set before app.config is imported
+os.environ['GUNICORN_WORKERS'] = str(workers)
+
+from app.config import Config  # noqa: E402
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+# Chat requests mostly wait on the LLM event loop (see app.concurrency), so
+# threads rather than processes carry the concurrency
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+# With preload the model and index are loaded once in the master and the
+# workers inherit them on fork; without it each worker loads its own copy
+preload_app = os.environ.get('GUNICORN_PRELOAD', '0') == '1'
+
+
+def _warm_up(log):
+    from app.llm import warm_up, startup_report
+    log.info('LLM stack loaded: %s', startup_report(warm_up()))
+
+
+def when_ready(server):
+    if preload_app and Config.LLM_WARMUP:
+        _warm_up(server.log)
+
+
+def post_fork(server, worker):
+    if not preload_app and Config.LLM_WARMUP:
+        _warm_up(server.log)
+
+
+def worker_exit(server, worker):
+    # Write out buffered login/chat activity before the worker goes away
+    from app.activity import activity_buffer
+    activity_buffer.close()
@@ -0,0 +1,97 @@
+"""chat history tables
+
+Revision ID: 3f1c2a9d7b10
+Revises: 
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d7b10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # First revision: databases created before migrations were tracked already have the user tables
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'user' not in existing:
+        op.create_table('user',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('email', sa.String(length=150), nullable=False),
+        sa.Column('password', sa.String(length=150), nullable=False),
+        sa.Column('created_on', sa.DateTime(), nullable=True),
+        sa.Column('full_name', sa.String(length=150), nullable=True),
+        sa.Column('age', sa.Integer(), nullable=True),
+        sa.Column('gender', sa.Integer(), nullable=True),
+        sa.Column('street_address', sa.String(length=150), nullable=True),
+        sa.Column('city', sa.String(length=100), nullable=True),
+        sa.Column('state', sa.String(length=100), nullable=True),
+        sa.Column('country', sa.String(length=100), nullable=True),
+        sa.Column('zip', sa.String(length=20), nullable=True),
+        sa.Column('diagnose_date', sa.Date(), nullable=True),
+        sa.Column('blood_glucose_level', sa.Float(), nullable=True),
+        sa.Column('blood_glucose_fasting_level', sa.Float(), nullable=True),
+        sa.Column('medications', sa.String(), nullable=True),
+        sa.Column('medical_conditions', sa.String(), nullable=True),
+        sa.Column('dietary_pref', sa.Integer(), nullable=True),
+        sa.Column('physical_activity', sa.Integer(), nullable=True),
+        sa.Column('weight', sa.Float(), nullable=True),
+        sa.Column('height', sa.Float(), nullable=True),
+        sa.Column('management_goals', sa.String(), nullable=True),
+        sa.Column('learning_preference', sa.String(), nullable=True),
+        sa.Column('is_active', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email')
+        )
+    if 'login_history' not in existing:
+        op.create_table('login_history',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+    op.create_table('conversation',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('summary', sa.Text(), nullable=False),
+    sa.Column('summarized_through', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_conversation_updated_at'), ['updated_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_conversation_user_id'), ['user_id'], unique=False)
+
+    op.create_table('chat_message',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('conversation_id', sa.String(length=32), nullable=False),
+    sa.Column('question', sa.Text(), nullable=False),
+    sa.Column('answer', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['conversation_id'], ['conversation.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('chat_message', schema=None) as batch_op:
+        batch_op.create_index('ix_chat_message_conversation_id_id', ['conversation_id', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('chat_message', schema=None) as batch_op:
+        batch_op.drop_index('ix_chat_message_conversation_id_id')
+
+    op.drop_table('chat_message')
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_conversation_user_id'))
+        batch_op.drop_index(batch_op.f('ix_conversation_updated_at'))
+
+    op.drop_table('conversation')
@@ -0,0 +1,36 @@
+"""user and login history indexes
+
+Revision ID: 8b4e6d2c5a31
+Revises: 3f1c2a9d7b10
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b4e6d2c5a31'
+down_revision = '3f1c2a9d7b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_is_active'), ['is_active'], unique=False)
+        batch_op.create_index(batch_op.f('ix_user_created_on'), ['created_on'], unique=False)
+
+    with op.batch_alter_table('login_history', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_login_history_timestamp'), ['timestamp'], unique=False)
+        batch_op.create_index('ix_login_history_user_id_timestamp', ['user_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('login_history', schema=None) as batch_op:
+        batch_op.drop_index('ix_login_history_user_id_timestamp')
+        batch_op.drop_index(batch_op.f('ix_login_history_timestamp'))
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_created_on'))
+        batch_op.drop_index(batch_op.f('ix_user_is_active'))
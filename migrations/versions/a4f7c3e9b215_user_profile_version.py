@@ -0,0 +1,27 @@
+"""user profile version
+
+Revision ID: a4f7c3e9b215
+Revises: e2d5b8a3c916
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4f7c3e9b215'
+down_revision = 'e2d5b8a3c916'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Bumped on every profile update so each worker's app.profile cache notices it
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('profile_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('profile_version')
@@ -0,0 +1,51 @@
+"""activity events and daily totals
+
+Revision ID: c7a9e1f04d22
+Revises: 8b4e6d2c5a31
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7a9e1f04d22'
+down_revision = '8b4e6d2c5a31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('activity_event',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('kind', sa.String(length=32), nullable=False),
+    sa.Column('category', sa.String(length=32), nullable=True),
+    sa.Column('latency_ms', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('activity_event', schema=None) as batch_op:
+        batch_op.create_index('ix_activity_event_user_id_created_at', ['user_id', 'created_at'], unique=False)
+
+    op.create_table('activity_daily',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('kind', sa.String(length=32), nullable=False),
+    sa.Column('category', sa.String(length=32), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('latency_ms_sum', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'day', 'kind', 'category', name='uq_activity_daily_key')
+    )
+
+
+def downgrade():
+    op.drop_table('activity_daily')
+    with op.batch_alter_table('activity_event', schema=None) as batch_op:
+        batch_op.drop_index('ix_activity_event_user_id_created_at')
+
+    op.drop_table('activity_event')
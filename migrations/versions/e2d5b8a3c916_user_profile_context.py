@@ -0,0 +1,29 @@
+"""precomputed user profile context
+
+Revision ID: e2d5b8a3c916
+Revises: c7a9e1f04d22
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2d5b8a3c916'
+down_revision = 'c7a9e1f04d22'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Left empty here; app.profile fills them in on a user's first chat or next profile update
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('profile_context', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('profile_terms', sa.String(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('profile_terms')
+        batch_op.drop_column('profile_context')
@@ -5,4 +5,5 @@ app = create_app()
 if __name__ == '__main__':
     app.run()
 else:
-    gunicorn_app = create_app()
\ No newline at end of file
+    # Same object under gunicorn; building a second app would only repeat the setup
+    gunicorn_app = app
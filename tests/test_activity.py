@@ -0,0 +1,57 @@
+from sqlalchemy import create_engine, func, select
+
+from app import db
+from app.activity import ActivityBuffer
+from app.models import ActivityDaily, ActivityEvent, LoginHistory
+
+TABLES = [LoginHistory.__table__, ActivityEvent.__table__, ActivityDaily.__table__]
+
+
+def buffer(engine, **kwargs):
+    buf = ActivityBuffer(batch_size=1000, flush_interval=60, **kwargs)
+    buf.engine = engine
+    return buf
+
+
+def count(engine, table):
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(table)).scalar()
+
+
+def test_bad_row_is_retried_alone_then_dropped(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'activity.db'}")
+    db.metadata.create_all(engine, tables=TABLES)
+    buf = buffer(engine, max_attempts=2)
+    buf.record_login(1)
+    # login_history.user_id is NOT NULL
+    buf.record_login(None)
+    buf.record_chat(2, category='diet', latency_ms=120)
+
+    assert buf.flush() == 2
+    assert count(engine, LoginHistory.__table__) == 1
+    assert count(engine, ActivityEvent.__table__) == 1
+    assert count(engine, ActivityDaily.__table__) == 2
+    assert len(buf._rows) == 1
+
+    buf.record_login(3)
+    assert buf.flush() == 1
+    assert buf._rows == []
+    assert count(engine, LoginHistory.__table__) == 2
+    buf._closed = True
+
+
+def test_rows_are_kept_while_the_database_is_unreachable(tmp_path):
+    buf = buffer(create_engine(f"sqlite:///{tmp_path / 'missing' / 'activity.db'}"), max_attempts=2)
+    for user_id in (1, 2, 3):
+        buf.record_login(user_id)
+
+    assert buf.flush() == 0
+    assert buf.flush() == 0
+    assert len(buf._rows) == 3
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'activity.db'}")
+    db.metadata.create_all(engine, tables=TABLES)
+    buf.engine = engine
+    assert buf.flush() == 3
+    assert count(engine, LoginHistory.__table__) == 3
+    buf._closed = True
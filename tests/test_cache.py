@@ -0,0 +1,87 @@
+import time
+
+import numpy as np
+
+from app.cache import SemanticCache
+from app.llm import LLMService
+from app.profile import EMPTY, Profile
+
+VECTORS = {
+    'what is insulin': [1.0, 0.0, 0.0],
+    'what is insulin?': [0.99, 0.1, 0.0],
+    'how do I test my blood sugar': [0.0, 1.0, 0.0],
+    'what about for children?': [0.0, 0.0, 1.0],
+}
+
+
+class TableEmbeddings:
+    def embed_query(self, text):
+        return VECTORS[text]
+
+
+def cache(**kwargs):
+    return SemanticCache(TableEmbeddings(), **kwargs)
+
+
+def test_similar_question_hits():
+    semantic_cache = cache(threshold=0.9)
+    semantic_cache.put('what is insulin', 'A hormone.')
+    assert semantic_cache.get('what is insulin?') == 'A hormone.'
+    assert semantic_cache.get('how do I test my blood sugar') is None
+    assert (semantic_cache.hits, semantic_cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    semantic_cache = cache(max_size=2)
+    semantic_cache.put('what is insulin', 'A hormone.')
+    semantic_cache.put('how do I test my blood sugar', 'With a meter.')
+    semantic_cache.get('what is insulin')
+    semantic_cache.put('what about for children?', 'Ask a paediatrician.')
+    assert semantic_cache.get('what is insulin') == 'A hormone.'
+    assert semantic_cache.get('how do I test my blood sugar') is None
+
+
+def test_repeated_question_replaces_its_entry():
+    semantic_cache = cache(threshold=0.9, max_size=3)
+    semantic_cache.put('what is insulin', 'A hormone.')
+    semantic_cache.put('how do I test my blood sugar', 'With a meter.')
+    semantic_cache.put('what is insulin?', 'A hormone made by the pancreas.')
+    assert semantic_cache.stats()['size'] == 2
+    assert semantic_cache.get('what is insulin') == 'A hormone made by the pancreas.'
+    assert semantic_cache.get('how do I test my blood sugar') == 'With a meter.'
+
+
+def test_zero_size_cache_stores_nothing():
+    semantic_cache = cache(max_size=0)
+    semantic_cache.put('what is insulin', 'A hormone.')
+    assert semantic_cache.get('what is insulin') is None
+
+
+def test_entries_expire(monkeypatch):
+    semantic_cache = cache(ttl=10)
+    semantic_cache.put('what is insulin', 'A hormone.')
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 11)
+    assert semantic_cache.get('what is insulin') is None
+
+
+def test_new_index_version_clears_the_cache():
+    semantic_cache = cache()
+    semantic_cache.check_version('v1')
+    semantic_cache.put('what is insulin', 'A hormone.')
+    semantic_cache.check_version('v1')
+    assert semantic_cache.get('what is insulin') == 'A hormone.'
+    semantic_cache.check_version('v2')
+    assert semantic_cache.get('what is insulin') is None
+
+
+def test_embed_normalizes():
+    vector = cache().embed('what is insulin?')
+    assert np.isclose(np.linalg.norm(vector), 1.0)
+
+
+def test_cache_is_skipped_for_follow_ups_and_profiles():
+    service = LLMService()
+    assert service.use_cache(EMPTY, '')
+    assert not service.use_cache(EMPTY, 'Human: what is insulin\nAI: A hormone.')
+    assert not service.use_cache(Profile('Age: 40', ''), '')
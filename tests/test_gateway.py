@@ -0,0 +1,167 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from app.config import Config
+from app.gateway import TRIAL, CircuitBreaker, LLMGateway, LLMUnavailable, TokenBucket, rate_limiter
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f'HTTP {status_code}')
+        self.status_code = status_code
+
+
+class ScriptedModel:
+    """Raises or answers according to ``script``, one entry per call; answers once it runs out."""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+
+    def _next(self):
+        self.calls += 1
+        outcome = self.script.pop(0) if self.script else 'ok'
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=outcome))])
+
+    def _generate(self, messages, stop=None, **kwargs):
+        return self._next()
+
+    async def _agenerate(self, messages, stop=None, **kwargs):
+        if self.script and self.script[0] == 'hang':
+            self.script.pop(0)
+            await asyncio.sleep(60)
+        return self._next()
+
+
+MESSAGES = [HumanMessage(content='hello')]
+
+
+def gateway(model, **kwargs):
+    options = dict(timeout=5, deadline=10, retries=0, backoff=0, hedge_percentile=0,
+                   breaker_failures=1, breaker_cooldown=0)
+    options.update(kwargs)
+    return LLMGateway(model, **options)
+
+
+def test_breaker_opens_and_lets_one_trial_through():
+    breaker = CircuitBreaker(failures=2, cooldown=0)
+    assert breaker.allow() is True
+    assert breaker.failure() is False
+    assert breaker.failure() is True
+    assert breaker.allow() == TRIAL
+    assert breaker.allow() is False
+    breaker.failure()
+    assert breaker.allow() == TRIAL
+    breaker.success()
+    assert not breaker.is_open
+    assert breaker.allow() is True
+
+
+def test_breaker_stays_open_during_cooldown():
+    breaker = CircuitBreaker(failures=1, cooldown=60)
+    breaker.failure()
+    assert breaker.allow() is False
+
+
+def test_release_frees_only_the_trial():
+    breaker = CircuitBreaker(failures=1, cooldown=0)
+    breaker.failure()
+    assert breaker.allow() == TRIAL
+    breaker.release(True)
+    assert breaker.allow() is False
+    breaker.release(TRIAL)
+    assert breaker.allow() == TRIAL
+
+
+def test_permanent_error_on_trial_closes_the_breaker():
+    model = ScriptedModel(RuntimeError('down'), StatusError(400))
+    llm = gateway(model)
+    with pytest.raises(LLMUnavailable):
+        llm.generate(MESSAGES)
+    assert llm.primary.breaker.is_open
+    with pytest.raises(StatusError):
+        llm.generate(MESSAGES)
+    assert not llm.primary.breaker.is_open
+    assert llm.generate(MESSAGES).generations[0].message.content == 'ok'
+
+
+def test_permanent_error_is_not_retried():
+    model = ScriptedModel(StatusError(401))
+    with pytest.raises(StatusError):
+        gateway(model, retries=2).generate(MESSAGES)
+    assert model.calls == 1
+
+
+def test_cancelled_trial_releases_the_breaker():
+    model = ScriptedModel(RuntimeError('down'), 'hang')
+    llm = gateway(model)
+    with pytest.raises(LLMUnavailable):
+        llm.generate(MESSAGES)
+
+    async def cancel_trial():
+        task = asyncio.ensure_future(llm.agenerate(MESSAGES))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_trial())
+    assert llm.primary.breaker.allow() == TRIAL
+
+
+def test_retries_then_answers():
+    model = ScriptedModel(RuntimeError('flaky'), 'second')
+    llm = gateway(model, retries=1, breaker_failures=5)
+    assert llm.generate(MESSAGES).generations[0].message.content == 'second'
+    assert model.calls == 2
+
+
+def test_falls_back_when_the_primary_fails():
+    primary, fallback = ScriptedModel(*[RuntimeError('down')] * 5), ScriptedModel('fallback')
+    llm = LLMGateway(primary, fallback, timeout=1, deadline=5, retries=0, backoff=0, hedge_percentile=0)
+    assert llm.generate(MESSAGES).generations[0].message.content == 'fallback'
+
+
+def test_token_bucket_reserves_ahead_and_refuses_past_max_wait():
+    bucket = TokenBucket(rate=1, capacity=1)
+    assert bucket.reserve() == 0
+    assert bucket.reserve(max_wait=0) is None
+    assert bucket.reserve() == pytest.approx(1, abs=0.05)
+    assert bucket.reserve() == pytest.approx(2, abs=0.05)
+
+
+def test_every_retry_takes_a_token():
+    bucket = TokenBucket(rate=0.01, capacity=3)
+    model = ScriptedModel(*[RuntimeError('boom')] * 3)
+    llm = gateway(model, retries=2, breaker_failures=5, limiter=bucket)
+    with pytest.raises(LLMUnavailable):
+        llm.generate(MESSAGES)
+    assert model.calls == 3
+    assert bucket.reserve(max_wait=0) is None
+
+
+def test_no_attempt_when_the_token_comes_after_the_deadline():
+    model = ScriptedModel()
+    llm = gateway(model, deadline=1, limiter=TokenBucket(rate=0.1, capacity=1))
+    asyncio.run(llm.agenerate(MESSAGES))
+    with pytest.raises(LLMUnavailable):
+        asyncio.run(llm.agenerate(MESSAGES))
+    assert model.calls == 1
+    # The refused attempt left the breaker's trial slot alone
+    assert not llm.primary.breaker.is_open
+
+
+def test_rate_limiter_splits_the_limit_and_bursts_a_minute(monkeypatch):
+    monkeypatch.setattr(Config, 'LLM_REQUESTS_PER_MINUTE', 30)
+    monkeypatch.setattr(Config, 'LLM_RATE_LIMIT_WORKERS', 2)
+    bucket = rate_limiter()
+    assert bucket.rate * 60 == pytest.approx(15)
+    # The few calls of one chat turn do not wait on an idle service
+    assert [bucket.reserve() for _ in range(5)] == [0] * 5
+    monkeypatch.setattr(Config, 'LLM_REQUESTS_PER_MINUTE', 0)
+    assert rate_limiter() is None
@@ -0,0 +1,116 @@
+import os
+import time
+
+from app.indexes import (RETIRED_FILE, IndexManager, adopt, current_version, prune, publish, set_current,
+                         versions)
+
+
+def build_version(root, name):
+    os.makedirs(os.path.join(root, 'versions', name))
+
+
+def wait_for(manager):
+    for _ in range(200):
+        if manager.loading is None:
+            return
+        time.sleep(0.01)
+
+
+def test_prune_keeps_the_previous_and_recently_retired_versions(tmp_path):
+    root = str(tmp_path)
+    for name in ('v1', 'v2', 'v3', 'v4'):
+        build_version(root, name)
+        set_current(root, name)
+    prune(root, keep=1, grace=600, protect=('v3',))
+    # v1 and v2 were retired moments ago; a worker may still be serving them
+    assert versions(root) == ['v1', 'v2', 'v3', 'v4']
+
+    prune(root, keep=1, grace=0, protect=('v3',))
+    assert versions(root) == ['v3', 'v4']
+
+
+def test_publish_never_prunes_the_version_it_replaces(tmp_path):
+    root = str(tmp_path)
+    for name in ('v1', 'v2', 'v3'):
+        tmp = os.path.join(root, 'versions', f'.{name}.tmp')
+        os.makedirs(tmp)
+        publish(root, name, tmp, keep=1, grace=0)
+    assert versions(root) == ['v2', 'v3']
+    assert current_version(root) == 'v3'
+    assert os.path.exists(os.path.join(root, 'versions', 'v2', RETIRED_FILE))
+
+
+def test_manager_swaps_in_a_new_version_and_rolls_back(tmp_path):
+    root = str(tmp_path)
+    for name in ('v1', 'v2'):
+        build_version(root, name)
+    set_current(root, 'v1')
+    builds = []
+
+    def build(path):
+        builds.append(os.path.basename(path))
+        return os.path.basename(path)
+
+    manager = IndexManager(root, build, poll_interval=0)
+    manager.load()
+    assert manager.version == 'v1'
+
+    set_current(root, 'v2')
+    manager.poll()
+    wait_for(manager)
+    assert manager.version == 'v2'
+    assert manager.previous.version == 'v1'
+
+    assert manager.rollback() == 'v1'
+    assert current_version(root) == 'v1'
+    assert manager.previous.version == 'v2'
+    # Both versions stayed in memory: nothing was rebuilt
+    assert builds == ['v1', 'v2']
+
+
+def test_manager_keeps_serving_when_a_version_fails_to_load(tmp_path):
+    root = str(tmp_path)
+    for name in ('v1', 'v2'):
+        build_version(root, name)
+    set_current(root, 'v1')
+
+    def build(path):
+        if path.endswith('v2'):
+            raise OSError('corrupt index')
+        return path
+
+    manager = IndexManager(root, build, poll_interval=0)
+    manager.load()
+    set_current(root, 'v2')
+    manager.poll()
+    wait_for(manager)
+    assert manager.version == 'v1'
+    assert manager.error.startswith('v2')
+    # Not retried on every poll
+    manager.poll()
+    assert manager.loading is None
+
+
+def test_a_store_with_v1_and_no_current_adopts_it(tmp_path):
+    import faiss
+    import numpy as np
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+
+    root = str(tmp_path)
+    index = faiss.IndexFlatL2(2)
+    index.add(np.eye(2, dtype='float32'))
+    docstore = InMemoryDocstore({'a': Document(page_content='insulin dose'), 'b': Document(page_content='diet')})
+    FAISS(None, index, docstore, {0: 'a', 1: 'b'}).save_local(os.path.join(root, 'v1'))
+
+    assert adopt(root)
+    assert not adopt(root)
+    assert current_version(root) == 'v1'
+    assert sorted(os.listdir(os.path.join(root, 'versions', 'v1'))) == ['bm25.npz', 'bm25_vocab.json',
+                                                                        'chunks.sqlite', 'index.faiss']
+    # The original directory is left as it was
+    assert sorted(os.listdir(os.path.join(root, 'v1'))) == ['index.faiss', 'index.pkl']
+    builds = []
+    IndexManager(root, builds.append).load()
+    assert builds == [os.path.join(root, 'versions', 'v1')]
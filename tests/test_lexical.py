@@ -0,0 +1,17 @@
+from app.lexical import reciprocal_rank_fusion
+
+
+def test_agreement_between_rankings_beats_a_single_top_rank():
+    # 2 is first in one list only; 7 is third in both
+    assert reciprocal_rank_fusion([[2, 5, 7], [5, 9, 7]]) == [5, 7, 2, 9]
+
+
+def test_fusion_keeps_every_position_once_best_first():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 4]])
+    assert sorted(fused) == [1, 2, 3, 4]
+    assert fused[0] == 3
+    assert fused.index(1) < fused.index(2) < fused.index(4)
+
+
+def test_a_single_ranking_is_unchanged():
+    assert reciprocal_rank_fusion([[4, 1, 3]]) == [4, 1, 3]
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+
+from app.history import MemoryHistory, SQLHistory
+from app.memory import ConversationWindow
+
+
+class Summarizer:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, summary, turns):
+        self.calls.append(list(turns))
+        return ' '.join([summary] + [question for question, _ in turns]).strip()
+
+
+@pytest.fixture(params=['memory', 'sql'])
+def history(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryHistory()
+    history = SQLHistory(create_engine(f"sqlite:///{tmp_path / 'history.db'}"))
+    history.create_tables()
+    return history
+
+
+def window(history, max_turns=6, max_tokens=10000, summary_tokens=300):
+    return ConversationWindow(history, 'c1', max_turns, max_tokens, summary_tokens)
+
+
+def test_short_conversation_is_kept_whole(history):
+    conversation, summarize = window(history), Summarizer()
+    for i in range(6):
+        conversation.add(f'q{i}', f'a{i}', summarize=summarize)
+    assert summarize.calls == []
+    assert conversation.snapshot() == ('', [(f'q{i}', f'a{i}') for i in range(6)])
+
+
+def test_folding_halves_the_window(history):
+    conversation, summarize = window(history), Summarizer()
+    for i in range(7):
+        conversation.add(f'q{i}', f'a{i}', summarize=summarize)
+    assert summarize.calls == [[(f'q{i}', f'a{i}') for i in range(4)]]
+    summary, turns = conversation.snapshot()
+    assert summary == 'q0 q1 q2 q3'
+    assert turns == [(f'q{i}', f'a{i}') for i in range(4, 7)]
+
+
+def test_summarizer_runs_once_every_few_turns(history):
+    conversation, summarize = window(history), Summarizer()
+    for i in range(30):
+        conversation.add(f'q{i}', f'a{i}', summarize=summarize)
+        assert len(conversation.snapshot()[1]) <= 6
+    # Every fourth turn once the window is full, instead of every turn
+    assert len(summarize.calls) == 6
+
+
+def test_token_budget_evicts_to_half(history):
+    conversation, summarize = window(history, max_tokens=100), Summarizer()
+    for i in range(3):
+        conversation.add(f'q{i}', 'x' * 200, summarize=summarize)
+    _, turns = conversation.snapshot()
+    assert [question for question, _ in turns] == ['q2']
+
+
+def test_newest_turn_is_kept_even_when_over_budget(history):
+    conversation = window(history, max_tokens=10)
+    conversation.add('q0', 'x' * 400)
+    assert conversation.snapshot()[1] == [('q0', 'x' * 400)]
+
+
+def test_without_summarizer_the_questions_are_outlined(history):
+    conversation = window(history, max_turns=2)
+    for i in range(3):
+        conversation.add(f'q{i}', f'a{i}')
+    summary, turns = conversation.snapshot()
+    assert 'User asked: q0' in summary and 'User asked: q1' in summary
+    assert turns == [('q2', 'a2')]
+
+
+def test_summary_is_capped(history):
+    conversation = window(history, max_turns=2, summary_tokens=5)
+    for i in range(3):
+        conversation.add(f'q{i}', f'a{i}', summarize=lambda summary, turns: 'y' * 100)
+    assert len(conversation.snapshot()[0]) == 20
+
+
+def test_async_add(history):
+    conversation, calls = window(history, max_turns=2), []
+
+    async def summarize(summary, turns):
+        calls.append(turns)
+        return 'summary'
+
+    async def run():
+        for i in range(3):
+            await conversation.aadd(f'q{i}', f'a{i}', summarize)
+
+    asyncio.run(run())
+    assert calls == [[('q0', 'a0'), ('q1', 'a1')]]
+    assert conversation.snapshot() == ('summary', [('q2', 'a2')])
+
+
+def test_turns_left_by_a_failed_summary_are_folded_later(history):
+    conversation, summarize = window(history, max_turns=2), Summarizer()
+
+    def failing(summary, turns):
+        raise TimeoutError('summarizer')
+
+    conversation.add('q0', 'a0', summarize=summarize)
+    conversation.add('q1', 'a1', summarize=summarize)
+    with pytest.raises(TimeoutError):
+        conversation.add('q2', 'a2', summarize=failing)
+    conversation.add('q3', 'a3', summarize=summarize)
+    # q0 was never summarized, so it has to be part of the next fold
+    assert summarize.calls == [[('q0', 'a0'), ('q1', 'a1'), ('q2', 'a2')]]
+    assert conversation.snapshot() == ('q0 q1 q2', [('q3', 'a3')])
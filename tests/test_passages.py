@@ -0,0 +1,39 @@
+from app.passages import NearDuplicates, fingerprint
+
+TEXT = ('Metformin lowers blood sugar by reducing the amount of glucose the liver releases into the blood '
+        'and by helping the body respond better to insulin. It is usually taken with meals to reduce '
+        'stomach upset, and the dose is increased slowly over several weeks. Common side effects include '
+        'nausea, diarrhoea and a metallic taste, which often settle after the first month. Because metformin '
+        'does not make the pancreas release more insulin, it rarely causes low blood sugar on its own. '
+        'People with reduced kidney function may need a lower dose, and the medicine is usually paused '
+        'before surgery or scans that use contrast dye. Long-term use can lower vitamin B12 levels, so '
+        'your care team may check them once a year.')
+
+
+def distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def test_fingerprint_ignores_case_and_punctuation():
+    assert fingerprint(TEXT) == fingerprint(TEXT.upper().replace(',', ''))
+
+
+def test_a_small_edit_stays_within_the_threshold_and_other_text_does_not():
+    edited = TEXT.replace('several weeks', 'a few weeks')
+    other = ('Check your feet every day for cuts, blisters or swelling, because nerve damage can stop you '
+             'from feeling an injury until it has become infected.')
+    assert distance(fingerprint(TEXT), fingerprint(edited)) <= 7
+    assert distance(fingerprint(TEXT), fingerprint(other)) > 7
+
+
+def test_near_duplicates_match_up_to_the_distance():
+    duplicates = NearDuplicates(distance=7)
+    value = 0x0123456789ABCDEF
+    duplicates.add(value, 'chunk')
+    assert duplicates.find(value) == 'chunk'
+    # Seven bits flipped, all in different bands, is still a duplicate
+    assert duplicates.find(value ^ sum(1 << (8 * band) for band in range(7))) == 'chunk'
+    # An eighth bit is one too many
+    assert duplicates.find(value ^ sum(1 << (8 * band) for band in range(8))) is None
+    # Bits clustered in one band are still found through the untouched bands
+    assert duplicates.find(value ^ 0x7F) == 'chunk'
@@ -0,0 +1,41 @@
+from datetime import date, datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import User
+from app.profile import EMPTY, ProfileCache, build_profile
+
+
+def test_diagnose_date_renders_as_a_day():
+    user = User(diagnose_date=datetime(2020, 1, 2), medications='Metformin, insulin')
+    assert build_profile(user, 150).context == 'Diagnosed with diabetes: 2020-01-02; Medications: Metformin, insulin'
+    assert build_profile(User(diagnose_date=date(2020, 1, 2)), 150).context == 'Diagnosed with diabetes: 2020-01-02'
+
+
+def test_profile_is_cut_at_the_token_budget():
+    user = User(age=40, medications='m' * 100, medical_conditions='hypertension')
+    assert build_profile(user, 10).context == 'Age: 40'
+    assert build_profile(user, 10).terms == 'm' * 100 + ' hypertension'
+
+
+def test_update_through_one_worker_is_seen_by_another(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'site.db'}")
+    db.metadata.create_all(engine, tables=[User.__table__])
+    workers = [ProfileCache(), ProfileCache()]
+    for cache in workers:
+        cache.engine = engine
+    with Session(engine) as session:
+        user = User(email='a@example.com', password='x', age=40)
+        session.add(user)
+        session.commit()
+        user_id = user.id
+        # A row saved before profiles were stored is rendered on first use
+        assert [cache.get(user_id).context for cache in workers] == ['Age: 40', 'Age: 40']
+
+        user.age = 41
+        workers[0].refresh(user)
+        session.commit()
+    assert [cache.get(user_id).context for cache in workers] == ['Age: 41', 'Age: 41']
+    assert workers[0].get(None) is EMPTY
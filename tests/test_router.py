@@ -0,0 +1,36 @@
+import numpy as np
+
+from app.llm import LLMService
+from app.router import DIABETES, NOT_DIABETES, QueryRouter
+
+
+class AxisEmbeddings:
+    """Diabetes seeds lie on the x axis, other seeds on the y axis."""
+
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] if text.startswith('d') else [0.0, 1.0] for text in texts]
+
+
+def router(margin=0.1):
+    return QueryRouter(AxisEmbeddings(), margin=margin, diabetes_seeds=['d1', 'd2'], other_seeds=['o1', 'o2'])
+
+
+def unit(x, y):
+    vector = np.array([x, y], dtype='float32')
+    return vector / np.linalg.norm(vector)
+
+
+def test_router_decides_only_outside_the_margin():
+    query_router = router(margin=0.1)
+    assert query_router.classify('q', vector=unit(1, 0.2)) == DIABETES
+    assert query_router.classify('q', vector=unit(0.2, 1)) == NOT_DIABETES
+    # Close to both centroids: left to the LLM categorizer
+    assert query_router.classify('q', vector=unit(1, 0.95)) is None
+
+
+def test_follow_ups_fall_back_to_the_llm_categorizer():
+    service = LLMService()
+    service.router = router()
+    assert service.route('what is insulin', '', vector=unit(1, 0)) == DIABETES
+    assert service.route('what about for kids?', 'Human: What is insulin?\nAI: A hormone.',
+                         vector=unit(1, 0)) is None
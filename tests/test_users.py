@@ -0,0 +1,50 @@
+from datetime import datetime
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app import create_app, db
+from app.config import Config
+from app.models import User
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'site.db'}")
+    # Flask-Session's sqlalchemy backend can only be set up once per process
+    monkeypatch.setattr(Config, 'SESSION_TYPE', 'filesystem')
+    monkeypatch.setattr(Config, 'SESSION_FILE_DIR', str(tmp_path / 'sessions'), raising=False)
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        for i in range(1, 8):
+            db.session.add(User(email=f'user{i}@example.com', password='x', full_name=f'User {i}',
+                                created_on=datetime(2024, 1, i), is_active=0 if i == 4 else 1))
+        db.session.commit()
+        token = create_access_token(identity='1')
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    return client
+
+
+def test_users_are_paged_by_id_after_the_cursor(client):
+    pages, after = [], 0
+    while after is not None:
+        body = client.get(f'/users?limit=2&after={after}').get_json()
+        pages.append([user['id'] for user in body['users']])
+        after = body['next_after']
+    # User 4 is inactive
+    assert pages == [[1, 2], [3, 5], [6, 7]]
+
+
+def test_users_project_fields_and_filter(client):
+    body = client.get('/users?fields=email&created_since=2024-01-06').get_json()
+    assert body == {'users': [{'email': 'user6@example.com'}, {'email': 'user7@example.com'}], 'next_after': None}
+    body = client.get('/users?fields=id,full_name&email=user2@example.com').get_json()
+    assert body['users'] == [{'id': 2, 'full_name': 'User 2'}]
+
+
+def test_users_rejects_unknown_fields_and_bad_cursors(client):
+    assert client.get('/users?fields=password').status_code == 400
+    assert client.get('/users?after=abc').status_code == 400
+    assert client.get('/user/2?fields=email').get_json() == {'user': {'email': 'user2@example.com'}}
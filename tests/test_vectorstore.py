@@ -0,0 +1,15 @@
+import faiss
+import numpy as np
+
+from app.vectorstore import build_search_index, read_index_mmap, set_search_params
+
+
+def test_ivf_indexes_are_written_with_their_direct_map(tmp_path):
+    vectors = np.random.default_rng(0).random((400, 16), dtype='float32')
+    path = str(tmp_path / 'search.faiss')
+    faiss.write_index(build_search_index(vectors, 'ivf'), path)
+
+    index = read_index_mmap(path)
+    assert not faiss.extract_index_ivf(index).direct_map.no()
+    set_search_params(index, nprobe=4)
+    np.testing.assert_array_equal(index.reconstruct(7), vectors[7])